@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the agent using the fake LLM backend.
+
+Usage:
+    python benchmarks/agent_throughput.py --requests 200 --concurrency 50 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.agent import Agent, FakeLLMClient
+from src.tools import create_tool_manager
+from src.memory import ConversationMemory
+
+async def run(requests: int, concurrency: int, latency: float) -> None:
+    """Send concurrent messages through the agent and report throughput."""
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = ConversationMemory(os.path.join(tmp, "bench.db"))
+        llm = FakeLLMClient(responses=["1. Answer directly.", "Here is the answer."], latency=latency)
+        agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=memory, llm=llm)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i: int) -> float:
+            async with semaphore:
+                start = time.perf_counter()
+                await agent.process_message(f"Hello number {i}", f"session-{i % concurrency}")
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = sorted(await asyncio.gather(*(one(i) for i in range(requests))))
+        elapsed = time.perf_counter() - start
+
+        print(f"requests:     {requests}")
+        print(f"concurrency:  {concurrency}")
+        print(f"llm latency:  {latency * 1000:.0f} ms")
+        print(f"llm calls:    {llm.call_count}")
+        print(f"elapsed:      {elapsed:.2f} s")
+        print(f"throughput:   {requests / elapsed:.1f} req/s")
+        print(f"p50 latency:  {latencies[len(latencies) // 2] * 1000:.1f} ms")
+        print(f"p95 latency:  {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+
+        await memory.close()
+
+def main():
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated LLM latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.latency))
+
+if __name__ == "__main__":
+    main()
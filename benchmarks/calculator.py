@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Calculator evaluation cost: parse-and-compile every time vs the template cache,
+and one expression per value vs a single generator expression over a range.
+
+Usage:
+    python benchmarks/calculator.py --iterations 20000 --values 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.tools import array_math
+from src.tools.expression import compile_expression, evaluate, prepare
+
+# Expression shapes the calculate tool advertises, with slots for numbers
+CASES = {
+    "arithmetic": "{a} + {b} * {c} - {a} / {d}",
+    "power": "({a} + {b}) ** 2 % {c}",
+    "trig": "sin(pi / {d}) + cos({a} / {c}) * tan({b} / 100)",
+    "nested calls": "sqrt(abs(min({a}, max(-{b}, {c})) * log(exp({d}))))",
+    "rounding": "round(log10({a} * {b}) + {c} / 7, 3)",
+}
+
+# Per-value expression vs the equivalent reduction over a range
+SEQUENCES = {
+    "sum squares": ("{x} ** 2", "sum(x ** 2 for x in 1..{n})"),
+    "trig mean": ("sin({x}) / 2", "mean(sin(x) / 2 for x in 1..{n})"),
+    "filtered": ("sqrt({x}) * 3", "sum(sqrt(x) * 3 for x in 1..{n} if x % 3 == 0)"),
+}
+
+def expressions(shape: str, count: int, distinct: bool) -> List[str]:
+    """Render the shape with fixed or varying numbers."""
+    rng = random.Random(42)
+    if not distinct:
+        return [shape.format(a=3, b=4, c=5, d=6)] * count
+    return [shape.format(a=rng.randint(1, 99), b=rng.randint(1, 99), c=rng.randint(1, 99),
+                         d=rng.randint(1, 9)) for _ in range(count)]
+
+def uncached(expression: str) -> float:
+    """Parse and compile on every call (equivalent to the old AST walk)."""
+    return compile_expression.__wrapped__(expression).evaluate()
+
+def measure(func: Callable[[str], float], items: List[str]) -> float:
+    """Return microseconds per evaluation."""
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+def main():
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20000, help="Evaluations per case")
+    parser.add_argument("--values", type=int, default=100000, help="Range length for the sequence cases")
+    args = parser.parse_args()
+
+    print(f"{'case':<14} {'uncached':>10} {'repeated':>10} {'templated':>10}  (us/eval)")
+    for label, shape in CASES.items():
+        repeated = expressions(shape, args.iterations, distinct=False)
+        templated = expressions(shape, args.iterations, distinct=True)
+        compile_expression.cache_clear()
+        prepare.cache_clear()
+        print(f"{label:<14} {measure(uncached, templated):>10.1f} "
+              f"{measure(evaluate, repeated):>10.1f} {measure(evaluate, templated):>10.1f}")
+
+    backend = "numpy" if array_math.np is not None else "python loop"
+    print(f"\n{'sequence':<14} {'per value':>10} {'generator':>10}  (ms total, {args.values:,} values, {backend})")
+    for label, (element, reduced) in SEQUENCES.items():
+        per_value = [element.format(x=x) for x in range(1, args.values + 1)]
+        start = time.perf_counter()
+        for item in per_value:
+            evaluate(item)
+        separate = time.perf_counter() - start
+        start = time.perf_counter()
+        evaluate(reduced.format(n=args.values))
+        together = time.perf_counter() - start
+        print(f"{label:<14} {separate * 1e3:>10.1f} {together * 1e3:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+HTML text extraction: full BeautifulSoup tree vs the streaming extractor.
+
+Each fixture in benchmarks/fixtures is padded to roughly --size bytes by
+repeating its body, then fed in 64 KB chunks the way WebScrapeTool
+receives it from the network.
+
+Usage:
+    python benchmarks/html_extract.py --size 2000000 --max-length 2000
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.tools.html_extract import HTMLTextExtractor, _lxml_available
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CHUNK_SIZE = 64 * 1024
+
+def inflate(html: str, size: int) -> str:
+    """Repeat the document body until the page is about ``size`` characters."""
+    start = html.index("<body")
+    end = html.rindex("</body>")
+    body = html[html.index(">", start) + 1:end]
+    repeats = max(1, (size - len(html)) // max(len(body), 1))
+    return html[:end] + body * repeats + html[end:]
+
+def chunks(html: str) -> List[str]:
+    """Split a page into network-sized chunks."""
+    return [html[i:i + CHUNK_SIZE] for i in range(0, len(html), CHUNK_SIZE)]
+
+def soup_extract(parts: List[str], max_length: int) -> str:
+    """The previous approach: build the whole tree, then truncate."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup("".join(parts), "html.parser")
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = " ".join(soup.get_text().split())
+    return text[:max_length]
+
+def streaming_extract(backend: str) -> Callable[[List[str], int], str]:
+    """Feed chunks into the incremental extractor until it has enough text."""
+    def extract(parts: List[str], max_length: int) -> str:
+        extractor = HTMLTextExtractor(max_length, backend)
+        for part in parts:
+            extractor.feed(part)
+            if extractor.done:
+                break
+        extractor.close()
+        return extractor.text()[:max_length]
+    return extract
+
+def measure(extract: Callable[[List[str], int], str], parts: List[str], max_length: int,
+            rounds: int) -> tuple:
+    """Return (milliseconds per page, peak traced memory in KB)."""
+    extract(parts, max_length)  # warm up imports and regex caches
+    start = time.perf_counter()
+    for _ in range(rounds):
+        extract(parts, max_length)
+    elapsed = (time.perf_counter() - start) / rounds
+
+    tracemalloc.start()
+    extract(parts, max_length)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024
+
+def main():
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=2_000_000, help="Approximate page size in bytes")
+    parser.add_argument("--max-length", type=int, default=2000, help="Characters of text to extract")
+    parser.add_argument("--rounds", type=int, default=3, help="Repetitions per measurement")
+    args = parser.parse_args()
+
+    extractors = [("beautifulsoup", soup_extract), ("stream html.parser", streaming_extract("html.parser"))]
+    if _lxml_available():
+        extractors.append(("stream lxml", streaming_extract("lxml")))
+
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            parts = chunks(inflate(f.read(), args.size))
+        print(f"{os.path.basename(path)} ({sum(len(p) for p in parts) / 1024:.0f} KB)")
+        for label, extract in extractors:
+            ms, peak_kb = measure(extract, parts, args.max_length, args.rounds)
+            print(f"  {label:<20} {ms:>9.1f} ms/page {peak_kb:>10.0f} KB peak")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Sustained write throughput of ConversationMemory, direct vs write-behind.
+
+Usage:
+    python benchmarks/memory_writes.py --messages 5000 --sessions 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.memory import ConversationMemory
+
+async def measure(db_path: str, messages: int, sessions: int, **options) -> float:
+    """Write messages from concurrent sessions and return messages per second."""
+    memory = ConversationMemory(db_path, **options)
+
+    async def writer(session: int) -> None:
+        for i in range(messages // sessions):
+            await memory.add_message(f"session-{session}", "user", f"Message {i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(s) for s in range(sessions)))
+    await memory.flush()
+    elapsed = time.perf_counter() - start
+
+    await memory.close()
+    return messages / elapsed
+
+async def run(messages: int, sessions: int) -> None:
+    """Run each configuration against a fresh database."""
+    configs = [
+        ("direct", {}),
+        ("write-behind, batch 16", {"write_behind": True, "batch_size": 16}),
+        ("write-behind, batch 64", {"write_behind": True, "batch_size": 64}),
+        ("write-behind, batch 256", {"write_behind": True, "batch_size": 256}),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (label, options) in enumerate(configs):
+            rate = await measure(os.path.join(tmp, f"bench{i}.db"), messages, sessions, **options)
+            print(f"{label:<26} {rate:>10.0f} msg/s")
+
+def main():
+    """Parse arguments and run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--sessions", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.messages, args.sessions))
+
+if __name__ == "__main__":
+    main()
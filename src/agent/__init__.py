@@ -1,6 +1,17 @@
 """
 Agent package initialization.
 """
+from .context import ContextBuilder
 from .core import Agent, Task
+from .plan_cache import PlanCache
+from .rate_limit import RateLimitedLLMClient, TokenBucket
+from .response_cache import ResponseCache
+from .router import RequestRouter, RouteDecision
+from .sessions import SessionBusyError, SessionLocks
+from .summarizer import ConversationSummarizer
+from .llm import (
+    LLMClient, GeminiClient, FakeLLMClient, LLMResult, ToolCall,
+    LLMError, RetryableLLMError, RateLimitError, LLMUnavailableError, LLMDeadlineExceeded
+)
 
-__all__ = ["Agent", "Task"]
+__all__ = ["Agent", "Task", "ContextBuilder", "ConversationSummarizer", "PlanCache", "RequestRouter", "ResponseCache", "RouteDecision", "SessionLocks", "SessionBusyError", "LLMClient", "GeminiClient", "FakeLLMClient", "LLMResult", "ToolCall", "RateLimitedLLMClient", "TokenBucket", "LLMError", "RetryableLLMError", "RateLimitError", "LLMUnavailableError", "LLMDeadlineExceeded"]
@@ -0,0 +1,219 @@
+"""
+Prompt assembly with cached static segments and token-budgeted history.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.tools.base import ToolManager
+
+# Average characters per token for English text and code; close enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Role label, separators and newline around each history line
+MESSAGE_OVERHEAD_TOKENS = 4
+
+PLANNING_INSTRUCTIONS = """Create a step-by-step plan to address this request. Consider:
+1. What information do you need?
+2. Which tools might be helpful?
+3. What's the logical sequence of actions?
+4. How will you present the final result?
+
+Provide a clear, numbered plan."""
+
+EXECUTION_INSTRUCTIONS = """Instructions:
+1. Follow your plan step by step
+2. Call a tool only when it provides information you cannot give yourself
+3. Be thorough but efficient
+4. Provide clear explanations of your actions
+5. Give a comprehensive final answer
+
+Execute your plan now to address the user's request."""
+
+DIRECT_INSTRUCTIONS = """You are a friendly AI agent with tools for calculations, files and web search. \
+Reply briefly and naturally to the user's message."""
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a piece of text."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+class ContextBuilder:
+    """
+    Builds planning and execution prompts for the agent.
+
+    The tool catalog and schemas are rebuilt only when the tool manager's
+    version changes. Token estimates are memoized per message, and history
+    is packed newest-first into a token budget rather than a fixed number
+    of messages, so prompt size stays bounded however long messages get.
+    """
+
+    def __init__(self, tool_manager: ToolManager, history_tokens: int = 2000,
+                 planning_history_tokens: int = 300, planning_message_chars: int = 100,
+                 summary_tokens: int = 500, max_cached_messages: int = 4096):
+        """
+        Initialize the builder.
+
+        Args:
+            tool_manager: Registry whose tools are described in prompts
+            history_tokens: Token budget for conversation history in the execution prompt
+            planning_history_tokens: Token budget for history in the planning prompt
+            planning_message_chars: Characters kept of each message in the planning prompt
+            summary_tokens: Token limit for a session summary included in prompts
+            max_cached_messages: Number of per-message token estimates to remember
+        """
+        self.tool_manager = tool_manager
+        self.history_tokens = history_tokens
+        self.planning_history_tokens = planning_history_tokens
+        self.planning_message_chars = planning_message_chars
+        self.summary_tokens = summary_tokens
+        self.max_cached_messages = max_cached_messages
+        self._catalog_version = -1
+        self._catalog = ""
+        self._planning_header = ""
+        self._schemas: List[Dict[str, Any]] = []
+        self._token_counts: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self.catalog_builds = 0
+        self.estimate_hits = 0
+        self.estimate_misses = 0
+
+    def _refresh_catalog(self) -> None:
+        if self._catalog_version != self.tool_manager.version:
+            self._catalog = self.tool_manager.get_tools_description()
+            self._schemas = self.tool_manager.get_tool_schemas()
+            self._planning_header = (
+                "You are an intelligent AI agent with access to various tools. Your task is to analyze "
+                f"the user's request and create a clear plan of action.\n\nAvailable tools: {self._catalog}"
+            )
+            self._catalog_version = self.tool_manager.version
+            self.catalog_builds += 1
+
+    def tool_catalog(self) -> str:
+        """One-line descriptions of all tools, cached until the tool set changes."""
+        self._refresh_catalog()
+        return self._catalog
+
+    def tool_schemas(self) -> List[Dict[str, Any]]:
+        """Function declarations for all tools, cached until the tool set changes."""
+        self._refresh_catalog()
+        return self._schemas
+
+    def message_tokens(self, message: Dict[str, Any]) -> int:
+        """Estimated tokens for one history line, memoized by role and content."""
+        key = (message["role"], message["content"])
+        tokens = self._token_counts.get(key)
+        if tokens is not None:
+            self._token_counts.move_to_end(key)
+            self.estimate_hits += 1
+            return tokens
+
+        self.estimate_misses += 1
+        tokens = estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+        self._token_counts[key] = tokens
+        if len(self._token_counts) > self.max_cached_messages:
+            self._token_counts.popitem(last=False)
+        return tokens
+
+    def pack_history(self, history: List[Dict[str, Any]], budget: int,
+                     max_chars: Optional[int] = None) -> List[str]:
+        """
+        Format the most recent messages that fit in a token budget.
+
+        Args:
+            history: Messages in chronological order
+            budget: Maximum estimated tokens for the returned lines
+            max_chars: Clip each message to this many characters first
+
+        Returns:
+            "role: content" lines in chronological order
+        """
+        lines = []
+        remaining = budget
+        for message in reversed(history):
+            content = message["content"]
+            if max_chars is not None and len(content) > max_chars:
+                content = content[:max_chars] + "..."
+                tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            else:
+                tokens = self.message_tokens(message)
+
+            if tokens > remaining:
+                if not lines and remaining > MESSAGE_OVERHEAD_TOKENS:
+                    # Keep the start of an oversized latest message rather than nothing
+                    keep = (remaining - MESSAGE_OVERHEAD_TOKENS) * CHARS_PER_TOKEN
+                    lines.append(f"{message['role']}: {content[:keep]}...")
+                break
+            lines.append(f"{message['role']}: {content}")
+            remaining -= tokens
+        lines.reverse()
+        return lines
+
+    @staticmethod
+    def prior_history(message: str, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """History without the current message, which memory stores before the prompt is built."""
+        if history and history[-1]["role"] == "user" and history[-1]["content"] == message:
+            return history[:-1]
+        return history
+
+    def _summary_part(self, summary: Optional[str]) -> Optional[str]:
+        if not summary:
+            return None
+        limit = self.summary_tokens * CHARS_PER_TOKEN
+        if len(summary) > limit:
+            summary = summary[:limit] + "..."
+        return f"Summary of the earlier conversation:\n{summary}"
+
+    def planning_prompt(self, message: str, history: List[Dict[str, Any]],
+                        summary: Optional[str] = None) -> str:
+        """Prompt asking the model for a plan; ``summary`` covers turns no longer in ``history``."""
+        self._refresh_catalog()
+        parts = [self._planning_header]
+        summary_part = self._summary_part(summary)
+        if summary_part:
+            parts.append(summary_part)
+        lines = self.pack_history(self.prior_history(message, history), self.planning_history_tokens,
+                                  max_chars=self.planning_message_chars)
+        if lines:
+            parts.append("Recent conversation context:\n" + "\n".join(lines))
+        parts.append(f"User's request: {message}")
+        parts.append(PLANNING_INSTRUCTIONS)
+        return "\n\n".join(parts)
+
+    def execution_prompt(self, message: str, history: List[Dict[str, Any]], plan: str,
+                         summary: Optional[str] = None) -> str:
+        """Prompt asking the model to carry out a plan, with the summary and packed conversation context."""
+        parts = [
+            "You are an intelligent AI agent executing a plan to help the user.",
+            f"Your plan:\n{plan}",
+            f"Available tools:\n{self.tool_catalog()}",
+            f"User's original request: {message}",
+            EXECUTION_INSTRUCTIONS,
+        ]
+        summary_part = self._summary_part(summary)
+        if summary_part:
+            parts.append(summary_part)
+        lines = self.pack_history(self.prior_history(message, history), self.history_tokens)
+        if lines:
+            parts.append("Conversation context:\n" + "\n".join(lines))
+        parts.append(f"User: {message}")
+        return "\n\n".join(parts)
+
+    def direct_prompt(self, message: str, history: List[Dict[str, Any]], summary: Optional[str] = None) -> str:
+        """Prompt for a conversational reply without planning or tools."""
+        parts = [DIRECT_INSTRUCTIONS]
+        summary_part = self._summary_part(summary)
+        if summary_part:
+            parts.append(summary_part)
+        lines = self.pack_history(self.prior_history(message, history), self.planning_history_tokens)
+        if lines:
+            parts.append("Conversation context:\n" + "\n".join(lines))
+        parts.append(f"User: {message}")
+        return "\n\n".join(parts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters for the metrics endpoint."""
+        return {
+            "catalog_builds": self.catalog_builds,
+            "estimate_hits": self.estimate_hits,
+            "estimate_misses": self.estimate_misses,
+            "cached_estimates": len(self._token_counts),
+            "history_tokens": self.history_tokens,
+        }
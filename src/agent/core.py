@@ -1,17 +1,31 @@
 """
 Core AI Agent implementation with reasoning and tool calling capabilities.
 """
+import asyncio
 import json
 import logging
-from typing import List, Dict, Any, Optional
-import google.generativeai as genai
+from contextlib import nullcontext
+from typing import AsyncContextManager, AsyncIterator, Callable, List, Dict, Any, Optional, Tuple
 from pydantic import BaseModel
 
-from src.tools.base import Tool, ToolManager
+from src.agent.context import ContextBuilder
+from src.agent.llm import LLMClient, LLMError, GeminiClient
+from src.agent.plan_cache import PlanCache
+from src.agent.response_cache import ResponseCache
+from src.agent.router import ROUTE_CALCULATOR, ROUTE_DIRECT, ROUTE_FULL, RequestRouter
+from src.agent.sessions import SessionLocks
+from src.agent.summarizer import ConversationSummarizer
+from src.tools.base import Tool, ToolInvocation, ToolManager, ToolResult
 from src.memory.conversation import ConversationMemory
 
 logger = logging.getLogger(__name__)
 
+# Receives progress events (plan, tool_start, tool_end, token, reset) during a turn
+EventCallback = Callable[[Dict[str, Any]], None]
+
+# Opens the context a turn runs in once it holds its session, e.g. an admission slot
+Admission = Callable[[], AsyncContextManager[Any]]
+
 class Task(BaseModel):
     """Represents a task with steps and status."""
     id: str
@@ -26,36 +40,117 @@ class Agent:
     Main AI Agent with planning, reasoning, and tool execution capabilities.
     """
     
-    def __init__(self, api_key: str, tool_manager: ToolManager, memory: ConversationMemory):
-        """Initialize the agent with tools and memory."""
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+    def __init__(self, api_key: Optional[str], tool_manager: ToolManager, memory: ConversationMemory,
+                 llm: Optional[LLMClient] = None, max_tool_iterations: int = 3,
+                 context: Optional[ContextBuilder] = None,
+                 summarizer: Optional[ConversationSummarizer] = None,
+                 router: Optional[RequestRouter] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 plan_cache: Optional[PlanCache] = None,
+                 session_locks: Optional[SessionLocks] = None):
+        """
+        Initialize the agent with tools and memory.
+        
+        Args:
+            api_key: Gemini API key, used when no LLM client is supplied
+            tool_manager: Registry of available tools
+            memory: Conversation memory backend
+            llm: Async LLM client; defaults to a Gemini client
+            max_tool_iterations: Maximum tool-calling rounds per turn
+            context: Prompt builder; defaults to one with the default token budgets
+            summarizer: Folds older turns of long sessions into a rolling summary
+                that replaces them in prompts; None keeps full history
+            router: Sends arithmetic to the calculator and small talk to a
+                single completion; None plans every message
+            response_cache: Answers repeated self-contained questions from
+                earlier turns of any session without calling the model
+            plan_cache: Reuses plans for identical planning prompts
+            session_locks: Serializes turns of the same session; None lets
+                concurrent turns of a session interleave
+        """
+        self.llm = llm or GeminiClient(api_key=api_key)
         self.tool_manager = tool_manager
         self.memory = memory
+        self.max_tool_iterations = max_tool_iterations
+        self.context = context or ContextBuilder(tool_manager)
+        self.summarizer = summarizer
+        self.router = router
+        self.response_cache = response_cache
+        self.plan_cache = plan_cache
+        self.session_locks = session_locks
+        self._background_tasks: set = set()
         
-    async def process_message(self, message: str, session_id: str) -> Dict[str, Any]:
+    async def process_message(self, message: str, session_id: str,
+                              on_event: Optional[EventCallback] = None,
+                              admission: Optional[Admission] = None) -> Dict[str, Any]:
         """
         Process a user message and execute any necessary actions.
         
         Args:
             message: The user's message
             session_id: Unique session identifier
+            on_event: Optional callback receiving progress events as they happen
+            admission: Entered after the session's lock is acquired and held
+                for the rest of the turn, so turns waiting on their session
+                take no shared capacity
             
         Returns:
             Dict containing the response and execution details
+        
+        Raises:
+            SessionBusyError: If the session already has too many turns waiting
         """
+        if self.session_locks is None:
+            async with admission() if admission else nullcontext():
+                return await self._process_message(message, session_id, on_event)
+        async with self.session_locks.hold(session_id):
+            async with admission() if admission else nullcontext():
+                return await self._process_message(message, session_id, on_event)
+    
+    async def _process_message(self, message: str, session_id: str,
+                               on_event: Optional[EventCallback]) -> Dict[str, Any]:
+        """Run one turn; the caller holds the session's lock if there is one."""
         try:
             # Store user message in memory
             await self.memory.add_message(session_id, "user", message)
             
-            # Get conversation history
-            history = await self.memory.get_conversation_history(session_id)
+            decision = self.router.route(message) if self.router else None
+            route = decision.route if decision else ROUTE_FULL
+            response = None
+            if route == ROUTE_CALCULATOR:
+                # Pure arithmetic needs no model call at all
+                response = await self._answer_with_calculator(decision.expression, on_event)
+                if response is None:
+                    self.router.record_fallback(decision)
+                    route = ROUTE_FULL
+            
+            if response is None and self.response_cache:
+                response = self.response_cache.lookup(message)
+                if response is not None:
+                    # Replayed into this session as if it had been generated
+                    route = response.get("route", route)
+                    self._emit(on_event, "token", content=response["content"])
             
-            # Plan and execute
-            response = await self._plan_and_execute(message, history)
+            if response is None:
+                history, summary = await self._load_context(session_id)
+                if route == ROUTE_DIRECT:
+                    response = await self._answer_directly(message, history, summary, on_event)
+                else:
+                    # Plan and execute
+                    response = await self._plan_and_execute(message, history, on_event, summary=summary)
+                if self.response_cache and self._shareable(message, response, history, summary):
+                    self.response_cache.store(message, {**response, "route": route})
+            response["route"] = route
             
             # Store agent response in memory
-            await self.memory.add_message(session_id, "assistant", response["content"])
+            metadata = {"route": route} if self.router else {}
+            if response.get("cache_hit"):
+                metadata["cache_hit"] = True
+            await self.memory.add_message(session_id, "assistant", response["content"], metadata=metadata or None)
+            
+            if self.summarizer:
+                # Runs in the background, off the request path
+                self.summarizer.schedule(session_id)
             
             return response
             
@@ -70,177 +165,226 @@ class Agent:
             await self.memory.add_message(session_id, "assistant", error_response["content"])
             return error_response
     
-    async def _plan_and_execute(self, message: str, history: List[Dict]) -> Dict[str, Any]:
+    async def process_message_stream(self, message: str, session_id: str,
+                                     admission: Optional[Admission] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a user message, yielding progress events as they are produced.
+        
+        Yields plan, tool_start, tool_end and token events, then a final
+        ``done`` event carrying the same fields as ``process_message``.
+        A ``reset`` event means the streamed answer text is being replaced
+        by a revised answer. The turn keeps running, and is persisted to
+        memory, even if the consumer stops iterating early; ``admission``
+        is held by the turn itself, so it stays held until the turn ends.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self.process_message(message, session_id, on_event=queue.put_nowait,
+                                                        admission=admission))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield event
+        
+        yield {"type": "done", **task.result()}
+    
+    def _shareable(self, message: str, response: Dict[str, Any], history: List[Dict],
+                   summary: Optional[str]) -> bool:
+        """Whether an answer may be reused for other sessions: no earlier turns, complete, read-only tools."""
+        if summary or self.context.prior_history(message, history):
+            # Session context may have shaped the answer
+            return False
+        if response.get("incomplete") or not response["content"]:
+            return False
+        for tool in response["tools_used"]:
+            registered = self.tool_manager.tools.get(tool["name"])
+            if registered is None or not registered.read_only or str(tool["result"]).startswith("Error"):
+                return False
+        return True
+    
+    async def _load_context(self, session_id: str) -> Tuple[List[Dict], Optional[str]]:
+        """Get the history for prompts and the session summary that replaces older turns."""
+        history = await self.memory.get_conversation_history(session_id)
+        summary = None
+        if self.summarizer:
+            state = await self.memory.get_session_summary(session_id)
+            if state and state["summary"]:
+                # Messages folded into the summary are replaced by it
+                summary = state["summary"]
+                history = history[-state["pending"]:] if state["pending"] else []
+        return history, summary
+    
+    async def _answer_with_calculator(self, expression: str,
+                                      on_event: Optional[EventCallback] = None) -> Optional[Dict[str, Any]]:
+        """Answer pure arithmetic from the calculate tool; None if it cannot, e.g. on an error."""
+        if "calculate" not in self.tool_manager.tools:
+            return None
+        parameters = {"expression": expression}
+        self._emit(on_event, "tool_start", name="calculate", args=parameters)
+        [tool_result] = await self.tool_manager.execute_batch([ToolInvocation(name="calculate", parameters=parameters)])
+        output = tool_result.result if tool_result.error is None else f"Error: {tool_result.error}"
+        self._emit(on_event, "tool_end", name="calculate", result=output, duration_ms=tool_result.duration_ms)
+        if tool_result.error is not None or str(output).startswith("Error"):
+            # Let the model explain failures
+            return None
+        
+        self._emit(on_event, "token", content=output)
+        return {
+            "content": output,
+            "thought_process": ["Answered directly with the calculator"],
+            "tools_used": [{
+                "name": "calculate",
+                "args": parameters,
+                "result": output,
+                "duration_ms": round(tool_result.duration_ms, 2)
+            }],
+            "execution_steps": [f"Used calculate tool ({tool_result.duration_ms:.1f} ms)"]
+        }
+    
+    async def _answer_directly(self, message: str, history: List[Dict], summary: Optional[str],
+                               on_event: Optional[EventCallback] = None) -> Dict[str, Any]:
+        """Reply to a conversational message with a single completion, skipping planning and tools."""
+        prompt = self.context.direct_prompt(message, history, summary)
+        content = await self.llm.generate(prompt, on_token=self._token_callback(on_event))
+        return {
+            "content": content,
+            "thought_process": ["Conversational message; answered directly"],
+            "tools_used": [],
+            "execution_steps": []
+        }
+    
+    def _emit(self, on_event: Optional[EventCallback], event_type: str, **data) -> None:
+        """Send a progress event if anyone is listening."""
+        if on_event is not None:
+            on_event({"type": event_type, **data})
+    
+    def _token_callback(self, on_event: Optional[EventCallback]):
+        """Build an LLM token callback that forwards chunks as token events."""
+        if on_event is None:
+            return None
+        return lambda text: self._emit(on_event, "token", content=text)
+    
+    async def _plan_and_execute(self, message: str, history: List[Dict],
+                                on_event: Optional[EventCallback] = None,
+                                summary: Optional[str] = None) -> Dict[str, Any]:
         """
         Plan the approach and execute the necessary steps.
         """
         # First, analyze the message and create a plan
-        plan_prompt = self._create_planning_prompt(message, history)
+        plan_prompt = self._create_planning_prompt(message, history, summary)
         
         try:
-            planning_response = self.model.generate_content(plan_prompt)
-            plan_content = planning_response.text
-            logger.info(f"Agent plan: {plan_content}")
+            if self.plan_cache:
+                model = getattr(self.llm, "model_name", type(self.llm).__name__)
+                plan_content, cached = await self.plan_cache.get_or_plan(
+                    plan_prompt, lambda: self.llm.generate(plan_prompt), model=model
+                )
+            else:
+                plan_content, cached = await self.llm.generate(plan_prompt), False
+            logger.info(f"Agent plan{' (cached)' if cached else ''}: {plan_content}")
         except Exception as e:
             logger.error(f"Error generating plan: {e}")
             plan_content = "Simple plan: Address the user's request directly."
         
+        self._emit(on_event, "plan", steps=plan_content.split('\n'))
+        
         # Parse the plan and determine if tools are needed
-        execution_response = await self._execute_with_tools(message, history, plan_content)
+        execution_response = await self._execute_with_tools(message, history, plan_content, on_event, summary)
         
         return execution_response
     
-    async def _execute_with_tools(self, message: str, history: List[Dict], plan: str) -> Dict[str, Any]:
-        """
-        Execute the plan using available tools.
+    async def _execute_with_tools(self, message: str, history: List[Dict], plan: str,
+                                  on_event: Optional[EventCallback] = None,
+                                  summary: Optional[str] = None) -> Dict[str, Any]:
         """
-        # Get available tools
-        tools_description = self.tool_manager.get_tools_description()
-        
-        # Create execution prompt with tools
-        execution_prompt = self._create_execution_prompt(message, history, plan, tools_description)
-        
-        # Build conversation context
-        conversation_context = ""
-        for msg in history[-5:]:  # Last 5 messages for context
-            conversation_context += f"{msg['role']}: {msg['content']}\n"
+        Execute the plan with a structured tool-calling loop.
         
-        full_prompt = f"{execution_prompt}\n\nConversation context:\n{conversation_context}\n\nUser: {message}"
+        Each iteration lets the model either answer or request tool calls
+        against the tools' JSON schemas. Requested tools are run and their
+        results fed back. After ``max_tool_iterations`` rounds the model is
+        asked for an answer with no tools offered, so a turn makes at most
+        ``max_tool_iterations + 1`` execution calls.
+        """
+        # Tool schemas and descriptions are cached until the tool set changes
+        tool_schemas = self.context.tool_schemas()
+        full_prompt = self._create_execution_prompt(message, history, plan, summary)
+        messages: List[Dict[str, Any]] = [{"role": "user", "content": full_prompt}]
         
         tools_used = []
         execution_steps = []
+        final_content = ""
+        incomplete = False
         
         try:
-            # Generate initial response
-            response = self.model.generate_content(full_prompt)
-            initial_response = response.text
-            
-            # Check if the response suggests using tools
-            response_lower = initial_response.lower()
-            final_content = initial_response
-            
-            # Simple tool detection based on keywords
-            if any(keyword in response_lower for keyword in ['calculate', 'math', 'compute']):
-                # Try to extract calculation from response
-                import re
-                math_patterns = re.findall(r'[\d+\-*/().\s]+', initial_response)
-                for pattern in math_patterns:
-                    if any(op in pattern for op in ['+', '-', '*', '/', '(']):
-                        try:
-                            result = await self.tool_manager.execute_tool('calculate', {'expression': pattern.strip()})
-                            tools_used.append({
-                                "name": "calculate",
-                                "args": {"expression": pattern.strip()},
-                                "result": result
-                            })
-                            execution_steps.append("Used calculator tool")
-                            final_content += f"\n\nCalculation result: {result}"
-                        except:
-                            pass
-            
-            if any(keyword in response_lower for keyword in ['search', 'find', 'look up']):
-                # Extract search query
-                search_query = message
-                if len(search_query) > 100:
-                    search_query = search_query[:100]
-                try:
-                    result = await self.tool_manager.execute_tool('web_search', {'query': search_query})
+            for iteration in range(self.max_tool_iterations + 1):
+                offered_tools = tool_schemas if iteration < self.max_tool_iterations else []
+                result = await self.llm.generate_with_tools(
+                    messages, offered_tools, on_token=self._token_callback(on_event)
+                )
+                
+                if not result.tool_calls or not offered_tools:
+                    final_content = result.text
+                    if not final_content:
+                        final_content = "I could not complete this request within the allowed number of tool calls."
+                        incomplete = True
+                    break
+                
+                if result.text:
+                    # Text preceding tool calls is not the final answer
+                    self._emit(on_event, "reset")
+                messages.append({"role": "assistant", "content": result.text, "tool_calls": result.tool_calls})
+                
+                invocations = [ToolInvocation(name=call.name, parameters=call.arguments) for call in result.tool_calls]
+                for invocation in invocations:
+                    self._emit(on_event, "tool_start", name=invocation.name, args=invocation.parameters)
+                
+                def finished(index: int, tool_result: ToolResult) -> None:
+                    output = tool_result.result if tool_result.error is None else f"Error: {tool_result.error}"
+                    self._emit(on_event, "tool_end", name=tool_result.name, result=output,
+                               duration_ms=tool_result.duration_ms)
+                
+                batch = await self.tool_manager.execute_batch(invocations, on_result=finished)
+                
+                results = []
+                for tool_result in batch:
+                    output = tool_result.result if tool_result.error is None else f"Error: {tool_result.error}"
                     tools_used.append({
-                        "name": "web_search",
-                        "args": {"query": search_query},
-                        "result": result
+                        "name": tool_result.name,
+                        "args": tool_result.parameters,
+                        "result": output,
+                        "duration_ms": round(tool_result.duration_ms, 2)
                     })
-                    execution_steps.append("Used web search tool")
-                    final_content += f"\n\nSearch results: {result}"
-                except:
-                    pass
-            
-            if any(keyword in response_lower for keyword in ['read', 'file', 'open']):
-                # Look for file paths in the message
-                import re
-                file_patterns = re.findall(r'[^\s]+\.[a-zA-Z]{1,5}', message)
-                for file_path in file_patterns:
-                    try:
-                        result = await self.tool_manager.execute_tool('read_file', {'file_path': file_path})
-                        tools_used.append({
-                            "name": "read_file",
-                            "args": {"file_path": file_path},
-                            "result": result
-                        })
-                        execution_steps.append("Used file read tool")
-                        final_content += f"\n\nFile content: {result}"
-                    except:
-                        pass
-            
-            # If tools were used, generate a final response incorporating the results
-            if tools_used:
-                tool_results = "\n".join([f"Tool {tool['name']}: {tool['result']}" for tool in tools_used])
-                final_prompt = f"Based on the original question: {message}\nAnd these tool results:\n{tool_results}\n\nProvide a comprehensive final answer:"
+                    execution_steps.append(f"Used {tool_result.name} tool ({tool_result.duration_ms:.1f} ms)")
+                    results.append({"name": tool_result.name, "result": str(output)})
                 
-                try:
-                    final_response = self.model.generate_content(final_prompt)
-                    final_content = final_response.text
-                except:
-                    pass  # Keep the original response if final generation fails
+                messages.append({"role": "tool", "results": results})
             
+        except LLMError as e:
+            logger.warning(f"Model unavailable during execution: {e}")
+            final_content = "The language model is over capacity right now. Please try again in a moment."
+            incomplete = True
         except Exception as e:
             logger.error(f"Error in execution: {e}")
             final_content = f"I encountered an error while processing your request: {str(e)}"
+            incomplete = True
         
         return {
             "content": final_content,
             "thought_process": plan.split('\n'),
             "tools_used": tools_used,
-            "execution_steps": execution_steps
+            "execution_steps": execution_steps,
+            "incomplete": incomplete
         }
     
-    def _create_planning_prompt(self, message: str, history: List[Dict]) -> str:
+    def _create_planning_prompt(self, message: str, history: List[Dict], summary: Optional[str] = None) -> str:
         """Create the planning prompt for the agent."""
-        recent_context = ""
-        if history:
-            recent_messages = history[-3:]  # Last 3 messages for context
-            recent_context = "\\nRecent conversation context:\\n"
-            for msg in recent_messages:
-                recent_context += f"{msg['role']}: {msg['content'][:100]}...\\n"
-        
-        return f"""You are an intelligent AI agent with access to various tools. Your task is to analyze the user's request and create a clear plan of action.
-
-Available tools: {self.tool_manager.get_tools_description()}
-
-{recent_context}
-
-User's request: {message}
-
-Create a step-by-step plan to address this request. Consider:
-1. What information do you need?
-2. Which tools might be helpful?
-3. What's the logical sequence of actions?
-4. How will you present the final result?
-
-Provide a clear, numbered plan."""
+        return self.context.planning_prompt(message, history, summary)
     
-    def _create_execution_prompt(self, message: str, history: List[Dict], plan: str, tools_desc: str) -> str:
-        """Create the execution prompt with tools context."""
-        context_info = ""
-        if history:
-            context_info = "\\nYou have access to the conversation history for context."
-        
-        return f"""You are an intelligent AI agent executing a plan to help the user.
-
-Your plan:
-{plan}
-
-Available tools:
-{tools_desc}
-
-User's original request: {message}
-{context_info}
-
-Instructions:
-1. Follow your plan step by step
-2. Use tools when they can provide value
-3. Be thorough but efficient
-4. Provide clear explanations of your actions
-5. Give a comprehensive final answer
-
-Execute your plan now to address the user's request."""
+    def _create_execution_prompt(self, message: str, history: List[Dict], plan: str,
+                                 summary: Optional[str] = None) -> str:
+        """Create the execution prompt with tools, summary and token-budgeted conversation context."""
+        return self.context.execution_prompt(message, history, plan, summary)
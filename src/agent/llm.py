@@ -0,0 +1,370 @@
+"""
+Asynchronous LLM client layer used by the agent.
+"""
+import asyncio
+import json
+import logging
+import random
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Receives each chunk of generated text as it arrives
+TokenCallback = Callable[[str], None]
+
+class LLMError(Exception):
+    """Base class for model call failures the agent can report meaningfully."""
+
+class RetryableLLMError(LLMError):
+    """A failure that may succeed if the call is repeated after a delay."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RateLimitError(RetryableLLMError):
+    """The backend rejected the call for exceeding its quota (HTTP 429)."""
+
+class LLMUnavailableError(RetryableLLMError):
+    """The backend failed or was unavailable (HTTP 5xx)."""
+
+class LLMDeadlineExceeded(LLMError):
+    """The call was shed because it could not finish within its deadline."""
+
+class ToolCall(BaseModel):
+    """A tool invocation requested by the model."""
+    name: str
+    arguments: Dict[str, Any] = {}
+
+class LLMResult(BaseModel):
+    """A model turn: answer text and/or requested tool calls."""
+    text: str = ""
+    tool_calls: List[ToolCall] = []
+
+def render_messages(messages: List[Dict[str, Any]]) -> str:
+    """
+    Flatten a tool-calling transcript into plain text.
+
+    Transcript entries are ``{"role": "user", "content": ...}``,
+    ``{"role": "assistant", "content": ..., "tool_calls": [ToolCall, ...]}``
+    and ``{"role": "tool", "results": [{"name": ..., "result": ...}, ...]}``.
+    """
+    lines = []
+    for message in messages:
+        if message["role"] == "tool":
+            for result in message["results"]:
+                lines.append(f"Tool {result['name']}: {result['result']}")
+        else:
+            if message.get("content"):
+                lines.append(f"{message['role']}: {message['content']}")
+            for call in message.get("tool_calls", []):
+                lines.append(f"Call {call.name}({json.dumps(call.arguments)})")
+    return "\n".join(lines)
+
+class LLMClient(ABC):
+    """Base class for non-blocking LLM backends."""
+
+    def __init__(self, timeout: Optional[float] = None):
+        """Initialize the client with a default per-call timeout in seconds."""
+        self.timeout = timeout
+
+    async def generate(self, prompt: str, timeout: Optional[float] = None,
+                       on_token: Optional[TokenCallback] = None) -> str:
+        """
+        Generate a completion for the prompt.
+
+        Args:
+            prompt: The full prompt text
+            timeout: Per-call timeout overriding the client default
+            on_token: If given, the completion is streamed and each text
+                chunk is passed to this callback as it arrives
+
+        Returns:
+            The generated text
+
+        Raises:
+            asyncio.TimeoutError: If the call does not finish within the timeout
+            LLMError: If the backend reports a quota or service failure
+        """
+        call = self._generate(prompt) if on_token is None else self._stream(prompt, on_token)
+        return await self._run(call, timeout)
+
+    async def generate_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                                  timeout: Optional[float] = None,
+                                  on_token: Optional[TokenCallback] = None) -> LLMResult:
+        """
+        Run one model turn of a tool-calling conversation.
+
+        Args:
+            messages: Transcript so far (see ``render_messages`` for the format)
+            tools: Function declarations with ``name``, ``description`` and a
+                JSON schema under ``parameters``; empty to force a text answer
+            timeout: Per-call timeout overriding the client default
+            on_token: If given, answer text is streamed to this callback
+
+        Returns:
+            The model's text and any tool calls it requested
+        """
+        call = self._generate_with_tools(messages, tools, on_token)
+        return await self._run(call, timeout)
+
+    async def _run(self, call: Awaitable[Any], timeout: Optional[float]) -> Any:
+        """Await a backend call under the timeout, translating backend errors."""
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            if timeout is None:
+                return await call
+            return await asyncio.wait_for(call, timeout)
+        except LLMError:
+            raise
+        except Exception as e:
+            error = self._translate_error(e)
+            if error is e:
+                raise
+            raise error from e
+
+    def _translate_error(self, error: Exception) -> Exception:
+        """Map a backend exception to an ``LLMError`` where one applies."""
+        return error
+
+    @abstractmethod
+    async def _generate(self, prompt: str) -> str:
+        """Backend-specific completion call."""
+        pass
+
+    async def _stream(self, prompt: str, on_token: TokenCallback) -> str:
+        """Backend-specific streaming call; defaults to a single chunk."""
+        text = await self._generate(prompt)
+        on_token(text)
+        return text
+
+    @abstractmethod
+    async def _generate_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                                   on_token: Optional[TokenCallback]) -> LLMResult:
+        """Backend-specific tool-calling turn."""
+        pass
+
+    async def close(self) -> None:
+        """Release any resources held by the client."""
+        pass
+
+# JSON schema keys understood by Gemini function declarations
+_GEMINI_SCHEMA_KEYS = {"type", "description", "properties", "required", "items", "enum", "format", "nullable"}
+
+def _gemini_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip JSON schema keys (e.g. ``default``) that Gemini rejects."""
+    cleaned = {key: value for key, value in schema.items() if key in _GEMINI_SCHEMA_KEYS}
+    if "properties" in cleaned:
+        cleaned["properties"] = {name: _gemini_schema(prop) for name, prop in cleaned["properties"].items()}
+    if "items" in cleaned:
+        cleaned["items"] = _gemini_schema(cleaned["items"])
+    return cleaned
+
+class GeminiClient(LLMClient):
+    """Google Gemini backend using the SDK's async API or a bounded executor."""
+
+    def __init__(self, api_key: str, model_name: str = "gemini-1.5-flash",
+                 timeout: Optional[float] = 60.0, use_executor: bool = False,
+                 max_workers: int = 8):
+        """
+        Initialize the Gemini client.
+
+        Args:
+            api_key: Gemini API key
+            model_name: Model to use for completions
+            timeout: Default per-call timeout in seconds
+            use_executor: Run the synchronous SDK call in a bounded thread pool
+                instead of using the async API
+            max_workers: Maximum number of concurrent executor calls
+        """
+        super().__init__(timeout)
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini") if use_executor else None
+
+    async def _generate(self, prompt: str) -> str:
+        if self._executor is None:
+            response = await self.model.generate_content_async(prompt)
+        else:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self._executor, self.model.generate_content, prompt)
+        return response.text
+
+    async def _stream(self, prompt: str, on_token: TokenCallback) -> str:
+        if self._executor is not None:
+            return await super()._stream(prompt, on_token)
+
+        chunks = []
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            text = chunk.text
+            if text:
+                chunks.append(text)
+                on_token(text)
+        return "".join(chunks)
+
+    async def _generate_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                                   on_token: Optional[TokenCallback]) -> LLMResult:
+        contents = [self._to_content(message) for message in messages]
+        function_library = [{"function_declarations": [
+            {
+                "name": tool["name"],
+                "description": tool["description"],
+                "parameters": _gemini_schema(tool["parameters"])
+            }
+            for tool in tools
+        ]}] if tools else None
+
+        result = LLMResult()
+        if self._executor is not None:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                self._executor, lambda: self.model.generate_content(contents, tools=function_library)
+            )
+            self._collect(response, result, on_token)
+        elif on_token is not None:
+            response = await self.model.generate_content_async(contents, tools=function_library, stream=True)
+            async for chunk in response:
+                self._collect(chunk, result, on_token)
+        else:
+            response = await self.model.generate_content_async(contents, tools=function_library)
+            self._collect(response, result, None)
+        return result
+
+    @staticmethod
+    def _collect(response: Any, result: LLMResult, on_token: Optional[TokenCallback]) -> None:
+        """Accumulate text and function calls from a response or stream chunk."""
+        for part in response.parts:
+            if part.function_call:
+                call = type(part.function_call).to_dict(part.function_call)
+                result.tool_calls.append(ToolCall(name=call["name"], arguments=call.get("args") or {}))
+            elif part.text:
+                result.text += part.text
+                if on_token is not None:
+                    on_token(part.text)
+
+    @staticmethod
+    def _to_content(message: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a transcript entry to a Gemini content dict."""
+        if message["role"] == "tool":
+            return {"role": "user", "parts": [
+                {"function_response": {"name": result["name"], "response": {"result": result["result"]}}}
+                for result in message["results"]
+            ]}
+        if message["role"] == "assistant":
+            parts: List[Any] = [message["content"]] if message.get("content") else []
+            parts.extend(
+                {"function_call": {"name": call.name, "args": call.arguments}}
+                for call in message.get("tool_calls", [])
+            )
+            return {"role": "model", "parts": parts}
+        return {"role": "user", "parts": [message["content"]]}
+
+    def _translate_error(self, error: Exception) -> Exception:
+        if isinstance(error, google_exceptions.TooManyRequests):
+            return RateLimitError(str(error))
+        if isinstance(error, google_exceptions.ServerError):
+            return LLMUnavailableError(str(error))
+        return error
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+class FakeLLMClient(LLMClient):
+    """Local backend returning canned responses, for tests and offline benchmarks."""
+
+    def __init__(self, responses: Optional[Union[List[Union[str, LLMResult]],
+                                                Callable[[str], Union[str, LLMResult]]]] = None,
+                 latency: float = 0.0, timeout: Optional[float] = None,
+                 rate_limit_failures: int = 0, rate_limit_probability: float = 0.0,
+                 retry_after: Optional[float] = None, seed: int = 0):
+        """
+        Initialize the fake client.
+
+        Args:
+            responses: Responses returned in order (cycled), or a callable
+                mapping the prompt to a response. An ``LLMResult`` response
+                lets tests script tool calls deterministically; tool-calling
+                turns see the transcript flattened by ``render_messages``.
+            latency: Simulated round-trip time in seconds
+            timeout: Default per-call timeout in seconds
+            rate_limit_failures: Number of initial calls rejected with ``RateLimitError``
+            rate_limit_probability: Chance that any later call is rejected
+            retry_after: Retry hint carried by injected rate-limit errors
+            seed: Seed for the injected failures
+        """
+        super().__init__(timeout)
+        self.responses = responses
+        self.latency = latency
+        self.rate_limit_failures = rate_limit_failures
+        self.rate_limit_probability = rate_limit_probability
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self.prompts: List[str] = []
+        self.rejected = 0
+        self._attempts = 0
+
+    @property
+    def call_count(self) -> int:
+        """Number of completions served so far, not counting injected failures."""
+        return len(self.prompts)
+
+    async def _admit(self) -> None:
+        """Reject the call with a simulated 429 if one is due."""
+        self._attempts += 1
+        if self._attempts <= self.rate_limit_failures or (
+            self.rate_limit_probability and self._random.random() < self.rate_limit_probability
+        ):
+            self.rejected += 1
+            if self.latency:
+                await asyncio.sleep(self.latency / 10)
+            raise RateLimitError("429 Resource has been exhausted (injected)", retry_after=self.retry_after)
+
+    async def _generate(self, prompt: str) -> str:
+        await self._admit()
+        self.prompts.append(prompt)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(prompt).text
+
+    async def _stream(self, prompt: str, on_token: TokenCallback) -> str:
+        await self._admit()
+        self.prompts.append(prompt)
+        text = self._respond(prompt).text
+        await self._emit_words(text, on_token)
+        return text
+
+    async def _generate_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                                   on_token: Optional[TokenCallback]) -> LLMResult:
+        await self._admit()
+        prompt = render_messages(messages)
+        self.prompts.append(prompt)
+        result = self._respond(prompt)
+        if on_token is not None and result.text:
+            await self._emit_words(result.text, on_token)
+        elif self.latency:
+            await asyncio.sleep(self.latency)
+        return result
+
+    async def _emit_words(self, text: str, on_token: TokenCallback) -> None:
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if self.latency:
+                await asyncio.sleep(self.latency / len(words))
+            on_token(word if i == len(words) - 1 else word + " ")
+
+    def _respond(self, prompt: str) -> LLMResult:
+        if callable(self.responses):
+            response = self.responses(prompt)
+        elif self.responses:
+            response = self.responses[(len(self.prompts) - 1) % len(self.responses)]
+        else:
+            response = "This is a response from the fake model."
+        return response if isinstance(response, LLMResult) else LLMResult(text=response)
@@ -0,0 +1,70 @@
+"""
+Content-addressed cache of planner output.
+"""
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from src.tools.cache import CacheEntry, ToolResultCache
+
+class PlanCache:
+    """
+    Caches plans by a SHA-256 digest of the full planning prompt and model.
+
+    The planning prompt already contains everything a plan depends on (the
+    message, packed history, session summary and tool catalog), so equal
+    digests mean an identical planner call. Storage reuses
+    ``ToolResultCache``: an in-memory LRU, an optional SQLite tier, and
+    single-flight coalescing of concurrent identical requests.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 512, db_path: Optional[str] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl: Seconds a plan may be reused
+            max_entries: Size of the in-memory tier
+            db_path: SQLite file for the persistent tier (None for memory only)
+        """
+        self.ttl = ttl
+        self._cache = ToolResultCache(ttls={}, default_ttl=ttl, max_entries=max_entries, db_path=db_path)
+
+    @staticmethod
+    def key(prompt: str, model: str = "") -> str:
+        """Content address of a planner call."""
+        digest = hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+        return f"plan:{digest}"
+
+    async def get_or_plan(self, prompt: str, generate: Callable[[], Awaitable[str]],
+                          model: str = "") -> Tuple[str, bool]:
+        """
+        Return a cached plan, or generate and cache one.
+
+        Args:
+            prompt: The planning prompt
+            generate: Produces a new plan; exceptions propagate and nothing is cached
+            model: Identifies the planner model, so switching models does not reuse plans
+
+        Returns:
+            The plan and whether it came from the cache
+        """
+        generated = False
+
+        async def fetch(stale: Optional[CacheEntry]) -> CacheEntry:
+            nonlocal generated
+            generated = True
+            plan = await generate()
+            # Empty plans are returned but not stored
+            return CacheEntry(plan, time.time() + self.ttl if plan.strip() else 0)
+
+        plan = await self._cache.get_or_fetch(self.key(prompt, model), fetch)
+        return plan, not generated
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the metrics endpoint."""
+        return self._cache.stats()
+
+    def close(self) -> None:
+        """Close the persistent tier."""
+        self._cache.close()
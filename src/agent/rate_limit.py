@@ -0,0 +1,211 @@
+"""
+Rate-limited scheduling and retries for LLM calls.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from src.agent.context import estimate_tokens
+from src.agent.llm import (
+    LLMClient, LLMDeadlineExceeded, LLMResult, RetryableLLMError, TokenCallback, render_messages
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class TokenBucket:
+    """
+    Per-minute budget that refills continuously.
+
+    Reservations may take the balance below zero; the debt is the queue of
+    callers ahead, so each caller's wait follows from the balance alone and
+    callers are served in reservation order.
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        """
+        Initialize a full bucket.
+
+        Args:
+            per_minute: Sustained rate in units per minute
+            burst: Bucket capacity; defaults to one minute's worth
+        """
+        self.rate = per_minute / 60
+        self.capacity = per_minute if burst is None else burst
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` units would be available."""
+        self._refill(now)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float, now: float) -> None:
+        """Reserve ``amount`` units, going into debt if necessary."""
+        self._refill(now)
+        self.tokens -= amount
+
+class _TrackedCallback:
+    """Wraps a token callback to remember whether any text was delivered."""
+
+    __slots__ = ("on_token", "emitted")
+
+    def __init__(self, on_token: Optional[TokenCallback]):
+        self.on_token = on_token
+        self.emitted = False
+
+    @property
+    def callback(self) -> Optional[TokenCallback]:
+        if self.on_token is None:
+            return None
+        return self._deliver
+
+    def _deliver(self, text: str) -> None:
+        self.emitted = True
+        self.on_token(text)
+
+class RateLimitedLLMClient(LLMClient):
+    """
+    Schedules calls of another client within requests- and tokens-per-minute budgets.
+
+    Each call reserves one request and its estimated tokens (prompt plus
+    ``completion_tokens``) and sleeps until both budgets allow it. A call is
+    shed with ``LLMDeadlineExceeded`` before it is sent if that wait would
+    outlast its timeout, which here is the deadline for the whole call,
+    queueing and retries included. Rate-limit and service errors are retried
+    up to ``max_retries`` times with full-jitter exponential backoff, honouring
+    the backend's retry hint, unless streamed text was already delivered.
+    """
+
+    def __init__(self, client: LLMClient, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, completion_tokens: int = 256,
+                 max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 timeout: Optional[float] = None, rng: Optional[random.Random] = None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            client: Client that performs the calls
+            requests_per_minute: Request budget (None for unlimited)
+            tokens_per_minute: Token budget (None for unlimited)
+            completion_tokens: Tokens reserved for each completion's output
+            max_retries: Retries after the first attempt
+            base_delay: Backoff ceiling before the first retry, doubled for each further one
+            max_delay: Upper bound of the backoff ceiling
+            timeout: Default deadline per call in seconds; defaults to the wrapped client's timeout
+            rng: Random source for backoff jitter
+        """
+        super().__init__(client.timeout if timeout is None else timeout)
+        self.client = client
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.completion_tokens = completion_tokens
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = rng or random.Random()
+        self.calls = 0
+        self.retries = 0
+        self.shed = 0
+        self.failures = 0
+        self._throttled_seconds = 0.0
+
+    @property
+    def model_name(self) -> str:
+        """Name of the wrapped model, so caches keyed on it see through the scheduler."""
+        return getattr(self.client, "model_name", type(self.client).__name__)
+
+    async def generate(self, prompt: str, timeout: Optional[float] = None,
+                       on_token: Optional[TokenCallback] = None) -> str:
+        """Generate a completion within the rate budgets; see ``LLMClient.generate``."""
+        tracked = _TrackedCallback(on_token)
+        return await self._schedule(
+            estimate_tokens(prompt), timeout, tracked,
+            lambda remaining: self.client.generate(prompt, timeout=remaining, on_token=tracked.callback)
+        )
+
+    async def generate_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                                  timeout: Optional[float] = None,
+                                  on_token: Optional[TokenCallback] = None) -> LLMResult:
+        """Run one tool-calling turn within the rate budgets; see ``LLMClient.generate_with_tools``."""
+        tracked = _TrackedCallback(on_token)
+        tokens = estimate_tokens(render_messages(messages)) + estimate_tokens(json.dumps(tools))
+        return await self._schedule(
+            tokens, timeout, tracked,
+            lambda remaining: self.client.generate_with_tools(messages, tools, timeout=remaining,
+                                                              on_token=tracked.callback)
+        )
+
+    async def _schedule(self, prompt_tokens: int, timeout: Optional[float], tracked: _TrackedCallback,
+                        attempt: Callable[[Optional[float]], Awaitable[T]]) -> T:
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        cost = prompt_tokens + self.completion_tokens
+
+        for retry in range(self.max_retries + 1):
+            await self._reserve(cost, deadline)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            self.calls += 1
+            try:
+                return await attempt(remaining)
+            except RetryableLLMError as e:
+                if retry == self.max_retries or tracked.emitted:
+                    self.failures += 1
+                    raise
+                delay = self._backoff(retry, e.retry_after)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    self.shed += 1
+                    raise LLMDeadlineExceeded(f"No time left to retry before the deadline: {e}") from e
+                self.retries += 1
+                logger.warning(f"LLM call failed ({e}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def _backoff(self, retry: int, retry_after: Optional[float]) -> float:
+        """Full-jitter exponential delay, never shorter than the backend's hint."""
+        delay = self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+        return max(delay, retry_after or 0.0)
+
+    async def _reserve(self, tokens: int, deadline: Optional[float]) -> None:
+        """Wait for one request and ``tokens`` tokens, or shed the call if that would miss the deadline."""
+        now = time.monotonic()
+        wait = max(self.requests.delay(1, now) if self.requests else 0.0,
+                   self.tokens.delay(tokens, now) if self.tokens else 0.0)
+        if deadline is not None and now + wait >= deadline:
+            self.shed += 1
+            raise LLMDeadlineExceeded(f"Rate limit wait of {wait:.1f}s exceeds the call deadline")
+
+        if self.requests:
+            self.requests.take(1, now)
+        if self.tokens:
+            self.tokens.take(tokens, now)
+        if wait > 0:
+            self._throttled_seconds += wait
+            await asyncio.sleep(wait)
+
+    async def _generate(self, prompt: str) -> str:
+        return await self.client._generate(prompt)
+
+    async def _generate_with_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                                   on_token: Optional[TokenCallback]) -> LLMResult:
+        return await self.client._generate_with_tools(messages, tools, on_token)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Call, retry and shedding counters for the metrics endpoint."""
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "shed": self.shed,
+            "failures": self.failures,
+            "throttled_seconds": round(self._throttled_seconds, 3),
+        }
@@ -0,0 +1,217 @@
+"""
+Cross-session cache of agent answers, matched on normalized text and MinHash similarity.
+"""
+import copy
+import hashlib
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+# Mersenne prime for the universal hash family behind the MinHash permutations
+_PRIME = (1 << 61) - 1
+
+# Words that do not change what is being asked
+_FILLER = frozenset({"please", "pls", "hey", "hi", "hello", "thanks", "thank", "you", "could", "can",
+                     "would", "tell", "me", "the", "a", "an", "kindly", "just", "is", "are", "do", "does"})
+
+_CONTRACTION = re.compile(r"\b(what|who|where|when|how|why|which|there)'s\b")
+
+# References to earlier turns; a message using them is not self-contained
+_CONTEXTUAL = frozenset({"it", "that", "this", "these", "those", "they", "them", "he", "she", "him", "her",
+                         "his", "its", "their", "above", "previous", "earlier", "again", "same", "else",
+                         "before", "last", "more", "continue", "example", "elaborate", "conversation", "chat",
+                         "discussed", "said", "asked", "mentioned", "remember", "remind"})
+# The user speaking about themselves; the answer depends on what they told this session
+_FIRST_PERSON = frozenset({"i", "i'm", "i've", "i'd", "i'll", "my", "mine", "myself",
+                           "we", "we're", "we've", "us", "our", "ours", "ourselves"})
+_FOLLOW_UP = re.compile(r"^(?:and|also|then|so|but|what\s+about|how\s+about)\b")
+# Questions shorter than this, filler aside, lean on the turns before them ("why?", "yes", "go on")
+_MIN_WORDS = 2
+
+_WORD = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+def normalize(message: str) -> str:
+    """Lowercase and reduce a message to its words, dropping punctuation."""
+    text = _CONTRACTION.sub(r"\1 is", message.lower().replace("\u2019", "'"))
+    return " ".join(_WORD.findall(text))
+
+class _Entry:
+    """A cached answer and its place in the similarity index."""
+
+    __slots__ = ("key", "signature", "numbers", "response", "expires_at", "hits")
+
+    def __init__(self, key: str, signature: Tuple[int, ...], numbers: FrozenSet[str],
+                 response: Dict[str, Any], expires_at: float):
+        self.key = key
+        self.signature = signature
+        self.numbers = numbers
+        self.response = response
+        self.expires_at = expires_at
+        self.hits = 0
+
+class ResponseCache:
+    """
+    In-memory answer cache shared by all sessions.
+
+    A message is looked up by its normalized text first, then by MinHash
+    signature: locality-sensitive hashing over signature bands finds
+    candidates, and the best one is used if its estimated Jaccard
+    similarity over word unigrams and bigrams reaches ``threshold`` and it
+    mentions exactly the same numbers. Follow-ups, confirmations and
+    messages about the user or earlier turns are never cached, since their
+    answer depends on the session. Entries expire after ``ttl`` seconds and are evicted least
+    recently used beyond ``max_entries``.
+    """
+
+    def __init__(self, threshold: float = 0.85, ttl: float = 3600, max_entries: int = 1024,
+                 num_perm: int = 64, bands: int = 16):
+        """
+        Initialize the cache.
+
+        Args:
+            threshold: Minimum estimated Jaccard similarity for a near-duplicate hit
+            ttl: Seconds an answer stays valid
+            max_entries: Maximum cached answers
+            num_perm: MinHash signature length
+            bands: LSH bands the signature is split into; must divide ``num_perm``
+        """
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bands = bands
+        self._rows = num_perm // bands
+        rng = random.Random(0x5EED)
+        self._permutations = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.stores = 0
+
+    @staticmethod
+    def cacheable(message: str) -> bool:
+        """Whether a message is self-contained enough to share its answer across sessions."""
+        text = normalize(message)
+        if not text or _FOLLOW_UP.match(text):
+            return False
+        words = text.split()
+        if _CONTEXTUAL.intersection(words) or _FIRST_PERSON.intersection(words):
+            return False
+        return len([word for word in words if word not in _FILLER]) >= _MIN_WORDS
+
+    def _features(self, text: str) -> Set[str]:
+        words = [word for word in text.split() if word not in _FILLER] or text.split()
+        return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        """MinHash signature of a normalized message."""
+        hashes = [int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                  for feature in self._features(text)]
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self._permutations)
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        rows = self._rows
+        return [(band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    @staticmethod
+    def similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity of two signatures."""
+        return sum(a == b for a, b in zip(left, right)) / len(left)
+
+    def lookup(self, message: str) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a message.
+
+        Returns:
+            A copy of the cached response with ``cache_hit`` set, or None
+        """
+        if not self.cacheable(message):
+            self.skipped += 1
+            return None
+        text = normalize(message)
+        now = time.monotonic()
+
+        entry = self._entries.get(text)
+        if entry is not None:
+            if entry.expires_at > now:
+                self.exact_hits += 1
+                return self._hit(entry)
+            self._remove(text)
+
+        signature = self.signature(text)
+        numbers = frozenset(_NUMBER.findall(text))
+        best, best_score = None, self.threshold
+        candidates = set()
+        for band_key in self._band_keys(signature):
+            candidates.update(self._buckets.get(band_key, ()))
+        for key in candidates:
+            candidate = self._entries[key]
+            if candidate.expires_at <= now or candidate.numbers != numbers:
+                continue
+            score = self.similarity(signature, candidate.signature)
+            if score >= best_score:
+                best, best_score = candidate, score
+
+        if best is None:
+            self.misses += 1
+            return None
+        self.near_hits += 1
+        return self._hit(best)
+
+    def _hit(self, entry: _Entry) -> Dict[str, Any]:
+        entry.hits += 1
+        self._entries.move_to_end(entry.key)
+        response = copy.deepcopy(entry.response)
+        response["cache_hit"] = True
+        return response
+
+    def store(self, message: str, response: Dict[str, Any]) -> bool:
+        """Cache an answer; returns False for messages that are not self-contained."""
+        if not self.cacheable(message):
+            return False
+        text = normalize(message)
+        self._remove(text)
+        entry = _Entry(text, self.signature(text), frozenset(_NUMBER.findall(text)),
+                       copy.deepcopy(response), time.monotonic() + self.ttl)
+        self._entries[text] = entry
+        for band_key in self._band_keys(entry.signature):
+            self._buckets.setdefault(band_key, set()).add(text)
+        self.stores += 1
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return True
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band_key in self._band_keys(entry.signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def clear(self) -> None:
+        """Drop all cached answers."""
+        self._entries.clear()
+        self._buckets.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the metrics endpoint."""
+        return {
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "stores": self.stores,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,137 @@
+"""
+Local request classification to skip the planner for simple messages.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional
+
+from src.tools.expression import CONSTANTS, FUNCTIONS, compile_expression
+
+# Routes, cheapest first
+ROUTE_CALCULATOR = "calculator"  # answered by the calculate tool, no LLM call
+ROUTE_DIRECT = "direct"          # one completion, no planning or tools
+ROUTE_FULL = "full"              # plan, then the tool-calling loop
+ROUTES = (ROUTE_CALCULATOR, ROUTE_DIRECT, ROUTE_FULL)
+
+class RouteDecision(NamedTuple):
+    """Where a message goes; ``expression`` is set for the calculator route."""
+    route: str
+    expression: Optional[str] = None
+
+# Leading phrases that only introduce a calculation
+_ARITHMETIC_PREFIX = re.compile(
+    r"^(?:please\s+)?(?:what\s+is|what's|whats|calculate|compute|evaluate|solve|how\s+much\s+is)\s+",
+    re.IGNORECASE
+)
+
+# Spelled-out operators, applied in order
+_OPERATOR_WORDS = [
+    (re.compile(r"\bdivided\s+by\b", re.IGNORECASE), "/"),
+    (re.compile(r"\bmultiplied\s+by\b", re.IGNORECASE), "*"),
+    (re.compile(r"\b(?:times|x)\b", re.IGNORECASE), "*"),
+    (re.compile(r"\bplus\b", re.IGNORECASE), "+"),
+    (re.compile(r"\bminus\b", re.IGNORECASE), "-"),
+    (re.compile(r"\bmod(?:ulo)?\b", re.IGNORECASE), "%"),
+    (re.compile(r"\bto\s+the\s+power\s+of\b", re.IGNORECASE), "**"),
+    (re.compile(r"\^"), "**"),
+]
+
+# Numbers, operators, brackets and the calculator's own function and constant names
+_ARITHMETIC_TOKEN = re.compile(
+    r"\s*(?:\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+|\*\*|[-+*/%(),]|"
+    + "|".join(sorted(map(re.escape, {**FUNCTIONS, **CONSTANTS}), key=len, reverse=True))
+    + r")"
+)
+
+# Messages that need no tools or plan: greetings, thanks, acknowledgements, farewells.
+# Confirmations and refusals ("yes", "ok", "no") are left out: they usually answer
+# an offer such as "Shall I search the web?", which needs the tools
+_CONVERSATIONAL = re.compile(
+    r"^(?:(?:hi|hello|hey|hiya|howdy|yo|greetings|good\s+(?:morning|afternoon|evening|night))(?:\s+there)?"
+    r"|thanks?(?:\s+you)?(?:\s+(?:so|very)\s+much)?|thx|ty|cheers|much\s+appreciated"
+    r"|cool|great|nice|awesome|perfect|got\s+it"
+    r"|bye|goodbye|see\s+you(?:\s+later)?|good\s*bye"
+    r"|how\s+are\s+you(?:\s+doing)?(?:\s+today)?|who\s+are\s+you|what\s+can\s+you\s+do)"
+    r"(?:\s+(?:agent|bot|assistant|again|a\s+lot|man|friend))?$",
+    re.IGNORECASE
+)
+
+def _normalize(message: str) -> str:
+    """Collapse whitespace and drop trailing punctuation and emoji for pattern matching."""
+    return re.sub(r"[\W_]+$", "", " ".join(message.split()))
+
+def _arithmetic_expression(message: str) -> Optional[str]:
+    """Return the calculator expression if the message is nothing but arithmetic."""
+    text = _ARITHMETIC_PREFIX.sub("", " ".join(message.split()))
+    text = text.rstrip(" ?=.!")
+    for pattern, replacement in _OPERATOR_WORDS:
+        text = pattern.sub(replacement, text)
+    text = text.strip()
+    if not text or not any(char.isdigit() for char in text):
+        return None
+
+    position = 0
+    operations = 0
+    while position < len(text):
+        match = _ARITHMETIC_TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            return None
+        token = match.group().strip()
+        if not token[0].isdigit() and token not in "()," and not token.startswith("."):
+            operations += 1
+        position = match.end()
+    # A bare number is a statement or an answer, not a calculation request
+    if operations == 0:
+        return None
+
+    try:
+        compile_expression(text)
+    except (SyntaxError, ValueError):
+        return None
+    return text
+
+class RequestRouter:
+    """
+    Rule-based message classifier.
+
+    Pure arithmetic goes to the calculator, short conversational messages
+    to a single completion, and everything else to the full plan-and-tools
+    path. Decisions are memoized by message text and counted per route.
+    """
+
+    def __init__(self, direct_max_words: int = 8, cache_size: int = 4096):
+        """
+        Initialize the router.
+
+        Args:
+            direct_max_words: Longest message considered for the direct route
+            cache_size: Number of classified messages to remember
+        """
+        self.direct_max_words = direct_max_words
+        self.counts: Dict[str, int] = {route: 0 for route in ROUTES}
+        self._classify = lru_cache(maxsize=cache_size)(self._classify_uncached)
+
+    def route(self, message: str) -> RouteDecision:
+        """Classify a message and count the decision."""
+        decision = self._classify(message.strip())
+        self.counts[decision.route] += 1
+        return decision
+
+    def record_fallback(self, decision: RouteDecision) -> None:
+        """Move a decision's count to the full route after its fast path gave up."""
+        self.counts[decision.route] -= 1
+        self.counts[ROUTE_FULL] += 1
+
+    def _classify_uncached(self, message: str) -> RouteDecision:
+        expression = _arithmetic_expression(message)
+        if expression is not None:
+            return RouteDecision(ROUTE_CALCULATOR, expression)
+
+        text = _normalize(message)
+        if len(text.split()) <= self.direct_max_words and _CONVERSATIONAL.match(text):
+            return RouteDecision(ROUTE_DIRECT)
+        return RouteDecision(ROUTE_FULL)
+
+    def stats(self) -> Dict[str, int]:
+        """Decisions per route, for the metrics endpoint."""
+        return dict(self.counts)
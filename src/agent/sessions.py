@@ -0,0 +1,119 @@
+"""
+Per-session serialization of agent turns.
+"""
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+class SessionBusyError(Exception):
+    """Raised when a session already has the maximum number of turns waiting."""
+
+    def __init__(self, session_id: str, pending: int, retry_after: int):
+        super().__init__(f"Session {session_id} has {pending} turns waiting; retry in {retry_after}s")
+        self.session_id = session_id
+        self.pending = pending
+        self.retry_after = retry_after
+
+class _Slot:
+    """A session's lock and the number of turns holding or waiting for it."""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+class SessionLocks:
+    """
+    One FIFO lock per active session.
+
+    Turns of the same session run one at a time, in arrival order, so their
+    history reads and writes never interleave; different sessions never wait
+    on each other. At most ``max_pending`` turns may queue behind the running
+    one, after which ``SessionBusyError`` is raised immediately. A session's
+    lock exists only while it has turns running or waiting.
+    """
+
+    def __init__(self, max_pending: int = 4):
+        """
+        Initialize the lock table.
+
+        Args:
+            max_pending: Turns allowed to wait per session (0 rejects any overlap)
+        """
+        self.max_pending = max_pending
+        self._slots: Dict[str, _Slot] = {}
+        self.turns = 0
+        self.contended = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self._wait_seconds = 0.0
+        self._max_wait = 0.0
+        self._hold_seconds = 0.0
+
+    def pending(self, session_id: str) -> int:
+        """Turns of a session waiting behind the running one."""
+        slot = self._slots.get(session_id)
+        return max(slot.users - 1, 0) if slot else 0
+
+    def is_full(self, session_id: str) -> bool:
+        """Whether another turn for the session would be rejected."""
+        slot = self._slots.get(session_id)
+        return slot is not None and slot.users > self.max_pending
+
+    def retry_after(self, session_id: str) -> int:
+        """Seconds until a rejected turn is likely to be accepted, from the mean turn duration."""
+        mean = self._hold_seconds / self.turns if self.turns else 1.0
+        return max(1, math.ceil(mean * (self.pending(session_id) + 1)))
+
+    @asynccontextmanager
+    async def hold(self, session_id: str) -> AsyncIterator[None]:
+        """
+        Run the body as the session's only turn.
+
+        Raises:
+            SessionBusyError: If ``max_pending`` turns are already waiting
+        """
+        if self.is_full(session_id):
+            self.rejected += 1
+            raise SessionBusyError(session_id, self.pending(session_id), self.retry_after(session_id))
+
+        slot = self._slots.get(session_id)
+        if slot is None:
+            slot = self._slots[session_id] = _Slot()
+        slot.users += 1
+        self.max_depth = max(self.max_depth, slot.users - 1)
+        try:
+            start = time.monotonic()
+            if slot.lock.locked():
+                self.contended += 1
+            async with slot.lock:
+                acquired = time.monotonic()
+                waited = acquired - start
+                self._wait_seconds += waited
+                self._max_wait = max(self._max_wait, waited)
+                try:
+                    yield
+                finally:
+                    self.turns += 1
+                    self._hold_seconds += time.monotonic() - acquired
+        finally:
+            slot.users -= 1
+            if slot.users == 0:
+                del self._slots[session_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and wait time, for the metrics endpoint."""
+        waiting = sum(slot.users - 1 for slot in self._slots.values())
+        return {
+            "active_sessions": len(self._slots),
+            "waiting": waiting,
+            "max_depth": self.max_depth,
+            "turns": self.turns,
+            "contended": self.contended,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self._wait_seconds / self.turns * 1000, 2) if self.turns else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 2),
+        }
@@ -0,0 +1,143 @@
+"""
+Background rolling summaries of long conversations.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from src.agent.llm import LLMClient
+from src.memory.conversation import ConversationMemory
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and an AI assistant.
+
+Current summary:
+{summary}
+
+New messages to fold in:
+{messages}
+
+Write an updated summary in at most {max_words} words. Keep facts, names, numbers, decisions, \
+open questions and user preferences that later turns may rely on; drop pleasantries. \
+Reply with the summary only."""
+
+class ConversationSummarizer:
+    """
+    Folds older turns of long sessions into ``session_metadata.summary``.
+
+    Once a session has more than ``trigger_messages`` messages after its
+    summary watermark, all but the newest ``keep_recent`` are summarized
+    together with the previous summary, and the watermark advances. Work
+    runs in background tasks, at most ``max_concurrency`` at a time and one
+    per session, so it never adds latency to a turn.
+    """
+
+    def __init__(self, llm: LLMClient, memory: ConversationMemory, trigger_messages: int = 20,
+                 keep_recent: int = 6, max_batch: int = 40, max_message_chars: int = 2000,
+                 max_words: int = 250, max_concurrency: int = 2):
+        """
+        Initialize the summarizer.
+
+        Args:
+            llm: Client used for summary completions
+            memory: Conversation memory holding messages and summaries
+            trigger_messages: Unsummarized messages that trigger a summary
+            keep_recent: Newest messages always left out of the summary
+            max_batch: Most messages folded by one completion
+            max_message_chars: Characters of each message included in the summary prompt
+            max_words: Target length of the summary
+            max_concurrency: Summaries generated at the same time across sessions
+        """
+        if keep_recent >= trigger_messages:
+            raise ValueError("keep_recent must be smaller than trigger_messages")
+        self.llm = llm
+        self.memory = memory
+        self.trigger_messages = trigger_messages
+        self.keep_recent = keep_recent
+        self.max_batch = max_batch
+        self.max_message_chars = max_message_chars
+        self.max_words = max_words
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.summaries = 0
+        self.failures = 0
+
+    def needs_summary(self, state: Optional[Dict[str, Any]]) -> bool:
+        """Whether a session state from ``get_session_summary`` is over the trigger."""
+        return state is not None and state["pending"] > self.trigger_messages
+
+    def schedule(self, session_id: str) -> Optional[asyncio.Task]:
+        """Start a background check-and-summarize for the session unless one is running."""
+        if session_id in self._running:
+            return None
+        self._running.add(session_id)
+        task = asyncio.create_task(self._run(session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, session_id: str) -> None:
+        try:
+            # A session far behind (e.g. after enabling summaries) catches up a batch at a time
+            while await self.summarize(session_id):
+                pass
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Summarizing session {session_id} failed: {e}")
+        finally:
+            self._running.discard(session_id)
+
+    async def summarize(self, session_id: str) -> bool:
+        """
+        Fold one batch of older messages into the session summary if it is over the trigger.
+
+        Returns:
+            True if the summary advanced and the session may still be over the trigger
+        """
+        state = await self.memory.get_session_summary(session_id)
+        if not self.needs_summary(state):
+            return False
+
+        fold = min(state["pending"] - self.keep_recent, self.max_batch)
+        messages = await self.memory.get_messages_after(session_id, state["through_id"], limit=fold)
+        if not messages:
+            return False
+
+        async with self._semaphore:
+            summary = await self.llm.generate(self._prompt(state["summary"], messages))
+        summary = summary.strip()
+        if not summary:
+            return False
+
+        advanced = await self.memory.advance_session_summary(
+            session_id, summary, state["through_id"], messages[-1]["id"]
+        )
+        if advanced:
+            self.summaries += 1
+            logger.info(f"Summarized {len(messages)} messages of session {session_id}")
+        return advanced and state["pending"] - len(messages) > self.trigger_messages
+
+    def _prompt(self, summary: Optional[str], messages: List[Dict[str, Any]]) -> str:
+        lines = []
+        for message in messages:
+            content = message["content"]
+            if len(content) > self.max_message_chars:
+                content = content[:self.max_message_chars] + "..."
+            lines.append(f"{message['role']}: {content}")
+        return SUMMARY_PROMPT.format(summary=summary or "(none yet)", messages="\n".join(lines),
+                                     max_words=self.max_words)
+
+    async def close(self) -> None:
+        """Wait for summaries in progress so their results are stored."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the metrics endpoint."""
+        return {
+            "summaries": self.summaries,
+            "failures": self.failures,
+            "running": len(self._running),
+        }
@@ -1,6 +1,7 @@
 """
 API package initialization.
 """
+from .admission import AdmissionController, AdmissionRejected
 from .app import create_app
 
-__all__ = ["create_app"]
+__all__ = ["create_app", "AdmissionController", "AdmissionRejected"]
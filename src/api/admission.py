@@ -0,0 +1,188 @@
+"""
+Admission control and load shedding for agent requests.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+# Priority classes, most urgent first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Global limit on in-flight agent requests with a bounded priority queue.
+
+    Up to ``max_concurrent`` requests run at once. Others wait in a queue
+    ordered by priority class, then arrival. A request is rejected at once
+    with 429 when the queue is full and holds nothing of lower priority to
+    shed. It is rejected with 503 when its projected queue time, from the
+    recent mean service time, exceeds ``max_queue_wait``. It is also
+    rejected with 503 when it actually waits that long. Rejections carry a
+    Retry-After estimate.
+    """
+
+    def __init__(self, max_concurrent: int = 16, max_queue: int = 64, max_queue_wait: float = 10.0,
+                 smoothing: float = 0.2):
+        """
+        Initialize the controller.
+
+        Args:
+            max_concurrent: Requests allowed to run at the same time
+            max_queue: Requests allowed to wait for a slot
+            max_queue_wait: Queue-time objective in seconds
+            smoothing: Weight of each new sample in the service time average
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.smoothing = smoothing
+        self.active = 0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._queued = 0
+        self._sequence = itertools.count()
+        self._service_time: Optional[float] = None
+        self.admitted: Dict[str, int] = {name: 0 for name in PRIORITIES}
+        self.rejected_full = 0
+        self.rejected_slow = 0
+        self.timed_out = 0
+        self.shed = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._max_wait = 0.0
+
+    def projected_wait(self, priority: str = "normal") -> float:
+        """Estimated seconds a new request of this priority would queue."""
+        if self.active < self.max_concurrent and not self._queued:
+            return 0.0
+        if self._service_time is None:
+            return 0.0
+        rank = PRIORITIES[priority]
+        ahead = sum(1 for level, _, future in self._queue if not future.done() and level <= rank)
+        return (ahead + 1) * self._service_time / self.max_concurrent
+
+    def _retry_after(self, priority: str) -> int:
+        return max(1, math.ceil(self.projected_wait(priority) or self._service_time or 1.0))
+
+    def check(self, priority: str = "normal") -> None:
+        """
+        Reject a request that could not be admitted in time, without queueing it.
+
+        Raises:
+            AdmissionRejected: 429 if the queue is full, 503 if the queue-time objective would be missed
+        """
+        if self.active < self.max_concurrent and not self._queued:
+            return
+        if self._queued >= self.max_queue and self._lowest(PRIORITIES[priority]) is None:
+            self.rejected_full += 1
+            raise AdmissionRejected(429, "Too many requests queued", self._retry_after(priority))
+        if self.projected_wait(priority) > self.max_queue_wait:
+            self.rejected_slow += 1
+            raise AdmissionRejected(503, "Server is overloaded", self._retry_after(priority))
+
+    def _lowest(self, rank: int) -> Optional[asyncio.Future]:
+        """The most recent queued request of lower priority than ``rank``, if any."""
+        candidates = [(level, sequence, future) for level, sequence, future in self._queue
+                      if not future.done() and level > rank]
+        return max(candidates, key=lambda item: (item[0], item[1]))[2] if candidates else None
+
+    async def acquire(self, priority: str = "normal") -> None:
+        """
+        Wait for a slot; every successful call must be paired with ``release``.
+
+        Raises:
+            AdmissionRejected: If the request is rejected, shed or waits past the objective
+        """
+        rank = PRIORITIES[priority]
+        self.check(priority)
+        if self.active < self.max_concurrent and not self._queued:
+            self.active += 1
+            self.admitted[priority] += 1
+            return
+
+        if self._queued >= self.max_queue:
+            # Make room by shedding the newest request of the lowest priority below this one
+            victim = self._lowest(rank)
+            victim.set_exception(AdmissionRejected(503, "Shed for a higher-priority request",
+                                                   self._retry_after(priority)))
+            self._queued -= 1
+            self.shed += 1
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (rank, next(self._sequence), future))
+        self._queued += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_queue_wait)
+        except BaseException as e:
+            if not future.done():
+                # Timed out or cancelled while still queued
+                future.cancel()
+                self._queued -= 1
+            elif not future.cancelled() and future.exception() is None:
+                # Granted a slot just as the wait ended; hand it on
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise AdmissionRejected(503, "Timed out waiting for capacity", self._retry_after(priority)) from None
+            raise
+
+        waited = time.monotonic() - start
+        self._waits += 1
+        self._wait_seconds += waited
+        self._max_wait = max(self._max_wait, waited)
+        self.admitted[priority] += 1
+
+    def release(self, service_time: Optional[float] = None) -> None:
+        """Free a slot, handing it to the most urgent waiter, and record the request's service time."""
+        if service_time is not None:
+            if self._service_time is None:
+                self._service_time = service_time
+            else:
+                self._service_time += self.smoothing * (service_time - self._service_time)
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                # The slot passes straight to the waiter, so ``active`` is unchanged
+                self._queued -= 1
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def admit(self, priority: str = "normal") -> AsyncIterator[None]:
+        """Run the body in an admitted slot."""
+        await self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        """Occupancy, queueing and rejection counters for the metrics endpoint."""
+        return {
+            "active": self.active,
+            "queued": self._queued,
+            "max_concurrent": self.max_concurrent,
+            "admitted": dict(self.admitted),
+            "rejected_full": self.rejected_full,
+            "rejected_slow": self.rejected_slow,
+            "timed_out": self.timed_out,
+            "shed": self.shed,
+            "avg_queue_wait_ms": round(self._wait_seconds / self._waits * 1000, 2) if self._waits else 0.0,
+            "max_queue_wait_ms": round(self._max_wait * 1000, 2),
+            "service_time_ms": round(self._service_time * 1000, 2) if self._service_time is not None else None,
+        }
@@ -1,20 +1,24 @@
 """
 FastAPI application for the CIDion AI system.
 """
+import hmac
+import json
 import os
 import uuid
-from fastapi import FastAPI, HTTPException, Request
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
 import logging
 from dotenv import load_dotenv
 
-from src.agent import Agent
-from src.tools import create_tool_manager
+from src.agent import Agent, ContextBuilder, ConversationSummarizer, GeminiClient, PlanCache, RateLimitedLLMClient, RequestRouter, ResponseCache, SessionBusyError, SessionLocks
+from src.tools import create_tool_manager, ToolResultCache
 from src.memory import ConversationMemory
+from src.api.admission import AdmissionController, AdmissionRejected
 
 # Load environment variables
 load_dotenv()
@@ -27,6 +31,8 @@ class ChatMessage(BaseModel):
     """Chat message model."""
     message: str
     session_id: Optional[str] = None
+    # Requested class; "high" is only granted to callers with the priority key
+    priority: Literal["high", "normal", "low"] = "normal"
 
 class ChatResponse(BaseModel):
     """Chat response model."""
@@ -35,6 +41,8 @@ class ChatResponse(BaseModel):
     thought_process: List[str]
     tools_used: List[Dict[str, Any]]
     execution_steps: List[str]
+    route: Optional[str] = None  # calculator, direct or full
+    cache_hit: bool = False
 
 class SessionInfo(BaseModel):
     """Session information model."""
@@ -44,12 +52,113 @@ class SessionInfo(BaseModel):
     title: Optional[str] = None
     summary: Optional[str] = None
 
+def _sse(event: Dict[str, Any]) -> str:
+    """Format an event as a server-sent events frame."""
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+def _rejected(error: AdmissionRejected) -> HTTPException:
+    """Turn an admission rejection into an HTTP error with Retry-After."""
+    return HTTPException(status_code=error.status_code, detail=error.reason,
+                         headers={"Retry-After": str(error.retry_after)})
+
+def _priority(requested: str, key: Optional[str], trusted_key: Optional[str]) -> str:
+    """
+    Priority class to admit a request with.
+    
+    Callers may always lower their own priority, but "high" lets a request
+    shed other users' queued work, so it needs the configured priority key;
+    anyone else is admitted as "normal".
+    """
+    if requested != "high":
+        return requested
+    if trusted_key and key and hmac.compare_digest(key.encode(), trusted_key.encode()):
+        return "high"
+    return "normal"
+
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application."""
+    # Initialize components
+    tool_cache_ttl = os.getenv("TOOL_CACHE_TTL")
+    tool_cache = ToolResultCache(
+        # Unset keeps the per-tool defaults
+        default_ttl=float(tool_cache_ttl) if tool_cache_ttl else None,
+        db_path=os.getenv("TOOL_CACHE_PATH") or None
+    )
+    tool_manager = create_tool_manager(result_cache=tool_cache)
+    memory = ConversationMemory(
+        write_behind=os.getenv("MEMORY_WRITE_BEHIND", "false").lower() == "true",
+        batch_size=int(os.getenv("MEMORY_BATCH_SIZE", "64")),
+        flush_interval_ms=int(os.getenv("MEMORY_FLUSH_INTERVAL_MS", "50")),
+        cache_sessions=int(os.getenv("MEMORY_CACHE_SESSIONS", "256"))
+    )
+    
+    # Get configuration from environment
+    api_key = os.getenv("GEMINI_API_KEY")
+    
+    if not api_key:
+        logger.warning("GEMINI_API_KEY not found. Set it in environment variables for full functionality.")
+        api_key = "dummy-key"  # For testing without Gemini
+    
+    llm = RateLimitedLLMClient(
+        GeminiClient(
+            api_key=api_key,
+            timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+            use_executor=os.getenv("LLM_USE_EXECUTOR", "false").lower() == "true"
+        ),
+        requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")) or None,
+        tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "0")) or None,
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "3"))
+    )
+    context = ContextBuilder(
+        tool_manager,
+        history_tokens=int(os.getenv("CONTEXT_HISTORY_TOKENS", "2000")),
+        planning_history_tokens=int(os.getenv("CONTEXT_PLANNING_TOKENS", "300"))
+    )
+    summary_trigger = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "20"))
+    summarizer = ConversationSummarizer(
+        llm, memory,
+        trigger_messages=summary_trigger,
+        keep_recent=int(os.getenv("SUMMARY_KEEP_RECENT", "6"))
+    ) if summary_trigger > 0 else None
+    response_cache = ResponseCache(
+        threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.85")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+        max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+    ) if os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true" else None
+    plan_cache = PlanCache(
+        ttl=float(os.getenv("PLAN_CACHE_TTL", "3600")),
+        max_entries=int(os.getenv("PLAN_CACHE_SIZE", "512")),
+        db_path=os.getenv("PLAN_CACHE_PATH") or None
+    ) if os.getenv("PLAN_CACHE_ENABLED", "false").lower() == "true" else None
+    session_locks = SessionLocks(max_pending=int(os.getenv("SESSION_MAX_PENDING", "4")))
+    admission = AdmissionController(
+        max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "16")),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+        max_queue_wait=float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", "10"))
+    )
+    priority_key = os.getenv("ADMISSION_PRIORITY_KEY") or None
+    router = RequestRouter() if os.getenv("ROUTER_ENABLED", "true").lower() == "true" else None
+    agent = Agent(api_key=api_key, tool_manager=tool_manager, memory=memory, llm=llm, context=context,
+                  summarizer=summarizer, router=router, response_cache=response_cache,
+                  plan_cache=plan_cache, session_locks=session_locks)
+    
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        """Release pooled resources on shutdown."""
+        yield
+        if summarizer:
+            await summarizer.close()
+        await memory.close()
+        if plan_cache:
+            plan_cache.close()
+        await llm.close()
+        await tool_manager.close()
+    
     app = FastAPI(
         title="CIDion",
         description="AI assistant with tool calling capabilities",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan
     )
     
     # Add CORS middleware
@@ -61,19 +170,6 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
-    # Initialize components
-    tool_manager = create_tool_manager()
-    memory = ConversationMemory()
-    
-    # Get configuration from environment
-    api_key = os.getenv("GEMINI_API_KEY")
-    
-    if not api_key:
-        logger.warning("GEMINI_API_KEY not found. Set it in environment variables for full functionality.")
-        api_key = "dummy-key"  # For testing without Gemini
-    
-    agent = Agent(api_key=api_key, tool_manager=tool_manager, memory=memory)
-    
     @app.get("/", response_class=HTMLResponse)
     async def root():
         """Serve the main web interface."""
@@ -325,8 +421,13 @@ def create_app() -> FastAPI:
                     // Scroll to bottom
                     messagesDiv.scrollTop = messagesDiv.scrollHeight;
                     
+                    // Create the agent bubble up front and fill it in as events arrive
+                    const agentDiv = document.createElement('div');
+                    agentDiv.className = 'message agent-message';
+                    messagesDiv.appendChild(agentDiv);
+                    
                     try {
-                        const response = await fetch('/api/chat', {
+                        const response = await fetch('/api/chat/stream', {
                             method: 'POST',
                             headers: {
                                 'Content-Type': 'application/json',
@@ -341,22 +442,54 @@ def create_app() -> FastAPI:
                             throw new Error(`HTTP error! status: ${response.status}`);
                         }
                         
-                        const data = await response.json();
-                        sessionId = data.session_id;
+                        const reader = response.body.getReader();
+                        const decoder = new TextDecoder();
+                        let buffer = '';
+                        let answer = '';
                         
-                        // ONLY show the clean agent response (no debug functionality)
-                        const agentDiv = document.createElement('div');
-                        agentDiv.className = 'message agent-message';
-                        agentDiv.innerHTML = data.response.replace(/\\n/g, '<br>');
-                        messagesDiv.appendChild(agentDiv);
+                        while (true) {
+                            const { done, value } = await reader.read();
+                            if (done) break;
+                            buffer += decoder.decode(value, { stream: true });
+                            
+                            // Server-sent events are separated by a blank line
+                            let boundary;
+                            while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                                const frame = buffer.slice(0, boundary);
+                                buffer = buffer.slice(boundary + 2);
+                                const dataLine = frame.split('\\n').find(line => line.startsWith('data: '));
+                                if (!dataLine) continue;
+                                const event = JSON.parse(dataLine.slice(6));
+                                
+                                if (event.type === 'session') {
+                                    sessionId = event.session_id;
+                                } else if (event.type === 'plan') {
+                                    status.textContent = 'Working on it...';
+                                } else if (event.type === 'tool_start') {
+                                    status.textContent = `Using ${event.name}...`;
+                                } else if (event.type === 'token') {
+                                    answer += event.content;
+                                    agentDiv.innerText = answer;
+                                } else if (event.type === 'reset') {
+                                    answer = '';
+                                    agentDiv.innerText = '';
+                                } else if (event.type === 'done') {
+                                    sessionId = event.session_id;
+                                    // ONLY show the clean agent response (no debug functionality)
+                                    agentDiv.innerHTML = event.response.replace(/\\n/g, '<br>');
+                                } else if (event.type === 'error') {
+                                    // The turn failed; stop reading and report it below
+                                    reader.cancel();
+                                    throw new Error(event.detail);
+                                }
+                                messagesDiv.scrollTop = messagesDiv.scrollHeight;
+                            }
+                        }
                         
                         status.textContent = 'Ready';
                         
                     } catch (error) {
-                        const errorDiv = document.createElement('div');
-                        errorDiv.className = 'message agent-message';
-                        errorDiv.textContent = 'Sorry, I encountered an error: ' + error.message;
-                        messagesDiv.appendChild(errorDiv);
+                        agentDiv.textContent = 'Sorry, I encountered an error: ' + error.message;
                         
                         status.textContent = 'Error occurred';
                     }
@@ -381,27 +514,78 @@ def create_app() -> FastAPI:
         return HTMLResponse(content=html_content)
     
     @app.post("/api/chat", response_model=ChatResponse)
-    async def chat(message: ChatMessage):
+    async def chat(message: ChatMessage, x_priority_key: Optional[str] = Header(default=None)):
         """Handle chat messages from the user."""
+        priority = _priority(message.priority, x_priority_key, priority_key)
         try:
             # Generate session ID if not provided
             session_id = message.session_id or str(uuid.uuid4())
             
-            # Process the message with the agent
-            result = await agent.process_message(message.message, session_id)
+            # Process the message with the agent; it takes an admission slot once the session is free
+            result = await agent.process_message(message.message, session_id,
+                                                 admission=lambda: admission.admit(priority))
             
             return ChatResponse(
                 response=result["content"],
                 session_id=session_id,
                 thought_process=result.get("thought_process", []),
                 tools_used=result.get("tools_used", []),
-                execution_steps=result.get("execution_steps", [])
+                execution_steps=result.get("execution_steps", []),
+                route=result.get("route"),
+                cache_hit=result.get("cache_hit", False)
             )
             
+        except AdmissionRejected as e:
+            raise _rejected(e)
+        except SessionBusyError as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
         except Exception as e:
             logger.error(f"Error in chat endpoint: {e}")
             raise HTTPException(status_code=500, detail=str(e))
     
+    @app.post("/api/chat/stream")
+    async def chat_stream(message: ChatMessage, x_priority_key: Optional[str] = Header(default=None)):
+        """Handle a chat message, streaming progress and answer tokens as server-sent events."""
+        priority = _priority(message.priority, x_priority_key, priority_key)
+        session_id = message.session_id or str(uuid.uuid4())
+        if session_locks.is_full(session_id):
+            raise HTTPException(status_code=429, detail=f"Session {session_id} is busy",
+                                headers={"Retry-After": str(session_locks.retry_after(session_id))})
+        
+        try:
+            # Fail fast; the turn itself waits in the admission queue
+            admission.check(priority)
+        except AdmissionRejected as e:
+            raise _rejected(e)
+        
+        async def event_stream():
+            yield _sse({"type": "session", "session_id": session_id})
+            try:
+                # The slot is held by the turn, which outlives a disconnected client
+                events = agent.process_message_stream(message.message, session_id,
+                                                      admission=lambda: admission.admit(priority))
+                async for event in events:
+                    if event["type"] == "done":
+                        event = {"type": "done", **ChatResponse(
+                            response=event["content"],
+                            session_id=session_id,
+                            thought_process=event.get("thought_process", []),
+                            tools_used=event.get("tools_used", []),
+                            execution_steps=event.get("execution_steps", []),
+                            route=event.get("route"),
+                            cache_hit=event.get("cache_hit", False)
+                        ).model_dump()}
+                    yield _sse(event)
+            except Exception as e:
+                logger.error(f"Error in chat stream: {e}")
+                yield _sse({"type": "error", "detail": str(e)})
+        
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
     @app.get("/api/sessions", response_model=List[SessionInfo])
     async def get_sessions():
         """Get recent conversation sessions."""
@@ -430,4 +614,20 @@ def create_app() -> FastAPI:
             "tool_names": list(tool_manager.tools.keys())
         }
     
+    @app.get("/api/metrics")
+    async def metrics():
+        """Runtime metrics for caches and queues."""
+        return {
+            "history_cache": memory.cache_stats(),
+            "tool_cache": tool_cache.stats(),
+            "context": context.stats(),
+            "summarizer": summarizer.stats() if summarizer else {"enabled": False},
+            "routes": router.stats() if router else {"enabled": False},
+            "response_cache": response_cache.stats() if response_cache else {"enabled": False},
+            "plan_cache": plan_cache.stats() if plan_cache else {"enabled": False},
+            "sessions": session_locks.stats(),
+            "admission": admission.stats(),
+            "llm": llm.stats()
+        }
+    
     return app
@@ -0,0 +1,198 @@
+"""
+In-process LRU cache of recent session histories.
+"""
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+# Rough per-message bookkeeping cost on top of the string payloads
+_MESSAGE_OVERHEAD = 200
+
+def _message_size(message: Dict[str, Any]) -> int:
+    """Estimate the memory footprint of a cached message in bytes."""
+    size = _MESSAGE_OVERHEAD + len(message["content"]) + len(message["role"])
+    if message.get("metadata"):
+        size += len(str(message["metadata"]))
+    return size
+
+class _Entry:
+    """Cached tail of one session's history, plus its summary state once read."""
+
+    __slots__ = ("messages", "complete", "size", "summary")
+
+    def __init__(self, window: int):
+        self.messages: Deque[Dict[str, Any]] = deque(maxlen=window)
+        self.complete = False  # True when the window holds the whole session
+        self.size = 0
+        self.summary: Optional[Dict[str, Any]] = None  # None until known
+
+class SessionHistoryCache:
+    """
+    Bounded LRU cache holding the most recent messages of active sessions.
+
+    Each entry keeps up to ``window`` messages. A lookup is a hit when the
+    entry holds at least ``limit`` messages, or when it is known to contain
+    the entire session. Entries are evicted least-recently-used first once
+    either the session count or the estimated byte budget is exceeded.
+
+    An entry can also hold the session's rolling summary, the id of the last
+    message it covers and the number of messages after it; appended messages
+    keep that count current.
+    """
+
+    def __init__(self, max_sessions: int = 256, max_bytes: int = 8 * 1024 * 1024, window: int = 50):
+        """
+        Initialize the cache.
+
+        Args:
+            max_sessions: Maximum number of cached sessions
+            max_bytes: Approximate memory budget for all cached messages
+            window: Maximum number of messages kept per session
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.window = window
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        # [version, active loads, active writes] for sessions with I/O in flight
+        self._active: Dict[str, List[int]] = {}
+
+    def get(self, session_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Return the last ``limit`` messages in chronological order, or None on a miss."""
+        entry = self._entries.get(session_id)
+        if entry is None or (limit > len(entry.messages) and not entry.complete):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(session_id)
+        messages = list(entry.messages)
+        if limit < len(messages):
+            messages = messages[len(messages) - limit:] if limit > 0 else []
+        return [dict(message) for message in messages]
+
+    def begin_load(self, session_id: str) -> int:
+        """Register a database read for the session; returns a token for ``finish_load``."""
+        state = self._state(session_id)
+        state[1] += 1
+        # A read overlapping an in-flight write may or may not see it
+        return state[0] if not state[2] else -1
+
+    def finish_load(self, session_id: str, token: int, messages: Optional[List[Dict[str, Any]]],
+                    complete: bool) -> None:
+        """
+        Store messages read from the database.
+
+        The result is discarded if the session was written to while the read
+        was in flight, since it may be missing those messages.
+        """
+        state = self._state(session_id)
+        state[1] -= 1
+        stale = state[0] != token
+        self._release(session_id)
+
+        if messages is None or stale:
+            return
+
+        self._remove(session_id)
+        entry = _Entry(self.window)
+        entry.messages.extend(messages[-self.window:])
+        entry.complete = complete and len(messages) <= self.window
+        entry.size = sum(_message_size(message) for message in entry.messages)
+        if entry.size > self.max_bytes:
+            return
+
+        self._entries[session_id] = entry
+        self._bytes += entry.size
+        self._evict()
+
+    def get_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the cached summary state of a session, or None if it is not known."""
+        entry = self._entries.get(session_id)
+        if entry is None or entry.summary is None:
+            return None
+        return dict(entry.summary)
+
+    def finish_summary(self, session_id: str, token: int, summary: Optional[Dict[str, Any]]) -> None:
+        """
+        Store summary state read or written under a ``begin_load`` token.
+
+        The session's cached summary is forgotten instead if the session was
+        written to in the meantime, or if ``summary`` is None.
+        """
+        state = self._state(session_id)
+        state[1] -= 1
+        stale = state[0] != token
+        self._release(session_id)
+
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            entry.summary = None if stale or summary is None else dict(summary)
+
+    def begin_write(self, session_id: str) -> None:
+        """Mark a write to the session as in flight."""
+        state = self._state(session_id)
+        state[0] += 1
+        state[2] += 1
+
+    def end_write(self, session_id: str, message: Optional[Dict[str, Any]]) -> None:
+        """Finish a write, appending the message to the cached session if it succeeded."""
+        state = self._state(session_id)
+        state[0] += 1
+        state[2] -= 1
+        self._release(session_id)
+
+        entry = self._entries.get(session_id)
+        if entry is None or message is None:
+            return
+
+        if len(entry.messages) == self.window:
+            dropped = _message_size(entry.messages[0])
+            entry.size -= dropped
+            self._bytes -= dropped
+            entry.complete = False
+
+        entry.messages.append(message)
+        if entry.summary is not None:
+            entry.summary["pending"] += 1
+        size = _message_size(message)
+        entry.size += size
+        self._bytes += size
+        self._entries.move_to_end(session_id)
+        self._evict()
+
+    def invalidate(self, session_id: str) -> None:
+        """Drop a session from the cache."""
+        if session_id in self._active:
+            self._active[session_id][0] += 1
+        self._remove(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current occupancy."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "sessions": len(self._entries),
+            "bytes": self._bytes
+        }
+
+    def _state(self, session_id: str) -> List[int]:
+        return self._active.setdefault(session_id, [0, 0, 0])
+
+    def _release(self, session_id: str) -> None:
+        state = self._active[session_id]
+        if not state[1] and not state[2]:
+            del self._active[session_id]
+
+    def _remove(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
@@ -1,86 +1,153 @@
 """
 Conversation memory management for the agent.
 """
+import asyncio
 import json
 import os
 import aiofiles
 from typing import List, Dict, Any, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 import sqlite3
-import aiosqlite
+
+from src.memory.cache import SessionHistoryCache
+from src.memory.migrations import apply_migrations
+from src.memory.pool import ConnectionPool
+from src.memory.write_behind import WriteBehindQueue
 
 class ConversationMemory:
     """Manages conversation history and context."""
     
-    def __init__(self, db_path: str = "data/conversations.db"):
-        """Initialize conversation memory with SQLite backend."""
+    def __init__(self, db_path: str = "data/conversations.db", pool_size: int = 4,
+                 write_behind: bool = False, batch_size: int = 64, flush_interval_ms: int = 50,
+                 cache_sessions: int = 256, cache_bytes: int = 8 * 1024 * 1024):
+        """
+        Initialize conversation memory with SQLite backend.
+        
+        Args:
+            db_path: Path to the SQLite database file
+            pool_size: Maximum number of pooled connections
+            write_behind: Buffer inserts and write them in batched transactions
+            batch_size: Maximum messages per write-behind transaction
+            flush_interval_ms: Maximum time a buffered message waits to be written
+            cache_sessions: Number of session histories kept in memory (0 disables the cache)
+            cache_bytes: Approximate memory budget for cached histories
+        """
         self.db_path = db_path
         self._ensure_db_exists()
+        self._pool = ConnectionPool(db_path, size=pool_size)
+        self._write_behind = WriteBehindQueue(
+            self._write_messages, batch_size=batch_size, flush_interval=flush_interval_ms / 1000
+        ) if write_behind else None
+        self._cache = SessionHistoryCache(
+            max_sessions=cache_sessions, max_bytes=cache_bytes
+        ) if cache_sessions > 0 else None
     
     def _ensure_db_exists(self):
         """Ensure the database and tables exist."""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        # Create tables if they don't exist
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                metadata TEXT
-            )
-        ''')
+        # Create or upgrade the schema
+        apply_migrations(conn)
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS session_metadata (
-                session_id TEXT PRIMARY KEY,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                last_activity DATETIME DEFAULT CURRENT_TIMESTAMP,
-                title TEXT,
-                summary TEXT
-            )
-        ''')
+        # WAL is persistent in the database file, so set it once up front
+        conn.execute("PRAGMA journal_mode=WAL")
         
         conn.commit()
         conn.close()
     
+    async def close(self):
+        """Flush buffered writes and close the pooled database connections."""
+        try:
+            if self._write_behind:
+                await self._write_behind.close()
+        finally:
+            await self._pool.close()
+    
+    async def flush(self):
+        """Wait until all buffered messages are durably written."""
+        if self._write_behind:
+            await self._write_behind.flush()
+    
+    async def _sync_session(self, session_id: str):
+        """Flush buffered writes if the session has any, so reads see them."""
+        if self._write_behind and self._write_behind.has_pending(session_id):
+            await self._write_behind.flush()
+    
     async def add_message(self, session_id: str, role: str, content: str, metadata: Optional[Dict] = None):
         """Add a message to the conversation history."""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT INTO conversations (session_id, role, content, metadata) VALUES (?, ?, ?, ?)",
-                (session_id, role, content, json.dumps(metadata) if metadata else None)
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        row = (session_id, role, content, timestamp, json.dumps(metadata) if metadata else None)
+        
+        message = None
+        if self._cache:
+            self._cache.begin_write(session_id)
+        try:
+            if self._write_behind:
+                written = await self._write_behind.submit(session_id, row)
+                written.add_done_callback(lambda done: self._write_failed(session_id, done))
+            else:
+                await self._write_messages([row])
+            # Decoded from the stored column so cached and database reads agree exactly
+            message = {"role": role, "content": content, "timestamp": timestamp,
+                       "metadata": json.loads(row[4]) if row[4] else None}
+        finally:
+            if self._cache:
+                self._cache.end_write(session_id, message)
+    
+    def _write_failed(self, session_id: str, written: asyncio.Future):
+        """Drop the cached history of a session whose buffered message was never written."""
+        if not written.cancelled() and written.exception() is not None and self._cache:
+            self._cache.invalidate(session_id)
+    
+    async def _write_messages(self, rows: List[tuple]):
+        """Insert message rows and touch their sessions in one transaction."""
+        async with self._pool.acquire() as db:
+            await db.executemany(
+                "INSERT INTO conversations (session_id, role, content, timestamp, metadata) VALUES (?, ?, ?, ?, ?)",
+                rows
             )
             
             # Update session metadata
-            await db.execute(
-                """INSERT OR REPLACE INTO session_metadata 
-                   (session_id, created_at, last_activity) 
-                   VALUES (?, COALESCE((SELECT created_at FROM session_metadata WHERE session_id = ?), CURRENT_TIMESTAMP), CURRENT_TIMESTAMP)""",
-                (session_id, session_id)
+            await db.executemany(
+                """INSERT INTO session_metadata (session_id) VALUES (?)
+                   ON CONFLICT(session_id) DO UPDATE SET last_activity = CURRENT_TIMESTAMP""",
+                [(session_id,) for session_id in dict.fromkeys(row[0] for row in rows)]
             )
             
             await db.commit()
     
     async def get_conversation_history(self, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get conversation history for a session."""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
+        if not self._cache:
+            return await self._load_history(session_id, limit)
+        
+        history = self._cache.get(session_id, limit)
+        if history is not None:
+            return history
+        
+        token = self._cache.begin_load(session_id)
+        history = None
+        try:
+            history = await self._load_history(session_id, limit)
+            return history
+        finally:
+            self._cache.finish_load(session_id, token, history, complete=history is not None and len(history) < limit)
+    
+    async def _load_history(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Read the most recent messages of a session from the database."""
+        await self._sync_session(session_id)
+        async with self._pool.acquire() as db:
+            rows = await db.execute_fetchall(
                 """SELECT role, content, timestamp, metadata 
                    FROM conversations 
                    WHERE session_id = ? 
-                   ORDER BY timestamp DESC 
+                   ORDER BY id DESC 
                    LIMIT ?""",
                 (session_id, limit)
             )
             
-            rows = await cursor.fetchall()
-            
             history = []
             for row in rows:
                 history.append({
@@ -94,8 +161,9 @@ class ConversationMemory:
     
     async def get_recent_sessions(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent conversation sessions."""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
+        await self.flush()
+        async with self._pool.acquire() as db:
+            rows = await db.execute_fetchall(
                 """SELECT session_id, created_at, last_activity, title, summary
                    FROM session_metadata 
                    ORDER BY last_activity DESC 
@@ -103,8 +171,6 @@ class ConversationMemory:
                 (limit,)
             )
             
-            rows = await cursor.fetchall()
-            
             sessions = []
             for row in rows:
                 sessions.append({
@@ -119,7 +185,8 @@ class ConversationMemory:
     
     async def update_session_title(self, session_id: str, title: str):
         """Update the title for a session."""
-        async with aiosqlite.connect(self.db_path) as db:
+        await self._sync_session(session_id)
+        async with self._pool.acquire() as db:
             await db.execute(
                 "UPDATE session_metadata SET title = ? WHERE session_id = ?",
                 (title, session_id)
@@ -128,24 +195,135 @@ class ConversationMemory:
     
     async def update_session_summary(self, session_id: str, summary: str):
         """Update the summary for a session."""
-        async with aiosqlite.connect(self.db_path) as db:
+        await self._sync_session(session_id)
+        async with self._pool.acquire() as db:
             await db.execute(
                 "UPDATE session_metadata SET summary = ? WHERE session_id = ?",
                 (summary, session_id)
             )
             await db.commit()
+        if self._cache:
+            self._cache.invalidate(session_id)
+    
+    async def get_session_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the rolling summary of a session.
+        
+        Returns:
+            Dict with the summary text (None if there is none yet), the id of
+            the last message it covers (``through_id``) and the number of
+            messages after it (``pending``), or None for an unknown session
+        """
+        if not self._cache:
+            return await self._load_summary(session_id)
+        
+        state = self._cache.get_summary(session_id)
+        if state is not None:
+            return state
+        
+        token = self._cache.begin_load(session_id)
+        state = None
+        try:
+            state = await self._load_summary(session_id)
+            return state
+        finally:
+            self._cache.finish_summary(session_id, token, state)
+    
+    async def _load_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Read the summary state of a session from the database."""
+        await self._sync_session(session_id)
+        async with self._pool.acquire() as db:
+            rows = await db.execute_fetchall(
+                """SELECT summary, summary_through,
+                          (SELECT COUNT(*) FROM conversations
+                           WHERE session_id = session_metadata.session_id AND id > session_metadata.summary_through)
+                   FROM session_metadata 
+                   WHERE session_id = ?""",
+                (session_id,)
+            )
+        
+        if not rows:
+            return None
+        return {"summary": rows[0][0], "through_id": rows[0][1], "pending": rows[0][2]}
+    
+    async def get_messages_after(self, session_id: str, after_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get up to ``limit`` messages following message ``after_id``, oldest first, with their ids."""
+        await self._sync_session(session_id)
+        async with self._pool.acquire() as db:
+            rows = await db.execute_fetchall(
+                """SELECT id, role, content, timestamp 
+                   FROM conversations 
+                   WHERE session_id = ? AND id > ? 
+                   ORDER BY id 
+                   LIMIT ?""",
+                (session_id, after_id, limit)
+            )
+        
+        return [{"id": row[0], "role": row[1], "content": row[2], "timestamp": row[3]} for row in rows]
+    
+    async def advance_session_summary(self, session_id: str, summary: str, previous_through: int,
+                                      through_id: int) -> bool:
+        """
+        Replace the rolling summary if it has not moved since it was read.
+        
+        Args:
+            session_id: Session to update
+            summary: New summary covering messages up to ``through_id``
+            previous_through: The ``through_id`` the new summary was built on
+            through_id: Id of the last message the new summary covers
+        
+        Returns:
+            False if another update won, or the session was cleared meanwhile
+        """
+        token = self._cache.begin_load(session_id) if self._cache else None
+        state = None
+        try:
+            # Buffered messages must be counted as pending
+            await self._sync_session(session_id)
+            async with self._pool.acquire() as db:
+                cursor = await db.execute(
+                    """UPDATE session_metadata SET summary = ?, summary_through = ? 
+                       WHERE session_id = ? AND summary_through = ? 
+                         AND EXISTS (SELECT 1 FROM conversations WHERE id = ? AND session_id = ?)""",
+                    (summary, through_id, session_id, previous_through, through_id, session_id)
+                )
+                if cursor.rowcount == 1:
+                    # Counted in the same transaction, so no message can slip in between
+                    rows = await db.execute_fetchall(
+                        "SELECT COUNT(*) FROM conversations WHERE session_id = ? AND id > ?",
+                        (session_id, through_id)
+                    )
+                    state = {"summary": summary, "through_id": through_id, "pending": rows[0][0]}
+                await db.commit()
+            return state is not None
+        finally:
+            if self._cache:
+                self._cache.finish_summary(session_id, token, state)
     
     async def clear_session(self, session_id: str):
         """Clear conversation history for a session."""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
-            await db.execute("DELETE FROM session_metadata WHERE session_id = ?", (session_id,))
-            await db.commit()
+        await self._sync_session(session_id)
+        if self._cache:
+            self._cache.begin_write(session_id)
+        try:
+            async with self._pool.acquire() as db:
+                await db.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+                await db.execute("DELETE FROM session_metadata WHERE session_id = ?", (session_id,))
+                await db.commit()
+        finally:
+            if self._cache:
+                self._cache.end_write(session_id, None)
+                self._cache.invalidate(session_id)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters for the session history cache."""
+        return self._cache.stats() if self._cache else {"enabled": False}
     
     async def get_session_stats(self, session_id: str) -> Dict[str, Any]:
         """Get statistics for a session."""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
+        await self._sync_session(session_id)
+        async with self._pool.acquire() as db:
+            rows = await db.execute_fetchall(
                 """SELECT COUNT(*) as message_count,
                           MIN(timestamp) as first_message,
                           MAX(timestamp) as last_message
@@ -153,8 +331,7 @@ class ConversationMemory:
                    WHERE session_id = ?""",
                 (session_id,)
             )
-            
-            row = await cursor.fetchone()
+            row = rows[0]
             
             return {
                 "message_count": row[0],
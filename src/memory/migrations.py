@@ -0,0 +1,91 @@
+"""
+Versioned schema migrations for the conversation database.
+"""
+import logging
+import sqlite3
+from typing import List, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+class Migration(NamedTuple):
+    """A single schema change, applied once in version order."""
+    version: int
+    description: str
+    statements: List[str]
+
+# Append new migrations to the end; never edit one that has shipped.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Create conversations and session_metadata tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            metadata TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS session_metadata (
+            session_id TEXT PRIMARY KEY,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_activity DATETIME DEFAULT CURRENT_TIMESTAMP,
+            title TEXT,
+            summary TEXT
+        )
+        ''',
+    ]),
+    Migration(2, "Index messages by (session_id, id) and sessions by last_activity", [
+        "CREATE INDEX IF NOT EXISTS idx_conversations_session_id ON conversations (session_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_session_metadata_last_activity ON session_metadata (last_activity)",
+    ]),
+    Migration(3, "Track the last message folded into each session summary", [
+        "ALTER TABLE session_metadata ADD COLUMN summary_through INTEGER NOT NULL DEFAULT 0",
+    ]),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Return the schema version recorded in the database header."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Apply all pending migrations, each in its own transaction.
+
+    Args:
+        conn: An open sqlite3 connection
+
+    Returns:
+        The schema version after migrating
+    """
+    current = get_schema_version(conn)
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # Manage transactions explicitly so DDL is atomic
+
+    try:
+        for migration in MIGRATIONS:
+            if migration.version <= current:
+                continue
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another worker may have migrated while we waited for the lock
+                if get_schema_version(conn) >= migration.version:
+                    conn.execute("COMMIT")
+                    current = migration.version
+                    continue
+
+                logger.info(f"Applying schema migration {migration.version}: {migration.description}")
+                for statement in migration.statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {migration.version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            current = migration.version
+    finally:
+        conn.isolation_level = isolation_level
+
+    return current
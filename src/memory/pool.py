@@ -0,0 +1,105 @@
+"""
+Pooled, persistent SQLite connections for the memory subsystem.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Union
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# Applied to every connection when it is opened. WAL lets readers proceed
+# while a writer commits, and synchronous=NORMAL only fsyncs at checkpoints.
+DEFAULT_PRAGMAS: Dict[str, Union[str, int]] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -8000,        # 8 MB page cache per connection
+    "mmap_size": 67108864,      # 64 MB memory-mapped I/O
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,       # ms to wait for a competing writer
+}
+
+class ConnectionPool:
+    """
+    Pool of long-lived aiosqlite connections.
+
+    Connections are opened lazily up to ``size`` and reused for the lifetime
+    of the pool, so each one keeps its worker thread, page cache and
+    prepared-statement cache (sqlite3 caches compiled statements per
+    connection, keyed by SQL text).
+    """
+
+    def __init__(self, db_path: str, size: int = 4, pragmas: Optional[Dict[str, Union[str, int]]] = None,
+                 cached_statements: int = 128):
+        """
+        Initialize the pool.
+
+        Args:
+            db_path: Path to the SQLite database file
+            size: Maximum number of open connections
+            pragmas: PRAGMA settings applied to each new connection
+            cached_statements: Size of each connection's prepared-statement cache
+        """
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.cached_statements = cached_statements
+        self._idle: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+        self._opening = 0
+        self._closed = False
+
+    async def _open(self) -> aiosqlite.Connection:
+        """Open a new connection and apply the configured pragmas."""
+        conn = await aiosqlite.connect(self.db_path, cached_statements=self.cached_statements)
+        try:
+            for name, value in self.pragmas.items():
+                await conn.execute(f"PRAGMA {name}={value}")
+        except Exception:
+            await conn.close()
+            raise
+        logger.debug(f"Opened SQLite connection to {self.db_path}")
+        return conn
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a connection from the pool, opening one if below capacity."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+
+        if self._idle.empty() and len(self._connections) + self._opening < self.size:
+            self._opening += 1
+            try:
+                conn = await self._open()
+            finally:
+                self._opening -= 1
+            self._connections.append(conn)
+        else:
+            conn = await self._idle.get()
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                # Never hand out a connection with a half-finished write
+                await conn.rollback()
+            if self._closed:
+                await conn.close()
+            else:
+                self._idle.put_nowait(conn)
+
+    async def close(self) -> None:
+        """Close all idle connections; borrowed ones close when released."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._idle is not None:
+            while not self._idle.empty():
+                conn = self._idle.get_nowait()
+                await conn.close()
+        self._connections.clear()
@@ -0,0 +1,156 @@
+"""
+Write-behind queue that batches message inserts into shared transactions.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindQueue:
+    """
+    Buffers rows and hands them to a writer in batches.
+
+    A batch is flushed once ``batch_size`` rows are waiting or ``flush_interval``
+    seconds after its first row arrived, whichever comes first. A failed batch
+    is retried up to ``max_retries`` times; if it still fails, the error is set
+    on the futures ``submit`` returned for its rows and on no others.
+    ``flush()`` is the durability boundary: when it returns, every row
+    submitted before the call has been written or has failed.
+    """
+
+    def __init__(self, writer: Callable[[List[Any]], Awaitable[None]], batch_size: int = 64,
+                 flush_interval: float = 0.05, max_pending: int = 10000, max_retries: int = 2,
+                 retry_delay: float = 0.05):
+        """
+        Initialize the queue.
+
+        Args:
+            writer: Coroutine function that persists a list of rows atomically
+            batch_size: Maximum rows per write
+            flush_interval: Maximum seconds a row waits before being written
+            max_pending: Queue bound; submitters wait when it is reached
+            max_retries: Further attempts at a batch whose write failed
+            retry_delay: Seconds before the first retry, doubled for each further one
+        """
+        self.writer = writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._done: Optional[asyncio.Condition] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending_keys: Dict[str, int] = defaultdict(int)
+        self._submitted = 0
+        self._completed = 0
+        self._flush_waiters = 0
+
+    def _start(self) -> None:
+        """Create the loop-bound primitives and the flusher task on first use."""
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._wake = asyncio.Event()
+            self._done = asyncio.Condition()
+            self._task = asyncio.create_task(self._run())
+
+    def has_pending(self, key: str) -> bool:
+        """Return True if rows for the key are queued but not yet written."""
+        return self._pending_keys.get(key, 0) > 0
+
+    @property
+    def pending(self) -> int:
+        """Number of rows submitted but not yet written."""
+        return self._submitted - self._completed
+
+    async def submit(self, key: str, row: Any) -> asyncio.Future:
+        """
+        Queue a row for writing; waits only if the queue is full.
+
+        Returns:
+            Future resolved once the row is written, or holding the error if
+            its batch could not be written
+        """
+        self._start()
+        self._pending_keys[key] += 1
+        self._submitted += 1
+        written = asyncio.get_running_loop().create_future()
+        await self._queue.put((key, row, written))
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+        return written
+
+    async def flush(self) -> None:
+        """Wait until every row submitted so far has been written or has failed."""
+        target = self._submitted
+        if self._completed < target:
+            self._flush_waiters += 1
+            self._wake.set()
+            try:
+                async with self._done:
+                    await self._done.wait_for(lambda: self._completed >= target)
+            finally:
+                self._flush_waiters -= 1
+
+    async def close(self) -> None:
+        """Flush outstanding rows and stop the flusher task."""
+        if self._task is None:
+            return
+        try:
+            await self.flush()
+        finally:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _write(self, batch: List[Tuple[str, Any, asyncio.Future]]) -> Optional[Exception]:
+        """Write a batch, retrying failures; returns the last error if every attempt failed."""
+        rows = [row for _, row, _ in batch]
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.writer(rows)
+                return None
+            except Exception as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Write-behind batch of {len(batch)} rows failed: {e}")
+                    return e
+                delay = self.retry_delay * 2 ** attempt
+                logger.warning(f"Write-behind batch of {len(batch)} rows failed ({e}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _run(self) -> None:
+        """Collect rows into batches and write them until cancelled."""
+        while True:
+            first = await self._queue.get()
+
+            if self._queue.qsize() + 1 < self.batch_size and not self._flush_waiters:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            batch: List[Tuple[str, Any, asyncio.Future]] = [first]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            error = await self._write(batch)
+            for key, _, written in batch:
+                self._pending_keys[key] -= 1
+                if not self._pending_keys[key]:
+                    del self._pending_keys[key]
+                if not written.done():
+                    if error is None:
+                        written.set_result(None)
+                    else:
+                        written.set_exception(error)
+
+            async with self._done:
+                self._completed += len(batch)
+                self._done.notify_all()
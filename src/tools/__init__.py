@@ -1,23 +1,36 @@
 """
 Tools package initialization.
 """
-from .base import Tool, ToolManager
+from typing import Optional
+from .base import Tool, ToolManager, ToolInvocation, ToolResult
 from .file_ops import FileReadTool, FileWriteTool, FileListTool
+from .file_index import FileIndex, SearchFilesTool
 from .web_tools import WebSearchTool, WebScrapeTool
 from .calculator import CalculatorTool
+from .http_client import HttpClient
+from .cache import ToolResultCache
 
-def create_tool_manager() -> ToolManager:
-    """Create and configure a tool manager with all available tools."""
+def create_tool_manager(result_cache: Optional[ToolResultCache] = None) -> ToolManager:
+    """
+    Create and configure a tool manager with all available tools.
+    
+    Args:
+        result_cache: Cache shared by the web tools; a memory-only cache
+            is created if not given
+    """
     manager = ToolManager()
     
     # Register file operation tools
     manager.register_tool(FileReadTool())
     manager.register_tool(FileWriteTool())
     manager.register_tool(FileListTool())
+    manager.register_tool(SearchFilesTool())
     
-    # Register web tools
-    manager.register_tool(WebSearchTool())
-    manager.register_tool(WebScrapeTool())
+    # Register web tools sharing one pooled HTTP client
+    http_client = HttpClient()
+    result_cache = result_cache or ToolResultCache()
+    manager.register_tool(WebSearchTool(http_client, cache=result_cache))
+    manager.register_tool(WebScrapeTool(http_client, cache=result_cache))
     
     # Register calculator tool
     manager.register_tool(CalculatorTool())
@@ -27,11 +40,17 @@ def create_tool_manager() -> ToolManager:
 __all__ = [
     "Tool", 
     "ToolManager", 
+    "ToolInvocation",
+    "ToolResult",
     "create_tool_manager",
     "FileReadTool", 
     "FileWriteTool", 
     "FileListTool",
+    "FileIndex",
+    "SearchFilesTool",
     "WebSearchTool", 
     "WebScrapeTool",
-    "CalculatorTool"
+    "CalculatorTool",
+    "HttpClient",
+    "ToolResultCache"
 ]
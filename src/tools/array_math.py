@@ -0,0 +1,108 @@
+"""
+Reductions and optional NumPy kernels for sequence expressions in the calculator.
+"""
+import statistics
+from decimal import Decimal
+from fractions import Fraction
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised when numpy is not installed
+    np = None
+
+def is_sequence(value: Any) -> bool:
+    """True for the sequence types expressions can produce."""
+    return isinstance(value, (list, tuple, range)) or (np is not None and isinstance(value, np.ndarray))
+
+def to_array(values: Any) -> Any:
+    """Convert a sequence to a float64 NumPy array for vectorized evaluation."""
+    if isinstance(values, range):
+        return np.arange(values.start, values.stop, values.step, dtype=np.float64)
+    return np.asarray(values, dtype=np.float64)
+
+def vector_loop(target: str, element: Callable[[Any], Any], conditions: List[Callable[[Any], Any]],
+                env: Mapping[str, Any], values: Any) -> Optional[Any]:
+    """
+    Evaluate a generator's filters and element once over a whole array.
+
+    Returns None when the kernel cannot reproduce the per-value result,
+    such as on a domain error, so the caller falls back to its Python loop
+    and reports the error the same way.
+    """
+    scope = dict(env)
+    try:
+        with np.errstate(all="raise"):
+            array = to_array(values)
+            for condition in conditions:
+                # Later filters only see the values that passed earlier ones
+                mask = np.broadcast_to(np.asarray(condition({**scope, target: array}), dtype=bool), array.shape)
+                array = array[mask]
+            scope[target] = array
+            result = np.asarray(element(scope))
+    except (ArithmeticError, TypeError, ValueError):
+        return None
+    if result.ndim == 0:
+        return np.full(array.shape, result)
+    return result if result.shape == array.shape else None
+
+def _plain(value: Any) -> Any:
+    """Unwrap NumPy scalars so results format and pickle like Python numbers."""
+    return value.item() if np is not None and isinstance(value, np.generic) else value
+
+def reduction(python: Callable[[Any], Any], numpy: Optional[Callable[[Any], Any]] = None) -> Callable[..., Any]:
+    """Build a function taking either one sequence or several numbers."""
+    def reduce(*args):
+        values = args[0] if len(args) == 1 and is_sequence(args[0]) else args
+        if not len(values):
+            raise ValueError("Cannot reduce an empty sequence")
+        if numpy is not None and np is not None and isinstance(values, np.ndarray):
+            return _plain(numpy(values))
+        return _plain(python(values))
+    return reduce
+
+def _mean(values: Any) -> Any:
+    # fmean is much faster, but only exact types need mean's exact arithmetic
+    if isinstance(values[0], (Decimal, Fraction)):
+        return statistics.mean(values)
+    return statistics.fmean(values)
+
+# Reductions accept a sequence (list, range, generator expression) or separate arguments
+REDUCTIONS: Dict[str, Callable[..., Any]] = {
+    "sum": reduction(sum, lambda a: a.sum()),
+    "min": reduction(min, lambda a: a.min()),
+    "max": reduction(max, lambda a: a.max()),
+    "mean": reduction(_mean, lambda a: a.mean()),
+    "median": reduction(statistics.median, lambda a: np.median(a)),
+    "stdev": reduction(statistics.stdev, lambda a: a.std(ddof=1)),
+    "pstdev": reduction(statistics.pstdev, lambda a: a.std()),
+    "variance": reduction(statistics.variance, lambda a: a.var(ddof=1)),
+    "pvariance": reduction(statistics.pvariance, lambda a: a.var()),
+    "count": reduction(len, len),
+}
+
+# Element-wise kernels used when a generator expression is evaluated over a whole array
+VECTOR_FUNCTIONS: Dict[str, Callable[..., Any]] = {} if np is None else {
+    "sqrt": np.sqrt,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "asin": np.arcsin,
+    "acos": np.arccos,
+    "atan": np.arctan,
+    "log": np.log,
+    "log10": np.log10,
+    "log2": np.log2,
+    "exp": np.exp,
+    "floor": np.floor,
+    "ceil": np.ceil,
+    "abs": np.abs,
+}
+
+def format_sequence(values: Any, format_item: Callable[[Any], str] = str, show: int = 20) -> str:
+    """Format a sequence result, listing at most ``show`` values."""
+    items = values[:show].tolist() if np is not None and isinstance(values, np.ndarray) else list(values[:show])
+    shown = ", ".join(format_item(item) for item in items)
+    if len(values) <= show:
+        return f"[{shown}]"
+    return f"[{shown}, ...] ({len(values):,} values)"
@@ -1,15 +1,24 @@
 """
 Base classes for the tool system.
 """
+import asyncio
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, List, Optional
 import logging
+from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
 
 class Tool(ABC):
     """Base class for all tools."""
     
+    # Tools without side effects may run concurrently with each other
+    read_only: bool = False
+    
+    # Maximum simultaneous executions of this tool (None for no limit)
+    max_concurrency: Optional[int] = None
+    
     @property
     @abstractmethod
     def name(self) -> str:
@@ -32,17 +41,44 @@ class Tool(ABC):
     async def execute(self, **kwargs) -> Any:
         """Execute the tool with given parameters."""
         pass
+    
+    async def close(self) -> None:
+        """Release any resources held by the tool."""
+        pass
+
+class ToolInvocation(BaseModel):
+    """A single tool call within a batch."""
+    name: str
+    parameters: Dict[str, Any] = {}
+
+class ToolResult(BaseModel):
+    """Outcome and timing of a tool call."""
+    name: str
+    parameters: Dict[str, Any] = {}
+    result: Any = None
+    error: Optional[str] = None
+    duration_ms: float = 0.0
 
 class ToolManager:
     """Manages all available tools."""
     
-    def __init__(self):
-        """Initialize the tool manager."""
+    def __init__(self, default_timeout: Optional[float] = 30.0):
+        """
+        Initialize the tool manager.
+        
+        Args:
+            default_timeout: Per-call timeout in seconds for batched tool calls
+        """
         self.tools: Dict[str, Tool] = {}
+        self.default_timeout = default_timeout
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        # Bumped whenever the tool set changes, so derived prompts can be cached
+        self.version = 0
     
     def register_tool(self, tool: Tool) -> None:
         """Register a new tool."""
         self.tools[tool.name] = tool
+        self.version += 1
         logger.info(f"Registered tool: {tool.name}")
     
     def get_tools_description(self) -> str:
@@ -52,12 +88,41 @@ class ToolManager:
             descriptions.append(f"- {tool.name}: {tool.description}")
         return "\n".join(descriptions)
     
+    def get_tool_schemas(self) -> List[Dict[str, Any]]:
+        """Get function declarations (name, description, JSON schema) for all tools."""
+        return [
+            {"name": tool.name, "description": tool.description, "parameters": tool.parameters}
+            for tool in self.tools.values()
+        ]
+    
+    def _validate_parameters(self, tool: Tool, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """Check parameters against the tool's schema, coercing whole-number floats to integers."""
+        schema = tool.parameters
+        properties = schema.get("properties", {})
+        
+        missing = [name for name in schema.get("required", []) if name not in parameters]
+        if missing:
+            raise ValueError(f"Missing required parameters for '{tool.name}': {', '.join(missing)}")
+        
+        unknown = [name for name in parameters if name not in properties]
+        if unknown:
+            raise ValueError(f"Unknown parameters for '{tool.name}': {', '.join(unknown)}")
+        
+        validated = {}
+        for name, value in parameters.items():
+            # JSON numbers from model function calls may arrive as floats
+            if properties[name].get("type") == "integer" and isinstance(value, float) and value.is_integer():
+                value = int(value)
+            validated[name] = value
+        return validated
+    
     async def execute_tool(self, tool_name: str, parameters: Dict[str, Any]) -> Any:
         """Execute a tool by name with given parameters."""
         if tool_name not in self.tools:
             raise ValueError(f"Tool '{tool_name}' not found")
         
         tool = self.tools[tool_name]
+        parameters = self._validate_parameters(tool, parameters)
         logger.info(f"Executing tool: {tool_name}")
         
         try:
@@ -68,6 +133,88 @@ class ToolManager:
             logger.error(f"Error executing tool {tool_name}: {e}")
             raise
     
+    async def execute_batch(self, invocations: List[ToolInvocation], timeout: Optional[float] = None,
+                            on_result: Optional[Callable[[int, ToolResult], None]] = None) -> List[ToolResult]:
+        """
+        Execute several tool calls, running independent ones concurrently.
+        
+        Consecutive read-only calls run in parallel; a call to a tool with
+        side effects waits for everything before it and finishes before
+        anything after it starts. Each tool's ``max_concurrency`` is enforced
+        across all batches. Failures and timeouts are reported in the result
+        instead of raising.
+        
+        Args:
+            invocations: Tool calls in the order they were requested
+            timeout: Per-call timeout in seconds (defaults to ``default_timeout``)
+            on_result: Called with (index, result) as each call finishes
+            
+        Returns:
+            One result per invocation, in the same order
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        results: List[Optional[ToolResult]] = [None] * len(invocations)
+        
+        async def run(index: int) -> None:
+            results[index] = await self._execute_timed(invocations[index], timeout)
+            if on_result is not None:
+                on_result(index, results[index])
+        
+        group: List[int] = []
+        for index, invocation in enumerate(invocations):
+            tool = self.tools.get(invocation.name)
+            if tool is not None and tool.read_only:
+                group.append(index)
+                continue
+            if group:
+                await asyncio.gather(*(run(i) for i in group))
+                group = []
+            await run(index)
+        if group:
+            await asyncio.gather(*(run(i) for i in group))
+        
+        return results
+    
+    async def _execute_timed(self, invocation: ToolInvocation, timeout: Optional[float]) -> ToolResult:
+        """Execute one call under its tool's concurrency limit, recording the duration."""
+        result = ToolResult(name=invocation.name, parameters=invocation.parameters)
+        tool = self.tools.get(invocation.name)
+        semaphore = self._semaphore(tool) if tool is not None else None
+        
+        if semaphore is not None:
+            await semaphore.acquire()
+        start = time.perf_counter()
+        try:
+            result.result = await asyncio.wait_for(
+                self.execute_tool(invocation.name, invocation.parameters), timeout
+            )
+        except asyncio.TimeoutError:
+            result.error = f"Tool '{invocation.name}' timed out after {timeout}s"
+            logger.warning(result.error)
+        except Exception as e:
+            result.error = str(e)
+        finally:
+            result.duration_ms = (time.perf_counter() - start) * 1000
+            if semaphore is not None:
+                semaphore.release()
+        return result
+    
+    def _semaphore(self, tool: Tool) -> Optional[asyncio.Semaphore]:
+        """Get the shared concurrency limiter for a tool, if it declares one."""
+        if tool.max_concurrency is None:
+            return None
+        if tool.name not in self._semaphores:
+            self._semaphores[tool.name] = asyncio.Semaphore(tool.max_concurrency)
+        return self._semaphores[tool.name]
+    
     def list_tools(self) -> List[str]:
         """List all available tool names."""
         return list(self.tools.keys())
+    
+    async def close(self) -> None:
+        """Release resources held by registered tools."""
+        for tool in self.tools.values():
+            try:
+                await tool.close()
+            except Exception as e:
+                logger.error(f"Error closing tool {tool.name}: {e}")
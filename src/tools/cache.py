@@ -0,0 +1,232 @@
+"""
+TTL cache for tool results with request coalescing and an optional disk tier.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default freshness per tool, in seconds
+DEFAULT_TTLS: Dict[str, float] = {
+    "web_search": 600,
+    "scrape_webpage": 300,
+}
+
+# Stale entries are kept this long past expiry so they can be revalidated
+MAX_STALE = 24 * 3600
+
+class CacheEntry:
+    """A cached tool result plus HTTP validators for revalidation."""
+
+    __slots__ = ("value", "expires_at", "etag", "last_modified")
+
+    def __init__(self, value: str, expires_at: float, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None):
+        self.value = value
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def is_fresh(self) -> bool:
+        """Return True if the entry can be served without refetching."""
+        return time.time() < self.expires_at
+
+def make_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+    """Build a cache key from a tool name and its normalized arguments."""
+    return f"{tool_name}:{json.dumps(arguments, sort_keys=True, separators=(',', ':'))}"
+
+class ToolResultCache:
+    """
+    Two-tier TTL cache for tool results.
+
+    Lookups check an in-memory LRU first, then an optional SQLite file.
+    Concurrent misses for the same key share a single fetch. Expired
+    entries are handed to the fetch function so it can revalidate them
+    (e.g. with ETag/Last-Modified) instead of downloading again.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, default_ttl: Optional[float] = None,
+                 max_entries: int = 1024, db_path: Optional[str] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            ttls: Per-tool freshness in seconds
+            default_ttl: Freshness for tools not in ``ttls``; when omitted,
+                ``DEFAULT_TTLS`` applies and other tools get 300 seconds
+            max_entries: Size of the in-memory tier
+            db_path: SQLite file for the persistent tier (None for memory only)
+        """
+        if default_ttl is None:
+            self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+            self.default_ttl = 300.0
+        else:
+            self.ttls = dict(ttls or {})
+            self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.revalidated = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS tool_cache (
+                       key TEXT PRIMARY KEY,
+                       value TEXT NOT NULL,
+                       expires_at REAL NOT NULL,
+                       etag TEXT,
+                       last_modified TEXT
+                   )"""
+            )
+            self._db.execute("DELETE FROM tool_cache WHERE expires_at < ?", (time.time() - MAX_STALE,))
+            self._db.commit()
+
+    def ttl_for(self, tool_name: str) -> float:
+        """Return the freshness lifetime for a tool's results."""
+        return self.ttls.get(tool_name, self.default_ttl)
+
+    async def get_or_fetch(self, key: str,
+                           fetch: Callable[[Optional[CacheEntry]], Awaitable[CacheEntry]]) -> str:
+        """
+        Return a fresh cached value, or fetch one with single-flight coalescing.
+
+        Args:
+            key: Cache key from ``make_key``
+            fetch: Called with the stale entry (or None) and returns the new
+                entry; returning the stale entry counts as a revalidation.
+                Entries that are already expired and carry no validators
+                are returned but not stored. Exceptions propagate to every
+                waiter and nothing is cached.
+
+        A caller that is cancelled stops waiting, but the fetch runs on for
+        the callers coalesced onto it.
+
+        Returns:
+            The cached or freshly fetched value
+        """
+        entry = await self._lookup(key)
+        if entry is not None and entry.is_fresh():
+            self.hits += 1
+            return entry.value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        task = asyncio.ensure_future(self._fetch(key, entry, fetch))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._fetched(key, done))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, entry: Optional[CacheEntry],
+                     fetch: Callable[[Optional[CacheEntry]], Awaitable[CacheEntry]]) -> str:
+        fetched = await fetch(entry)
+        if entry is not None and fetched is entry:
+            self.revalidated += 1
+        if fetched.is_fresh() or fetched.etag or fetched.last_modified:
+            await self._store(key, fetched)
+        return fetched.value
+
+    def _fetched(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Waiters re-raise it; avoid "exception never retrieved" if there are none
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and occupancy."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "revalidated": self.revalidated,
+            "entries": len(self._entries),
+            "persistent": self._db is not None
+        }
+
+    def close(self) -> None:
+        """Close the persistent tier."""
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    async def _lookup(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        if self._db is None:
+            return None
+
+        row = await asyncio.to_thread(self._db_get, key)
+        if row is None:
+            return None
+        entry = CacheEntry(*row)
+        self._remember(key, entry)
+        return entry
+
+    async def _store(self, key: str, entry: CacheEntry) -> None:
+        self._remember(key, entry)
+        if self._db is not None:
+            await asyncio.to_thread(self._db_put, key, entry)
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _db_get(self, key: str) -> Optional[tuple]:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT value, expires_at, etag, last_modified FROM tool_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _db_put(self, key: str, entry: CacheEntry) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tool_cache (key, value, expires_at, etag, last_modified) VALUES (?, ?, ?, ?, ?)",
+                (key, entry.value, entry.expires_at, entry.etag, entry.last_modified)
+            )
+            self._db.commit()
+
+def freshness_lifetime(headers: Any, default_ttl: float) -> Optional[float]:
+    """
+    Derive a TTL from HTTP Cache-Control headers.
+
+    Returns None for ``no-store`` (do not cache at all), 0 for ``no-cache``
+    (store, but revalidate before every use), the smaller of ``max-age`` and
+    the default when present, and the default otherwise.
+    """
+    directives = {}
+    for part in headers.get("cache-control", "").lower().split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name] = value.strip('"')
+
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    if "max-age" in directives:
+        try:
+            return min(float(directives["max-age"]), default_ttl)
+        except ValueError:
+            pass
+    return default_ttl
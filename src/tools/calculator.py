@@ -1,25 +1,44 @@
 """
 Calculator and mathematical tools.
 """
-import ast
-import operator
-import math
-from typing import Dict, Any
+import asyncio
+import decimal
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Tuple
 from src.tools.base import Tool
+from src.tools.expression import MODES, BudgetExceeded, evaluate, format_result
+
+# Exact results up to this size, sequences up to this length and evaluations
+# up to this much work are computed inline; larger ones go to the worker pool
+INLINE_RESULT_BITS = 8192
+INLINE_ELEMENTS = 50_000
+INLINE_OPERATIONS = 1_000_000
+
+# Most expressions accepted in one batch call
+MAX_BATCH = 100
+
+logger = logging.getLogger(__name__)
 
 class CalculatorTool(Tool):
     """Tool for mathematical calculations."""
     
-    # Safe operations for evaluation
-    _operators = {
-        ast.Add: operator.add,
-        ast.Sub: operator.sub,
-        ast.Mult: operator.mul,
-        ast.Div: operator.truediv,
-        ast.Pow: operator.pow,
-        ast.BitXor: operator.xor,
-        ast.USub: operator.neg,
-    }
+    read_only = True
+    
+    def __init__(self, timeout: float = 2.0, max_workers: int = 2):
+        """
+        Initialize the calculator.
+        
+        Args:
+            timeout: Hard time limit in seconds for expressions that are
+                evaluated in the worker process pool
+            max_workers: Size of the worker process pool
+        """
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
     
     @property
     def name(self) -> str:
@@ -27,7 +46,9 @@ class CalculatorTool(Tool):
     
     @property
     def description(self) -> str:
-        return "Perform mathematical calculations safely"
+        return ("Perform mathematical calculations safely. Pass several expressions at once with "
+                "'expressions'. Supports ranges (1..100), generators such as sum(x**2 for x in 1..1e6 if x % 2 == 0), "
+                "lists, named arrays via 'variables', and sum, prod, mean, median, stdev, variance, min, max and count")
     
     @property
     def parameters(self) -> Dict[str, Any]:
@@ -36,81 +57,131 @@ class CalculatorTool(Tool):
             "properties": {
                 "expression": {
                     "type": "string",
-                    "description": "Mathematical expression to evaluate (e.g., '2 + 3 * 4', 'sqrt(16)', 'sin(3.14159/2)')"
+                    "description": "Mathematical expression to evaluate (e.g., '2 + 3 * 4', 'sqrt(16)', 'mean([3, 5, 8])')"
+                },
+                "expressions": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": f"Several expressions to evaluate in one call (up to {MAX_BATCH}), one result line each"
+                },
+                "variables": {
+                    "type": "array",
+                    "description": "Named lists of numbers the expressions can use, e.g. [{\"name\": \"xs\", \"values\": [1, 2, 3]}]",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {"type": "string"},
+                            "values": {"type": "array", "items": {"type": "number"}}
+                        },
+                        "required": ["name", "values"]
+                    }
+                },
+                "mode": {
+                    "type": "string",
+                    "description": "Number type: 'float', 'decimal' (50 exact digits) or 'fraction' (exact rationals)",
+                    "enum": list(MODES),
+                    "default": "float"
                 }
             },
-            "required": ["expression"]
+            "required": []
         }
     
-    def _safe_eval(self, node):
-        """Safely evaluate a mathematical expression."""
-        if isinstance(node, ast.Num):  # Numbers
-            return node.n
-        elif isinstance(node, ast.Constant):  # Constants (Python 3.8+)
-            return node.value
-        elif isinstance(node, ast.BinOp):  # Binary operations
-            return self._operators[type(node.op)](
-                self._safe_eval(node.left), 
-                self._safe_eval(node.right)
-            )
-        elif isinstance(node, ast.UnaryOp):  # Unary operations
-            return self._operators[type(node.op)](self._safe_eval(node.operand))
-        elif isinstance(node, ast.Call):  # Function calls
-            func_name = node.func.id
-            args = [self._safe_eval(arg) for arg in node.args]
-            
-            # Math functions
-            if func_name == 'sqrt':
-                return math.sqrt(args[0])
-            elif func_name == 'sin':
-                return math.sin(args[0])
-            elif func_name == 'cos':
-                return math.cos(args[0])
-            elif func_name == 'tan':
-                return math.tan(args[0])
-            elif func_name == 'log':
-                return math.log(args[0])
-            elif func_name == 'log10':
-                return math.log10(args[0])
-            elif func_name == 'exp':
-                return math.exp(args[0])
-            elif func_name == 'abs':
-                return abs(args[0])
-            elif func_name == 'round':
-                return round(args[0], args[1] if len(args) > 1 else 0)
-            elif func_name == 'min':
-                return min(args)
-            elif func_name == 'max':
-                return max(args)
-            else:
-                raise ValueError(f"Function '{func_name}' not allowed")
-        elif isinstance(node, ast.Name):  # Constants like pi, e
-            if node.id == 'pi':
-                return math.pi
-            elif node.id == 'e':
-                return math.e
-            else:
-                raise ValueError(f"Name '{node.id}' not allowed")
-        else:
-            raise ValueError(f"Operation {type(node)} not allowed")
+    async def execute(self, expression: Optional[str] = None, mode: str = "float",
+                      expressions: Optional[List[str]] = None,
+                      variables: Optional[List[Dict[str, Any]]] = None) -> str:
+        """Calculate the result of one expression, or of each in a batch."""
+        if expression is None and not expressions:
+            return "Error: Provide 'expression' or 'expressions'"
+        if expressions and len(expressions) > MAX_BATCH:
+            return f"Error: At most {MAX_BATCH} expressions per call"
+        try:
+            variables = self._check_variables(variables or [])
+        except ValueError as e:
+            return f"Error: {str(e)}"
+        
+        if expression is not None and not expressions:
+            return (await self._calculate(expression.strip(), mode, variables))[1]
+        
+        # Every expression shares the variables and the compiled-template cache
+        items = ([expression] if expression is not None else []) + list(expressions)
+        lines = []
+        for item in items:
+            item = str(item).strip()
+            ok, text = await self._calculate(item, mode, variables)
+            lines.append(text if ok else f"{item}: {text}")
+        return "\n".join(lines)
     
-    async def execute(self, expression: str) -> str:
-        """Calculate the result of a mathematical expression."""
+    @staticmethod
+    def _check_variables(variables: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Turn the variables parameter into a name-to-list mapping of plain numbers."""
+        checked = {}
+        for variable in variables:
+            name, values = str(variable.get("name", "")), variable.get("values")
+            if not name.isidentifier() or name.startswith("__"):
+                raise ValueError(f"Invalid variable name '{name}'")
+            if not isinstance(values, list) or any(
+                isinstance(item, bool) or not isinstance(item, (int, float)) for item in values
+            ):
+                raise ValueError(f"Variable '{name}' must be a list of numbers")
+            checked[name] = values
+        return checked
+    
+    async def _calculate(self, expression: str, mode: str, variables: Dict[str, Any]) -> Tuple[bool, str]:
+        """Evaluate one expression; returns whether it succeeded and the result or error line."""
         try:
-            # Clean the expression
-            expression = expression.strip()
-            
-            # Parse the expression
-            node = ast.parse(expression, mode='eval')
-            
-            # Evaluate safely
-            result = self._safe_eval(node.body)
-            
-            return f"{expression} = {result}"
+            # Compiled evaluators are cached by template, so expressions that
+            # differ only in their numbers skip parsing
+            try:
+                result = evaluate(expression, variables, mode=mode, max_bits=INLINE_RESULT_BITS,
+                                  max_elements=INLINE_ELEMENTS, max_operations=INLINE_OPERATIONS)
+            except BudgetExceeded:
+                # Big powers, factorials, long sequences and heavy loops run
+                # out of process, where a slow one can be killed
+                result = await self._evaluate_in_pool(expression, mode, variables)
             
+            return True, f"{expression} = {format_result(result)}"
+        
         except ZeroDivisionError:
-            return "Error: Division by zero"
+            return False, "Error: Division by zero"
+        except (OverflowError, decimal.Overflow):
+            return False, "Error: Result too large"
+        except asyncio.TimeoutError:
+            return False, f"Error: Calculation exceeded the {self.timeout:g} second time limit"
         except ValueError as e:
-            return f"Error: {str(e)}"
+            return False, f"Error: {str(e)}"
         except Exception as e:
-            return f"Error evaluating expression: {str(e)}"
+            return False, f"Error evaluating expression: {str(e)}"
+    
+    async def _evaluate_in_pool(self, expression: str, mode: str, variables: Dict[str, Any]) -> Any:
+        """Evaluate in a worker process, killing the pool if the time limit passes."""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        pool = self._pool
+        try:
+            future = asyncio.get_running_loop().run_in_executor(pool, evaluate, expression, variables, mode)
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Calculation timed out after {self.timeout}s; restarting worker pool: {expression[:100]}")
+            self._terminate(pool)
+            raise
+        except BrokenProcessPool:
+            # A worker died, e.g. killed by another caller's timeout
+            self._terminate(pool)
+            raise ValueError("Calculation was interrupted; please retry") from None
+    
+    def _terminate(self, pool: ProcessPoolExecutor) -> None:
+        """Hard-stop a pool's workers; the next heavy evaluation starts a fresh pool."""
+        if self._pool is pool:
+            self._pool = None
+        # The executor has no public way to stop a running task
+        for process in list(getattr(pool, "_processes", {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+    
+    async def close(self) -> None:
+        """Shut down the worker process pool."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
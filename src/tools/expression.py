@@ -0,0 +1,619 @@
+"""
+Compile arithmetic expressions into cached, resource-bounded closure-based evaluators.
+"""
+import ast
+import decimal
+import functools
+import math
+import operator
+import re
+from contextvars import ContextVar
+from decimal import Decimal
+from fractions import Fraction
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from src.tools import array_math
+from src.tools.array_math import REDUCTIONS, VECTOR_FUNCTIONS, is_sequence, reduction
+
+# A compiled node: evaluates against a mapping of variable values
+Evaluator = Callable[[Mapping[str, Any]], Any]
+
+# Resource limits for a single expression
+MAX_EXPRESSION_LENGTH = 2000
+MAX_NODES = 256
+MAX_RESULT_BITS = 128 * 1024  # about 39,000 decimal digits
+MAX_FACTORIAL = 5000
+MAX_ELEMENTS = 5_000_000
+
+# Budgets for the current evaluation; callers may lower them with ``evaluate(max_bits=..., max_elements=...)``
+_bit_budget: ContextVar[int] = ContextVar("bit_budget", default=MAX_RESULT_BITS)
+_element_budget: ContextVar[int] = ContextVar("element_budget", default=MAX_ELEMENTS)
+# Values looped over so far by all generators of the current evaluation, nested ones included
+_elements_used: ContextVar[Optional[List[int]]] = ContextVar("elements_used", default=None)
+# Optional cap on the work of the current evaluation, and the work done so far
+_operation_budget: ContextVar[Optional[int]] = ContextVar("operation_budget", default=None)
+_operations_used: ContextVar[Optional[List[float]]] = ContextVar("operations_used", default=None)
+
+# Working precision for decimal mode
+DECIMAL_PRECISION = 50
+
+MODES = ("float", "decimal", "fraction")
+
+def _magnitude_bits(value: Any) -> float:
+    """Approximate log2 of an exact number's size; 0 for types whose cost is bounded."""
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, int):
+        return value.bit_length()
+    if isinstance(value, Fraction):
+        return max(value.numerator.bit_length(), value.denominator.bit_length())
+    # Floats and complex overflow on their own; decimals are held to DECIMAL_PRECISION digits
+    return 0
+
+class BudgetExceeded(ValueError):
+    """The work would exceed a caller's reduced budget but is within the hard limit."""
+
+# Results this small are never worth checking against a budget
+_SMALL_BITS = 64
+
+def _charge_operations(count: float) -> None:
+    """Count work against the caller's operation budget, if one is set."""
+    budget = _operation_budget.get()
+    used = _operations_used.get()
+    if budget is None or used is None:
+        return
+    used[0] += count
+    if used[0] > budget:
+        raise BudgetExceeded(f"About {int(used[0]):,} operations")
+
+def _check_bits(bits: float) -> None:
+    if bits > MAX_RESULT_BITS:
+        raise ValueError(f"Result too large (about {int(bits * 0.30103):,} digits)")
+    if bits > _bit_budget.get():
+        raise BudgetExceeded(f"Result needs about {int(bits):,} bits")
+    # Big-number arithmetic costs roughly one operation per machine word
+    _charge_operations(bits / _SMALL_BITS)
+
+def _check_elements(count: int) -> None:
+    if count > MAX_ELEMENTS:
+        raise ValueError(f"Sequence too long ({count:,} values; limit {MAX_ELEMENTS:,})")
+    if count > _element_budget.get():
+        raise BudgetExceeded(f"Sequence of {count:,} values")
+
+def _charge_elements(count: int) -> None:
+    """Count a generator's values against the running total of the whole evaluation."""
+    _check_elements(count)
+    used = _elements_used.get()
+    if used is None:
+        return
+    used[0] += count
+    if used[0] > MAX_ELEMENTS:
+        raise ValueError(f"Generators would loop over {used[0]:,} values in total (limit {MAX_ELEMENTS:,})")
+    if used[0] > _element_budget.get():
+        raise BudgetExceeded(f"Generators loop over {used[0]:,} values in total")
+
+def guarded_pow(base: Any, exponent: Any) -> Any:
+    """Exponentiation that refuses results too large to compute cheaply."""
+    # Fast paths for the common shapes inside generator loops
+    if type(base) is float:
+        return base ** exponent  # float powers overflow on their own
+    if type(base) is int and type(exponent) is int:
+        # A negative exponent gives a float, which cannot grow large
+        if exponent > 0 and base.bit_length() * exponent > _SMALL_BITS:
+            _check_bits(base.bit_length() * exponent)
+        return base ** exponent
+    base_bits = _magnitude_bits(base)
+    if base_bits > 1 and isinstance(exponent, (int, Fraction, Decimal)) and not isinstance(exponent, bool):
+        # Exact bases keep their size under negative exponents; integer bases then give a float or decimal
+        if exponent >= 0 or isinstance(base, Fraction) or isinstance(exponent, Fraction):
+            _check_bits(base_bits * abs(float(exponent)))
+    return operator.pow(base, exponent)
+
+def _guard_exact(op: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+    """Wrap ``+``, ``-`` or ``/`` so results over a common denominator are size-checked."""
+    def guarded(left: Any, right: Any) -> Any:
+        if type(left) is Fraction or type(right) is Fraction:
+            # Both numerator and denominator can grow to the sum of the operands' sizes
+            bits = _magnitude_bits(left) + _magnitude_bits(right)
+            if bits > _SMALL_BITS:
+                _check_bits(bits)
+        return op(left, right)
+    guarded.__name__ = f"guarded_{op.__name__}"
+    return guarded
+
+guarded_add = _guard_exact(operator.add)
+guarded_sub = _guard_exact(operator.sub)
+guarded_div = _guard_exact(operator.truediv)
+
+def guarded_mul(left: Any, right: Any) -> Any:
+    """Multiplication that refuses exact results too large to compute cheaply."""
+    if type(left) is float or type(right) is float:
+        return left * right
+    if type(left) is int and type(right) is int:
+        if left.bit_length() + right.bit_length() > _SMALL_BITS:
+            _check_bits(left.bit_length() + right.bit_length())
+        return left * right
+    if isinstance(left, (list, range)) or isinstance(right, (list, range)):
+        # Repetition would sidestep the element limit
+        raise ValueError("Lists cannot be multiplied; use a generator such as (x * 2 for x in values)")
+    bits = _magnitude_bits(left) + _magnitude_bits(right)
+    if bits > _SMALL_BITS:
+        _check_bits(bits)
+    return operator.mul(left, right)
+
+def guarded_factorial(n: Any) -> int:
+    """Factorial limited to ``MAX_FACTORIAL``."""
+    if n > MAX_FACTORIAL:
+        raise ValueError(f"factorial() argument too large (limit {MAX_FACTORIAL})")
+    # log2(n!) < n * log2(n)
+    if n > 2:
+        _check_bits(n * math.log2(n))
+    return math.factorial(n)
+
+def _whole(value: Any) -> int:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, (float, Decimal, Fraction)) and value == int(value):
+        return int(value)
+    raise ValueError(f"Range bounds must be whole numbers, not {value}")
+
+def seq(start: Any, stop: Any, step: Any = 1) -> range:
+    """Inclusive integer range; ``a..b`` in an expression is ``seq(a, b)``."""
+    start, stop, step = _whole(start), _whole(stop), _whole(step)
+    if step == 0:
+        raise ValueError("Range step must not be zero")
+    values = range(start, stop + (1 if step > 0 else -1), step)
+    _check_elements(len(values))
+    return values
+
+def guarded_prod(values: Any) -> Any:
+    """Product of a sequence with the same size guard as ``*``."""
+    return functools.reduce(guarded_mul, values, 1)
+
+def _has_fractions(values: Any) -> bool:
+    return isinstance(values, (list, tuple)) and any(type(value) is Fraction for value in values)
+
+def guarded_sum(values: Any) -> Any:
+    """Sum of a sequence, with the size guard of ``+`` when it holds fractions (fraction mode only)."""
+    if _has_fractions(values):
+        return functools.reduce(guarded_add, values, 0)
+    return sum(values)
+
+def _checked_statistic(statistic: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a reduction so fractions are first summed under the size guard, bounding its exact arithmetic."""
+    def checked(*args):
+        values = args[0] if len(args) == 1 and is_sequence(args[0]) else args
+        if _has_fractions(values):
+            guarded_sum(values)
+        return statistic(*args)
+    return checked
+
+# log2(10): bits per decimal digit
+_BITS_PER_DIGIT = 3.3219
+
+def guarded_round(value: Any, digits: Any = 0) -> Any:
+    """round() that refuses exact results whose scale factor ``10 ** digits`` is too large."""
+    if isinstance(value, Fraction) or (type(value) is int and digits < 0):
+        bits = abs(float(digits)) * _BITS_PER_DIGIT + _magnitude_bits(value)
+        if bits > _SMALL_BITS:
+            _check_bits(bits)
+    return round(value, digits)
+
+BINARY_OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: guarded_mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: guarded_pow,
+    ast.BitXor: operator.xor,
+    ast.MatMult: seq,  # ``a..b`` is rewritten to ``a @ b`` before parsing
+}
+
+UNARY_OPERATORS: Dict[type, Callable[[Any], Any]] = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+COMPARE_OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+# Functions that work on any numeric type
+_COMMON_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    "abs": abs,
+    "round": guarded_round,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "factorial": guarded_factorial,
+    "seq": seq,
+    "prod": reduction(guarded_prod, lambda a: a.prod()),
+    **REDUCTIONS,
+}
+
+# Only fraction mode has exact results that grow under addition and division
+FRACTION_BINARY_OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    **BINARY_OPERATORS,
+    ast.Add: guarded_add,
+    ast.Sub: guarded_sub,
+    ast.Div: guarded_div,
+}
+
+FRACTION_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    **_COMMON_FUNCTIONS,
+    "sum": reduction(guarded_sum),
+    **{name: _checked_statistic(REDUCTIONS[name]) for name in ("mean", "stdev", "pstdev", "variance", "pvariance")},
+}
+
+FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    **_COMMON_FUNCTIONS,
+    "sqrt": math.sqrt,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "log": math.log,
+    "log10": math.log10,
+    "log2": math.log2,
+    "exp": math.exp,
+}
+
+DECIMAL_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    **_COMMON_FUNCTIONS,
+    "sqrt": lambda x: Decimal(x).sqrt(),
+    "log": lambda x: Decimal(x).ln(),
+    "log10": lambda x: Decimal(x).log10(),
+    "exp": lambda x: Decimal(x).exp(),
+}
+
+CONSTANTS: Dict[str, Any] = {
+    "pi": math.pi,
+    "e": math.e,
+    "tau": math.tau,
+}
+
+DECIMAL_CONSTANTS: Dict[str, Any] = {
+    "pi": Decimal("3.14159265358979323846264338327950288419716939937511"),
+    "e": Decimal("2.71828182845904523536028747135266249775724709369996"),
+    "tau": Decimal("6.28318530717958647692528676655900576839433879875021"),
+}
+
+def _float_literal(text: str) -> Any:
+    return int(text) if text.isdigit() else float(text)
+
+# Per mode: (functions, constants, literal parser)
+_MODE_TABLES = {
+    "float": (FUNCTIONS, CONSTANTS, _float_literal),
+    "decimal": (DECIMAL_FUNCTIONS, DECIMAL_CONSTANTS, Decimal),
+    "fraction": (FRACTION_FUNCTIONS, {}, Fraction),
+}
+
+# Numeric literals, but not digits inside names such as log10
+_NUMBER = re.compile(r"(?<![\w.])((?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?)(?![\w.])")
+
+# Prefix of the variables that stand in for literals in a template
+_SLOT = "__"
+
+class CompiledExpression:
+    """A validated expression ready to be evaluated repeatedly."""
+
+    __slots__ = ("source", "names", "mode", "_evaluate")
+
+    def __init__(self, source: str, names: Tuple[str, ...], mode: str, evaluate: Evaluator):
+        self.source = source
+        self.names = names  # free variables the expression needs
+        self.mode = mode
+        self._evaluate = evaluate
+
+    def evaluate(self, variables: Optional[Mapping[str, Any]] = None) -> Any:
+        """Evaluate with the given variable values."""
+        token = _elements_used.set([0])
+        operations_token = _operations_used.set([0.0])
+        try:
+            if self.mode == "decimal":
+                with decimal.localcontext() as context:
+                    context.prec = DECIMAL_PRECISION
+                    return self._evaluate(variables or {})
+            return self._evaluate(variables or {})
+        finally:
+            _operations_used.reset(operations_token)
+            _elements_used.reset(token)
+
+def _expand_ranges(source: str) -> str:
+    """Rewrite the ``a..b`` range syntax as the ``@`` operator, which binds like ``*``."""
+    return source.replace("..", " @ ")
+
+class _Compiler:
+    """Turns a parsed expression into nested closures, rejecting anything unsafe."""
+
+    def __init__(self, mode: str, vector: bool = False):
+        self.mode = mode
+        self.functions, self.constants, self.literal = _MODE_TABLES[mode]
+        self.operators = FRACTION_BINARY_OPERATORS if mode == "fraction" else BINARY_OPERATORS
+        # A vector compiler builds whole-array kernels for generator elements
+        self.vector = vector
+        if vector:
+            self.functions = VECTOR_FUNCTIONS
+        self.names = []
+        self.bound = set()  # generator loop variables in scope
+        self.nodes = 0
+
+    def compile(self, node: ast.AST) -> Evaluator:
+        self.nodes += 1
+        if self.nodes > MAX_NODES:
+            raise ValueError(f"Expression too complex (more than {MAX_NODES} operations)")
+        method = getattr(self, f"_compile_{type(node).__name__}", None)
+        if method is None:
+            raise ValueError(f"Operation {type(node)} not allowed")
+        return method(node)
+
+    def _compile_Constant(self, node: ast.Constant) -> Evaluator:
+        value = node.value
+        if isinstance(value, bool) or not isinstance(value, (int, float, complex)):
+            raise ValueError(f"Constant {value!r} not allowed")
+        if self.mode != "float":
+            if isinstance(value, complex):
+                raise ValueError(f"Complex numbers are not supported in {self.mode} mode")
+            value = self.literal(value)
+        return lambda env: value
+
+    def _compile_Name(self, node: ast.Name) -> Evaluator:
+        name = node.id
+        if name in self.constants:
+            value = self.constants[name]
+            return lambda env: value
+        if name in CONSTANTS:
+            raise ValueError(f"Constant '{name}' is not available in {self.mode} mode")
+        if name not in self.names and name not in self.bound:
+            self.names.append(name)
+
+        def lookup(env):
+            try:
+                return env[name]
+            except KeyError:
+                raise ValueError(f"Name '{name}' not allowed") from None
+        return lookup
+
+    def _compile_BinOp(self, node: ast.BinOp) -> Evaluator:
+        op = self.operators.get(type(node.op))
+        if op is None:
+            raise ValueError(f"Operation {type(node.op)} not allowed")
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        return lambda env: op(left(env), right(env))
+
+    def _compile_UnaryOp(self, node: ast.UnaryOp) -> Evaluator:
+        op = UNARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise ValueError(f"Operation {type(node.op)} not allowed")
+        operand = self.compile(node.operand)
+        return lambda env: op(operand(env))
+
+    def _compile_Compare(self, node: ast.Compare) -> Evaluator:
+        if self.vector and len(node.ops) > 1:
+            raise ValueError("Chained comparisons are not vectorized")
+        ops = []
+        for op_node in node.ops:
+            op = COMPARE_OPERATORS.get(type(op_node))
+            if op is None:
+                raise ValueError(f"Operation {type(op_node)} not allowed")
+            ops.append(op)
+        operands = [self.compile(operand) for operand in (node.left, *node.comparators)]
+        if len(ops) == 1:
+            op, left, right = ops[0], operands[0], operands[1]
+            return lambda env: op(left(env), right(env))
+
+        def compare(env):
+            left = operands[0](env)
+            for op, operand in zip(ops, operands[1:]):
+                right = operand(env)
+                if not op(left, right):
+                    return False
+                left = right
+            return True
+        return compare
+
+    def _compile_List(self, node: ast.List) -> Evaluator:
+        if self.vector:
+            raise ValueError("Lists are not vectorized")
+        items = [self.compile(item) for item in node.elts]
+        return lambda env: [item(env) for item in items]
+
+    _compile_Tuple = _compile_List
+
+    def _compile_GeneratorExp(self, node: ast.GeneratorExp) -> Evaluator:
+        if self.vector:
+            raise ValueError("Nested generators are not vectorized")
+        if len(node.generators) != 1:
+            raise ValueError("Only one 'for' clause is allowed per generator")
+        generator = node.generators[0]
+        if not isinstance(generator.target, ast.Name) or generator.is_async:
+            raise ValueError("Generators must loop over a single name")
+        target = generator.target.id
+        if target in self.constants or target in self.bound:
+            raise ValueError(f"Cannot use '{target}' as a loop variable")
+
+        iterable = self.compile(generator.iter)
+        self.bound.add(target)
+        start = self.nodes
+        element = self.compile(node.elt)
+        conditions = [self.compile(condition) for condition in generator.ifs]
+        # Operations evaluated per value looped over
+        cost = self.nodes - start
+        self.bound.discard(target)
+        kernel = self._vector_kernel(node, target)
+
+        def loop(env):
+            values = iterable(env)
+            if not is_sequence(values):
+                raise ValueError("Generators can only loop over a range or a list")
+            _charge_elements(len(values))
+            if kernel is not None:
+                result = kernel(env, values)
+                if result is not None:
+                    return result
+            _charge_operations(len(values) * cost)
+            scope = dict(env)
+
+            def bind(value):
+                scope[target] = value
+                for condition in conditions:
+                    if not condition(scope):
+                        return False
+                return True
+            # bind() leaves the scope set for the element that follows it
+            return [element(scope) for value in values if bind(value)]
+        return loop
+
+    _compile_ListComp = _compile_GeneratorExp
+
+    def _vector_kernel(self, node: ast.GeneratorExp, target: str) -> Optional[Callable[[Mapping[str, Any], Any], Any]]:
+        """Compile the element and filters as whole-array operations, if NumPy and the functions allow it."""
+        if array_math.np is None or self.mode != "float":
+            return None
+        compiler = _Compiler(self.mode, vector=True)
+        compiler.bound = self.bound | {target}
+        try:
+            element = compiler.compile(node.elt)
+            conditions = [compiler.compile(condition) for condition in node.generators[0].ifs]
+        except ValueError:
+            return None
+        return functools.partial(array_math.vector_loop, target, element, conditions)
+
+    def _compile_Call(self, node: ast.Call) -> Evaluator:
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise ValueError("Only plain calls to math functions are allowed")
+        func = self.functions.get(node.func.id)
+        if func is None:
+            if node.func.id in FUNCTIONS:
+                raise ValueError(f"Function '{node.func.id}' is not available in {self.mode} mode")
+            raise ValueError(f"Function '{node.func.id}' not allowed")
+
+        args = tuple(self.compile(arg) for arg in node.args)
+        if len(args) == 1:
+            arg = args[0]
+            return lambda env: func(arg(env))
+        return lambda env: func(*[arg(env) for arg in args])
+
+@lru_cache(maxsize=1024)
+def compile_expression(source: str, mode: str = "float") -> CompiledExpression:
+    """
+    Parse and compile an expression, memoized by its text and mode.
+
+    Args:
+        source: Expression text
+        mode: "float" (default), "decimal" for 50-digit decimal arithmetic,
+            or "fraction" for exact rational arithmetic
+
+    Raises:
+        ValueError: If the expression uses anything outside the allowed
+            operators, functions and constants, or exceeds the size limits
+        SyntaxError: If the expression does not parse
+    """
+    if mode not in _MODE_TABLES:
+        raise ValueError(f"Unknown mode '{mode}'; use one of {', '.join(MODES)}")
+    if len(source) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"Expression too long (limit {MAX_EXPRESSION_LENGTH} characters)")
+    tree = ast.parse(_expand_ranges(source).strip(), mode="eval")
+    compiler = _Compiler(mode)
+    evaluate = compiler.compile(tree.body)
+    return CompiledExpression(source, tuple(compiler.names), mode, evaluate)
+
+def template(source: str, mode: str = "float") -> Tuple[str, Dict[str, Any]]:
+    """
+    Replace numeric literals with slot variables.
+
+    ``"2 * x + 10"`` becomes ``("__0 * x + __1", {"__0": 2, "__1": 10})``,
+    so expressions that differ only in their numbers share one compiled
+    evaluator. Literals are parsed as the mode's number type.
+    """
+    if _SLOT in source:
+        return source, {}
+    # Splitting on the capturing pattern alternates text and literals
+    pieces = _NUMBER.split(_expand_ranges(source).strip())
+    if len(pieces) == 1:
+        return pieces[0], {}
+
+    literal = _MODE_TABLES[mode][2] if mode in _MODE_TABLES else _float_literal
+    values = {}
+    for i in range(1, len(pieces), 2):
+        name = f"{_SLOT}{i // 2}"
+        values[name] = literal(pieces[i])
+        pieces[i] = name
+    return "".join(pieces), values
+
+@lru_cache(maxsize=4096)
+def prepare(source: str, mode: str = "float") -> Tuple[CompiledExpression, Tuple[Tuple[str, Any], ...]]:
+    """Template and compile an expression; exact repeats skip even the templating."""
+    if len(source) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"Expression too long (limit {MAX_EXPRESSION_LENGTH} characters)")
+    text, values = template(source, mode)
+    return compile_expression(text, mode), tuple(values.items())
+
+def evaluate(source: str, variables: Optional[Mapping[str, Any]] = None, mode: str = "float",
+             max_bits: Optional[int] = None, max_elements: Optional[int] = None,
+             max_operations: Optional[int] = None) -> Any:
+    """
+    Evaluate an expression through the compiled-template cache.
+
+    Args:
+        source: Expression text
+        variables: Values for any free names the expression uses
+        mode: Number type to evaluate with (see ``compile_expression``)
+        max_bits: Lower size budget for exact intermediate results; going
+            over it raises ``BudgetExceeded`` before the work is done
+        max_elements: Lower budget for the length of ranges and lists that
+            generators loop over, enforced the same way
+        max_operations: Budget for the evaluation's work, counted as
+            operations per generator value plus big-number words; going over
+            it raises ``BudgetExceeded`` part way through (unlimited if None)
+
+    Returns:
+        The result
+    """
+    compiled, literals = prepare(source, mode)
+    values = dict(literals)
+    if variables:
+        values.update(variables)
+    if max_bits is None and max_elements is None and max_operations is None:
+        return compiled.evaluate(values)
+
+    bits_token = _bit_budget.set(MAX_RESULT_BITS if max_bits is None else max_bits)
+    elements_token = _element_budget.set(MAX_ELEMENTS if max_elements is None else max_elements)
+    operations_token = _operation_budget.set(max_operations)
+    try:
+        return compiled.evaluate(values)
+    finally:
+        _operation_budget.reset(operations_token)
+        _element_budget.reset(elements_token)
+        _bit_budget.reset(bits_token)
+
+def format_result(value: Any, max_digits: int = 1000) -> str:
+    """Format a result, abbreviating integers (and fraction parts) longer than ``max_digits`` digits and long sequences."""
+    if is_sequence(value):
+        return array_math.format_sequence(value, format_item=lambda item: format_result(item, max_digits))
+    if isinstance(value, Fraction) and value.denominator != 1:
+        return f"{format_result(value.numerator, max_digits)}/{format_result(value.denominator, max_digits)}"
+    if isinstance(value, Fraction):
+        value = value.numerator
+    if isinstance(value, int) and not isinstance(value, bool) and value.bit_length() > max_digits * 3.33:
+        magnitude = abs(value)
+        digits = int(math.log10(magnitude)) + 1
+        # The float logarithm can be off by one right at a power of ten
+        if magnitude >= 10 ** digits:
+            digits += 1
+        elif magnitude < 10 ** (digits - 1):
+            digits -= 1
+        leading = str(magnitude // 10 ** (digits - 16))
+        sign = "-" if value < 0 else ""
+        return f"{sign}{leading[0]}.{leading[1:]}e+{digits - 1} ({digits:,} digits)"
+    return str(value)
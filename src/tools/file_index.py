@@ -0,0 +1,511 @@
+"""
+Incrementally maintained index of a directory tree for fast file search.
+"""
+import asyncio
+import fnmatch
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from src.tools.base import Tool
+
+logger = logging.getLogger(__name__)
+
+# Directories that are never worth indexing
+IGNORED_DIRS = frozenset({
+    ".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv",
+    ".mypy_cache", ".pytest_cache", ".tox"
+})
+
+_WILDCARDS = set("*?[")
+
+# Trigrams are taken from word runs only, which keeps the index small
+_WORD = re.compile(r"\w{3,}")
+
+class FileInfo(NamedTuple):
+    """Size and modification time of an indexed file."""
+    size: int
+    mtime_ns: int
+
+class _DirNode:
+    """Trie node for one directory; children are keyed by path component."""
+
+    __slots__ = ("mtime_ns", "files", "children")
+
+    def __init__(self):
+        self.mtime_ns = -1  # never scanned
+        self.files: Dict[str, FileInfo] = {}
+        self.children: Dict[str, "_DirNode"] = {}
+
+def _trigrams(text: str) -> Set[str]:
+    """Trigrams of the word runs in already lowercased text."""
+    grams: Set[str] = set()
+    for word in set(_WORD.findall(text)):
+        grams.update([word[i:i + 3] for i in range(len(word) - 2)])
+    return grams
+
+class _Snapshot:
+    """
+    A complete, never-modified state of the index.
+
+    Refreshes build the next snapshot alongside the current one, sharing
+    every directory node and posting set that did not change, and swap it
+    in with a single assignment; readers keep whichever snapshot they
+    started with.
+    """
+
+    __slots__ = ("tree", "postings", "contents", "unindexed", "files", "content_bytes", "truncated")
+
+    def __init__(self, tree: _DirNode, postings: Dict[str, Set[str]], contents: Dict[str, Tuple[int, frozenset]],
+                 unindexed: frozenset, files: int, content_bytes: int, truncated: bool):
+        self.tree = tree
+        self.postings = postings
+        self.contents = contents  # path -> (size, trigrams) of content-indexed files
+        self.unindexed = unindexed  # text files skipped once the byte budget ran out
+        self.files = files
+        self.content_bytes = content_bytes
+        self.truncated = truncated
+
+_EMPTY = _Snapshot(_DirNode(), {}, {}, frozenset(), 0, 0, False)
+
+class _Build:
+    """Mutable working state of one refresh, copied on write from the previous snapshot."""
+
+    def __init__(self, previous: _Snapshot):
+        self.postings = dict(previous.postings)
+        self.contents = dict(previous.contents)
+        self.unindexed = set(previous.unindexed)
+        self.content_bytes = previous.content_bytes
+        self.files = 0
+        self.truncated = False
+        self._copied: Set[str] = set()
+
+    def posting(self, gram: str) -> Set[str]:
+        """The gram's posting set, copied before its first change in this refresh."""
+        if gram not in self._copied:
+            self._copied.add(gram)
+            self.postings[gram] = set(self.postings.get(gram, ()))
+        return self.postings[gram]
+
+    def snapshot(self, tree: _DirNode) -> _Snapshot:
+        postings = {gram: paths for gram, paths in self.postings.items() if paths}
+        return _Snapshot(tree, postings, self.contents, frozenset(self.unindexed),
+                         self.files, self.content_bytes, self.truncated)
+
+class FileIndex:
+    """
+    Path trie of a directory tree with sizes, mtimes and optional trigram index.
+
+    ``refresh`` only re-lists directories whose mtime changed and only
+    re-reads files whose size or mtime changed, so keeping the index
+    current costs a stat per entry rather than a full rebuild. With
+    ``content_index`` enabled, every text file up to ``max_content_bytes``
+    has the lowercased trigrams of its words recorded, and substring
+    searches only open files that contain all of the query's trigrams.
+
+    Each refresh produces a new immutable snapshot, so searches may run
+    while another thread refreshes. At most ``max_files`` files are
+    listed and ``max_index_bytes`` bytes of content indexed; past those
+    limits the index is marked truncated.
+    """
+
+    def __init__(self, root: str, content_index: bool = True, max_content_bytes: int = 256 * 1024,
+                 ignored_dirs: frozenset = IGNORED_DIRS, max_files: int = 100_000,
+                 max_index_bytes: int = 64 * 1024 * 1024):
+        """
+        Initialize an empty index; call ``refresh`` to populate it.
+
+        Args:
+            root: Directory to index
+            content_index: Maintain the trigram index for content searches
+            max_content_bytes: Larger files are not searched by content
+            ignored_dirs: Directory names to skip entirely
+            max_files: Most files listed; the rest of the tree is left out
+            max_index_bytes: Most file content trigram-indexed; later text
+                files are still searched, just without the index
+        """
+        self.root = os.path.abspath(root)
+        self.content_index = content_index
+        self.max_content_bytes = max_content_bytes
+        self.ignored_dirs = ignored_dirs
+        self.max_files = max_files
+        self.max_index_bytes = max_index_bytes
+        self.last_refresh = 0.0
+        self.dirs_scanned = 0
+        self.files_indexed = 0
+        self._snapshot = _EMPTY
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Bring the index up to date with the file system."""
+        with self._refresh_lock:
+            build = _Build(self._snapshot)
+            tree = self._refresh_node(self._snapshot.tree, self.root, "", build)
+            if build.truncated and not self._snapshot.truncated:
+                logger.warning(f"Index of {self.root} truncated at {self.max_files:,} files")
+            self._snapshot = build.snapshot(tree)
+            self.last_refresh = time.monotonic()
+
+    def iter_files(self, prefix: str = "") -> Iterator[Tuple[str, FileInfo]]:
+        """Yield ``(relative path, info)`` for files under a relative directory prefix."""
+        return self._iter_files(self._snapshot.tree, prefix)
+
+    def glob(self, pattern: str) -> Iterator[Tuple[str, FileInfo]]:
+        """
+        Yield files whose relative path matches a glob pattern.
+
+        Patterns without a ``/`` match file names anywhere in the tree, and
+        patterns without wildcards match as a substring of the path. A
+        literal leading directory (``src/tools/*.py``) narrows the walk to
+        that subtree.
+        """
+        return self._glob(self._snapshot.tree, pattern)
+
+    def _iter_files(self, tree: _DirNode, prefix: str = "") -> Iterator[Tuple[str, FileInfo]]:
+        node = tree
+        parts = [part for part in prefix.split("/") if part]
+        for part in parts:
+            node = node.children.get(part)
+            if node is None:
+                return
+        yield from self._walk(node, "/".join(parts))
+
+    def _glob(self, tree: _DirNode, pattern: str) -> Iterator[Tuple[str, FileInfo]]:
+        pattern = pattern.strip()
+        if pattern.startswith("./"):
+            pattern = pattern[2:]
+        if not _WILDCARDS & set(pattern):
+            needle = pattern.lower()
+            for path, info in self._iter_files(tree):
+                if needle in path.lower():
+                    yield path, info
+            return
+
+        if "/" not in pattern:
+            for path, info in self._iter_files(tree):
+                if fnmatch.fnmatch(path.rsplit("/", 1)[-1], pattern):
+                    yield path, info
+            return
+
+        parts = pattern.split("/")
+        prefix = []
+        for part in parts[:-1]:
+            if _WILDCARDS & set(part):
+                break
+            prefix.append(part)
+        # "**/" may also match zero directories
+        alternatives = {pattern, pattern.replace("**/", "")}
+        for path, info in self._iter_files(tree, "/".join(prefix)):
+            if any(fnmatch.fnmatch(path, alternative) for alternative in alternatives):
+                yield path, info
+
+    def search_content(self, query: str, pattern: Optional[str] = None,
+                       max_results: int = 50) -> List[Tuple[str, int, str]]:
+        """
+        Find lines containing ``query`` (case-insensitive).
+
+        Args:
+            query: Text to look for
+            pattern: Optional glob restricting which files are searched
+            max_results: Maximum number of matching lines to return
+
+        Returns:
+            ``(relative path, line number, line)`` tuples
+        """
+        snapshot = self._snapshot
+        needle = query.lower()
+        files = self._glob(snapshot.tree, pattern) if pattern else self._iter_files(snapshot.tree)
+        candidates = [path for path, info in files if info.size <= self.max_content_bytes]
+
+        grams = _trigrams(needle) if self.content_index else set()
+        if grams:
+            # Every word trigram of the query occurs inside some word of a matching file
+            postings = sorted((snapshot.postings.get(gram, set()) for gram in grams), key=len)
+            matching = set.intersection(*postings)
+            candidates = [path for path in candidates if path in matching or path in snapshot.unindexed]
+
+        results = []
+        for path in sorted(candidates):
+            try:
+                with open(os.path.join(self.root, path), encoding="utf-8", errors="replace") as file:
+                    for number, line in enumerate(file, 1):
+                        if needle in line.lower():
+                            results.append((path, number, line.rstrip("\n")))
+                            if len(results) >= max_results:
+                                return results
+            except OSError:
+                continue
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Return index size and maintenance counters."""
+        snapshot = self._snapshot
+        return {
+            "files": snapshot.files,
+            "trigrams": len(snapshot.postings),
+            "content_bytes": snapshot.content_bytes,
+            "truncated": snapshot.truncated,
+            "dirs_scanned": self.dirs_scanned,
+            "files_indexed": self.files_indexed
+        }
+
+    def _walk(self, node: _DirNode, rel_path: str) -> Iterator[Tuple[str, FileInfo]]:
+        base = f"{rel_path}/" if rel_path else ""
+        for name in sorted(node.files):
+            yield base + name, node.files[name]
+        for name in sorted(node.children):
+            yield from self._walk(node.children[name], base + name)
+
+    def _refresh_node(self, old: _DirNode, abs_path: str, rel_path: str, build: _Build) -> _DirNode:
+        """Return ``old`` if nothing under it changed, otherwise a new node; ``old`` is never modified."""
+        base = f"{rel_path}/" if rel_path else ""
+        try:
+            mtime_ns = os.stat(abs_path).st_mtime_ns if not build.truncated else None
+        except OSError:
+            mtime_ns = None
+
+        if mtime_ns is None:
+            # Gone, or past the file limit
+            self._drop_subtree(old, rel_path, build)
+            return _DirNode() if old.files or old.children or old.mtime_ns != -1 else old
+
+        files = old.files
+        subdirs = old.children.keys()
+        if mtime_ns != old.mtime_ns:
+            # Entries were added, removed or renamed: re-list this directory
+            self.dirs_scanned += 1
+            files = {}
+            subdirs = set()
+            try:
+                with os.scandir(abs_path) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if entry.name not in self.ignored_dirs:
+                                    subdirs.add(entry.name)
+                            elif entry.is_file(follow_symlinks=False):
+                                stat = entry.stat(follow_symlinks=False)
+                                files[entry.name] = FileInfo(stat.st_size, stat.st_mtime_ns)
+                        except OSError:
+                            continue
+            except OSError as e:
+                logger.debug(f"Cannot scan {abs_path}: {e}")
+        else:
+            # Same entries; only file contents may have changed
+            for name, info in old.files.items():
+                try:
+                    stat = os.stat(os.path.join(abs_path, name))
+                except OSError:
+                    continue
+                current = FileInfo(stat.st_size, stat.st_mtime_ns)
+                if current != info:
+                    if files is old.files:
+                        files = dict(old.files)
+                    files[name] = current
+
+        room = self.max_files - build.files
+        if len(files) > room:
+            build.truncated = True
+            files = {name: files[name] for name in sorted(files)[:max(room, 0)]}
+            # Rescan next time in case room has been freed
+            mtime_ns = -1
+        build.files += len(files)
+
+        if files is not old.files:
+            for name in old.files.keys() - files.keys():
+                self._drop_content(base + name, build)
+            for name, info in files.items():
+                if old.files.get(name) != info:
+                    self._index_content(base + name, info, build)
+
+        children = {}
+        for name in sorted(subdirs):
+            previous = old.children.get(name) or _DirNode()
+            children[name] = self._refresh_node(previous, os.path.join(abs_path, name), base + name, build)
+        for name in old.children.keys() - children.keys():
+            self._drop_subtree(old.children[name], base + name, build)
+
+        if (mtime_ns == old.mtime_ns and files is old.files and len(children) == len(old.children)
+                and all(old.children.get(name) is child for name, child in children.items())):
+            return old
+        node = _DirNode()
+        node.mtime_ns = mtime_ns
+        node.files = files
+        node.children = children
+        return node
+
+    def _drop_subtree(self, node: _DirNode, rel_path: str, build: _Build) -> None:
+        for path, _ in self._walk(node, rel_path):
+            self._drop_content(path, build)
+
+    def _index_content(self, path: str, info: FileInfo, build: _Build) -> None:
+        self.files_indexed += 1
+        if not self.content_index:
+            return
+        self._drop_content(path, build)
+        if info.size > self.max_content_bytes:
+            return
+        if build.content_bytes + info.size > self.max_index_bytes:
+            build.unindexed.add(path)
+            build.truncated = True
+            return
+        try:
+            with open(os.path.join(self.root, path), "rb") as file:
+                data = file.read(self.max_content_bytes)
+        except OSError:
+            return
+        if b"\0" in data[:8192]:
+            return  # binary
+
+        grams = frozenset(_trigrams(data.decode("utf-8", errors="replace").lower()))
+        build.contents[path] = (len(data), grams)
+        build.content_bytes += len(data)
+        for gram in grams:
+            build.posting(gram).add(path)
+
+    def _drop_content(self, path: str, build: _Build) -> None:
+        build.unindexed.discard(path)
+        entry = build.contents.pop(path, None)
+        if entry is None:
+            return
+        size, grams = entry
+        build.content_bytes -= size
+        for gram in grams:
+            build.posting(gram).discard(path)
+
+class SearchFilesTool(Tool):
+    """Tool for finding files by glob/substring and searching their contents."""
+
+    read_only = True
+    max_concurrency = 4
+
+    def __init__(self, content_index: bool = True, refresh_interval: float = 2.0, max_indexes: int = 8,
+                 root: Optional[str] = None, max_files: int = 100_000, max_index_bytes: int = 64 * 1024 * 1024):
+        """
+        Initialize the tool.
+
+        Args:
+            content_index: Build trigram indexes for content searches
+            refresh_interval: Seconds an index is trusted before checking for changes
+            max_indexes: Number of directory indexes kept in memory
+            root: Only directories inside this one may be searched (defaults to the working directory)
+            max_files: Most files listed per index
+            max_index_bytes: Most file content trigram-indexed per index
+        """
+        self.content_index = content_index
+        self.refresh_interval = refresh_interval
+        self.max_indexes = max_indexes
+        self.root = os.path.realpath(root or os.getcwd())
+        self.max_files = max_files
+        self.max_index_bytes = max_index_bytes
+        self._indexes: "OrderedDict[str, FileIndex]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Future] = {}
+
+    @property
+    def name(self) -> str:
+        return "search_files"
+
+    @property
+    def description(self) -> str:
+        return (
+            "Find files under a directory by glob pattern or path substring, "
+            "and optionally search their contents for text"
+        )
+
+    @property
+    def parameters(self) -> Dict[str, Any]:
+        return {
+            "type": "object",
+            "properties": {
+                "directory": {
+                    "type": "string",
+                    "description": "Directory to search",
+                    "default": "."
+                },
+                "pattern": {
+                    "type": "string",
+                    "description": "Glob such as '*.py' or 'src/**/*.md', or a substring of the path"
+                },
+                "query": {
+                    "type": "string",
+                    "description": "Text to find inside files (case-insensitive)"
+                },
+                "max_results": {
+                    "type": "integer",
+                    "description": "Maximum number of results to return",
+                    "default": 50
+                }
+            },
+            "required": []
+        }
+
+    async def execute(self, directory: str = ".", pattern: Optional[str] = None,
+                      query: Optional[str] = None, max_results: int = 50) -> str:
+        """Search the indexed directory."""
+        if not pattern and not query:
+            return "Error searching files: provide a pattern, a query or both"
+        if not os.path.isdir(directory):
+            return f"Directory not found: {directory}"
+        if os.path.commonpath([os.path.realpath(directory), self.root]) != self.root:
+            return f"Error searching files: {directory} is outside {self.root}"
+
+        try:
+            index = await self._get_index(directory)
+            if query:
+                matches = await asyncio.to_thread(index.search_content, query, pattern, max_results)
+                if not matches:
+                    return f"No files under {directory} contain '{query}'"
+                return "\n".join(f"{path}:{number}: {line}" for path, number, line in matches)
+
+            # Matching walks every indexed path, so it runs off the event loop too
+            lines, total = await asyncio.to_thread(self._glob_lines, index, pattern, max_results)
+            if not lines:
+                return f"No files under {directory} match '{pattern}'"
+            if total > len(lines):
+                lines.append(f"... {total - len(lines)} more matches not shown")
+            return "\n".join(lines)
+        except Exception as e:
+            return f"Error searching files: {str(e)}"
+
+    @staticmethod
+    def _glob_lines(index: FileIndex, pattern: str, max_results: int) -> Tuple[List[str], int]:
+        """The first ``max_results`` matches as output lines, and the total number of matches."""
+        lines = []
+        total = 0
+        for path, info in index.glob(pattern):
+            total += 1
+            if len(lines) < max_results:
+                lines.append(f"{path} ({info.size} bytes)")
+        return lines, total
+
+    async def _get_index(self, directory: str) -> FileIndex:
+        """Return the index for a directory, refreshing it if it may be out of date."""
+        root = os.path.realpath(directory)
+        index = self._indexes.get(root)
+        if index is None:
+            index = FileIndex(root, content_index=self.content_index, max_files=self.max_files,
+                              max_index_bytes=self.max_index_bytes)
+            self._indexes[root] = index
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(root)
+
+        if time.monotonic() - index.last_refresh >= self.refresh_interval or not index.last_refresh:
+            # Callers share the refresh in flight; it runs to completion even if they are
+            # cancelled, so a second one never starts alongside it
+            refresh = self._refreshing.get(root)
+            if refresh is None:
+                refresh = asyncio.ensure_future(asyncio.to_thread(index.refresh))
+                self._refreshing[root] = refresh
+                refresh.add_done_callback(lambda done: self._refresh_done(root, done))
+            await asyncio.shield(refresh)
+        return index
+
+    def _refresh_done(self, root: str, refresh: asyncio.Future) -> None:
+        if self._refreshing.get(root) is refresh:
+            del self._refreshing[root]
+        if not refresh.cancelled() and refresh.exception() is not None:
+            logger.warning(f"Refreshing the index of {root} failed: {refresh.exception()}")
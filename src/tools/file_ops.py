@@ -1,13 +1,57 @@
 """
 File operation tools for the agent.
 """
+import asyncio
+import base64
+import bisect
+import fnmatch
+import itertools
+import json
+import mmap
 import os
+from datetime import datetime
 import aiofiles
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from src.tools.base import Tool
 
+# Files at least this large are read through mmap instead of a buffered read
+MMAP_THRESHOLD = 1024 * 1024
+
+# Default cap on the bytes returned by a single read_file call
+DEFAULT_MAX_BYTES = 64 * 1024
+
+def _nth_newline(buf: Any, count: int, start: int = 0) -> int:
+    """Return the offset just past the ``count``-th newline at or after ``start``, or -1."""
+    pos = start
+    for _ in range(count):
+        found = buf.find(b"\n", pos)
+        if found < 0:
+            return -1
+        pos = found + 1
+    return pos
+
+def _nth_newline_from_end(buf: Any, count: int, end: int) -> int:
+    """Return the offset where the last ``count`` lines before ``end`` begin."""
+    pos = end
+    # A trailing newline terminates the last line rather than starting a new one
+    if pos > 0 and buf[pos - 1:pos] == b"\n":
+        pos -= 1
+    for _ in range(count):
+        found = buf.rfind(b"\n", 0, pos)
+        if found < 0:
+            return 0
+        pos = found
+    return pos + 1
+
 class FileReadTool(Tool):
-    """Tool for reading file contents."""
+    """Tool for reading file contents, whole or in bounded ranges."""
+    
+    read_only = True
+    max_concurrency = 8
+    
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """Initialize with the largest number of bytes a single read may return."""
+        self.max_bytes = max_bytes
     
     @property
     def name(self) -> str:
@@ -15,7 +59,10 @@ class FileReadTool(Tool):
     
     @property
     def description(self) -> str:
-        return "Read the contents of a file"
+        return (
+            "Read the contents of a file. Large files are truncated; use a byte range "
+            "(offset/length), a line range (start_line/end_line), head or tail to read part of one"
+        )
     
     @property
     def parameters(self) -> Dict[str, Any]:
@@ -25,21 +72,114 @@ class FileReadTool(Tool):
                 "file_path": {
                     "type": "string",
                     "description": "Path to the file to read"
+                },
+                "offset": {
+                    "type": "integer",
+                    "description": "Byte offset to start reading at"
+                },
+                "length": {
+                    "type": "integer",
+                    "description": "Number of bytes to read from offset"
+                },
+                "start_line": {
+                    "type": "integer",
+                    "description": "First line to read (1-based)"
+                },
+                "end_line": {
+                    "type": "integer",
+                    "description": "Last line to read (inclusive)"
+                },
+                "head": {
+                    "type": "integer",
+                    "description": "Read only the first N lines"
+                },
+                "tail": {
+                    "type": "integer",
+                    "description": "Read only the last N lines"
+                },
+                "max_bytes": {
+                    "type": "integer",
+                    "description": "Maximum number of bytes to return"
                 }
             },
             "required": ["file_path"]
         }
     
-    async def execute(self, file_path: str) -> str:
-        """Read file contents."""
+    async def execute(self, file_path: str, offset: Optional[int] = None, length: Optional[int] = None,
+                      start_line: Optional[int] = None, end_line: Optional[int] = None,
+                      head: Optional[int] = None, tail: Optional[int] = None,
+                      max_bytes: Optional[int] = None) -> str:
+        """Read file contents, or the requested part of them."""
+        modes = [
+            offset is not None or length is not None,
+            start_line is not None or end_line is not None,
+            head is not None,
+            tail is not None
+        ]
+        if sum(modes) > 1:
+            return "Error reading file: use only one of offset/length, start_line/end_line, head or tail"
+        
+        budget = self.max_bytes if max_bytes is None else max(0, min(max_bytes, self.max_bytes))
         try:
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as file:
-                content = await file.read()
-                return content
+            return await asyncio.to_thread(
+                self._read, file_path, offset, length, start_line, end_line, head, tail, budget
+            )
         except FileNotFoundError:
             return f"File not found: {file_path}"
         except Exception as e:
             return f"Error reading file: {str(e)}"
+    
+    def _read(self, file_path: str, offset: Optional[int], length: Optional[int],
+              start_line: Optional[int], end_line: Optional[int], head: Optional[int],
+              tail: Optional[int], budget: int) -> str:
+        """Select the requested range and decode at most ``budget`` bytes of it."""
+        with open(file_path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return ""
+            
+            if size >= MMAP_THRESHOLD:
+                # Only the pages actually touched by the range scan and slice are read in
+                buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buf = file.read()
+            
+            try:
+                start, end = 0, size
+                if offset is not None or length is not None:
+                    start = min(max(offset or 0, 0), size)
+                    end = size if length is None else min(start + max(length, 0), size)
+                elif start_line is not None or end_line is not None:
+                    first = max(start_line or 1, 1)
+                    if first > 1:
+                        start = _nth_newline(buf, first - 1)
+                        if start < 0:
+                            start = size
+                    if end_line is not None:
+                        end = _nth_newline(buf, end_line - first + 1, start) if end_line >= first else start
+                        if end < 0:
+                            end = size
+                elif head is not None:
+                    end = _nth_newline(buf, max(head, 0))
+                    if end < 0:
+                        end = size
+                elif tail is not None:
+                    start = _nth_newline_from_end(buf, tail, size) if tail > 0 else size
+                
+                shown_end = min(end, start + budget)
+                content = buf[start:shown_end].decode("utf-8", errors="replace")
+            finally:
+                if isinstance(buf, mmap.mmap):
+                    buf.close()
+        
+        omitted = size - (shown_end - start)
+        if omitted == 0:
+            return content
+        
+        note = f"[Showing bytes {start}-{shown_end} of {size}; {omitted} bytes omitted"
+        if shown_end < end:
+            note += f"; range truncated at {budget} bytes, continue with offset={shown_end}"
+        return f"{content}\n\n{note}]"
 
 class FileWriteTool(Tool):
     """Tool for writing file contents."""
@@ -81,8 +221,30 @@ class FileWriteTool(Tool):
         except Exception as e:
             return f"Error writing file: {str(e)}"
 
+def _encode_cursor(parts: List[str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(parts).encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> List[str]:
+    parts = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    if not isinstance(parts, list) or not parts or not all(isinstance(part, str) for part in parts):
+        raise ValueError("invalid cursor")
+    return parts
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
 class FileListTool(Tool):
-    """Tool for listing directory contents."""
+    """Tool for listing directory contents, optionally recursively and in pages."""
+    
+    read_only = True
+    max_concurrency = 8
+    
+    # Upper bounds on what a single call may ask for
+    max_depth = 10
+    max_limit = 1000
     
     @property
     def name(self) -> str:
@@ -90,7 +252,10 @@ class FileListTool(Tool):
     
     @property
     def description(self) -> str:
-        return "List files and directories in a path"
+        return (
+            "List files and directories in a path with sizes and modification times. "
+            "Results are paginated; pass the returned cursor to continue"
+        )
     
     @property
     def parameters(self) -> Dict[str, Any]:
@@ -100,33 +265,122 @@ class FileListTool(Tool):
                 "directory_path": {
                     "type": "string",
                     "description": "Path to the directory to list"
+                },
+                "depth": {
+                    "type": "integer",
+                    "description": "How many directory levels to descend (1 lists only the directory itself)",
+                    "default": 1
+                },
+                "pattern": {
+                    "type": "string",
+                    "description": "Only show entries whose name matches this glob, e.g. '*.py'"
+                },
+                "file_type": {
+                    "type": "string",
+                    "description": "Only show files or only directories",
+                    "enum": ["file", "dir", "any"],
+                    "default": "any"
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Maximum number of entries to return",
+                    "default": 200
+                },
+                "cursor": {
+                    "type": "string",
+                    "description": "Cursor from a previous call, to fetch the next page"
                 }
             },
             "required": ["directory_path"]
         }
     
-    async def execute(self, directory_path: str) -> str:
+    async def execute(self, directory_path: str, depth: int = 1, pattern: Optional[str] = None,
+                      file_type: str = "any", limit: int = 200, cursor: Optional[str] = None) -> str:
         """List directory contents."""
         try:
-            items = os.listdir(directory_path)
-            files = []
-            dirs = []
-            
-            for item in items:
-                item_path = os.path.join(directory_path, item)
-                if os.path.isdir(item_path):
-                    dirs.append(f"📁 {item}/")
-                else:
-                    files.append(f"📄 {item}")
-            
-            result = []
-            if dirs:
-                result.append("Directories:")
-                result.extend(dirs)
-            if files:
-                result.append("Files:")
-                result.extend(files)
-            
-            return "\n".join(result) if result else "Directory is empty"
+            resume = _decode_cursor(cursor) if cursor else None
+        except Exception:
+            return "Error listing directory: invalid cursor"
+        
+        if file_type not in ("file", "dir", "any"):
+            return f"Error listing directory: file_type must be 'file', 'dir' or 'any', not '{file_type}'"
+        
+        depth = max(1, min(depth, self.max_depth))
+        limit = max(1, min(limit, self.max_limit))
+        try:
+            return await asyncio.to_thread(self._list, directory_path, depth, pattern, file_type, limit, resume)
         except Exception as e:
             return f"Error listing directory: {str(e)}"
+    
+    def _list(self, directory_path: str, depth: int, pattern: Optional[str], file_type: str,
+              limit: int, resume: Optional[List[str]]) -> str:
+        """Collect one page of entries from the depth-first walk."""
+        if not os.path.isdir(directory_path):
+            raise NotADirectoryError(f"Not a directory: {directory_path}")
+        
+        entries = self._walk(directory_path, [], depth, resume)
+        entries = (
+            (parts, entry) for parts, entry in entries
+            if (file_type == "any" or (file_type == "dir") == entry.is_dir(follow_symlinks=False))
+            and (not pattern or fnmatch.fnmatch(entry.name, pattern))
+        )
+        
+        # Take one extra entry to learn whether another page exists
+        page = list(itertools.islice(entries, limit + 1))
+        more = len(page) > limit
+        page = page[:limit]
+        
+        lines = [self._format_entry(parts, entry) for parts, entry in page]
+        if more:
+            lines.append(f"More entries available; continue with cursor={_encode_cursor(page[-1][0])}")
+        if not lines:
+            return "No more entries" if resume else "Directory is empty"
+        return "\n".join(lines)
+    
+    def _walk(self, path: str, parents: List[str], depth: int,
+              resume: Optional[List[str]]) -> Iterator[Tuple[List[str], os.DirEntry]]:
+        """
+        Yield ``(path parts, entry)`` depth-first in name order.
+        
+        ``resume`` is the path of the last entry already returned; everything
+        up to and including it is skipped without being stat'ed.
+        """
+        try:
+            with os.scandir(path) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except PermissionError:
+            if not parents:
+                raise
+            return  # unreadable subdirectory; list the rest
+        
+        start = 0
+        if resume:
+            start = bisect.bisect_left([entry.name for entry in entries], resume[0])
+        
+        for entry in entries[start:]:
+            parts = parents + [entry.name]
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if resume and entry.name == resume[0]:
+                # Already returned (or an ancestor of what was); continue inside it
+                if is_dir and depth > 1:
+                    yield from self._walk(entry.path, parts, depth - 1, resume[1:] or None)
+                resume = None
+                continue
+            resume = None
+            
+            yield parts, entry
+            if is_dir and depth > 1:
+                yield from self._walk(entry.path, parts, depth - 1, None)
+    
+    @staticmethod
+    def _format_entry(parts: List[str], entry: os.DirEntry) -> str:
+        """Format one entry using its cached stat result."""
+        path = "/".join(parts)
+        if entry.is_dir(follow_symlinks=False):
+            return f"📁 {path}/"
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except OSError:
+            return f"📄 {path}"
+        modified = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
+        return f"📄 {path} ({_format_size(stat.st_size)}, modified {modified})"
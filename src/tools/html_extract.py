@@ -0,0 +1,178 @@
+"""
+Incremental, size-bounded text extraction from HTML.
+"""
+import logging
+from html.parser import HTMLParser
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# Subtrees whose content is never useful as page text
+SKIP_TAGS = frozenset({"script", "style", "nav", "noscript", "template", "svg", "iframe", "object"})
+
+# Elements that separate words even without surrounding whitespace
+BLOCK_TAGS = frozenset({
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption",
+    "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "ol",
+    "p", "pre", "section", "table", "td", "th", "title", "tr", "ul"
+})
+
+# Large inputs are parsed in slices so extraction can stop part-way through
+FEED_SLICE = 4 * 1024
+
+def _lxml_available() -> bool:
+    """The lxml backend needs the optional lxml package."""
+    try:
+        import lxml.etree  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+class _TextCollector:
+    """Receives start/end/data events and keeps whitespace-collapsed text up to a limit."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.length = 0
+        self.skip_depth = 0
+        self.pending_space = False
+        self.done = False
+
+    def start(self, tag: str) -> None:
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.pending_space = True
+
+    def end(self, tag: str) -> None:
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.pending_space = True
+
+    def data(self, text: str) -> None:
+        if self.skip_depth or self.done:
+            return
+
+        if text[:1].isspace():
+            self.pending_space = True
+        words = text.split()
+        if not words:
+            return
+
+        chunk = " ".join(words)
+        if self.pending_space and self.parts:
+            chunk = " " + chunk
+        self.pending_space = text[-1:].isspace()
+
+        self.parts.append(chunk)
+        self.length += len(chunk)
+        if self.length > self.max_chars:
+            self.done = True
+
+class _StdlibParser(HTMLParser):
+    """Adapter feeding ``html.parser`` events into a collector."""
+
+    def __init__(self, collector: _TextCollector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # <svg/> and friends have no subtree to skip
+        if tag not in SKIP_TAGS:
+            self.collector.start(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+class _LxmlTarget:
+    """Parser target feeding lxml's C parser events into a collector."""
+
+    def __init__(self, collector: _TextCollector):
+        self.collector = collector
+
+    def start(self, tag, attrib):
+        self.collector.start(tag)
+
+    def end(self, tag):
+        self.collector.end(tag)
+
+    def data(self, data):
+        self.collector.data(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return None
+
+class HTMLTextExtractor:
+    """
+    Extract readable text from HTML fed in chunks.
+
+    Script, style, navigation and similar subtrees are skipped as they
+    stream past rather than built into a tree. Once more than
+    ``max_chars`` characters are collected ``done`` becomes True, and the
+    caller can stop downloading and feeding the rest of the page.
+    """
+
+    def __init__(self, max_chars: int, backend: str = "auto"):
+        """
+        Initialize the extractor.
+
+        Args:
+            max_chars: Characters of text to collect before stopping
+            backend: "html.parser", "lxml", or "auto" to use lxml when installed
+        """
+        if backend == "auto":
+            backend = "lxml" if _lxml_available() else "html.parser"
+        if backend not in ("html.parser", "lxml"):
+            raise ValueError(f"Unknown HTML parser backend: {backend}")
+
+        self.backend = backend
+        self._collector = _TextCollector(max_chars)
+        if backend == "lxml":
+            from lxml import etree
+            self._parser = etree.HTMLParser(target=_LxmlTarget(self._collector))
+        else:
+            self._parser = _StdlibParser(self._collector)
+
+    @property
+    def done(self) -> bool:
+        """True once enough text has been collected."""
+        return self._collector.done
+
+    def feed(self, chunk: str) -> None:
+        """Parse the next chunk of the document."""
+        for start in range(0, len(chunk), FEED_SLICE):
+            if self.done:
+                return
+            self._parser.feed(chunk[start:start + FEED_SLICE])
+
+    def close(self) -> None:
+        """Flush any text buffered by the parser at end of input."""
+        if self.done:
+            return
+        try:
+            self._parser.close()
+        except Exception as e:
+            # lxml raises on documents it could not make sense of at all
+            logger.debug(f"HTML parser close failed: {e}")
+
+    def text(self) -> str:
+        """Return the text collected so far."""
+        return "".join(self._collector.parts)
+
+def extract_text(html: str, max_chars: int, backend: str = "auto") -> str:
+    """Extract up to about ``max_chars`` characters of text from a complete document."""
+    extractor = HTMLTextExtractor(max_chars, backend)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.text()
@@ -0,0 +1,203 @@
+"""
+Shared asynchronous HTTP client for the web tools.
+"""
+import asyncio
+import codecs
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENT = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+)
+
+def _http2_available() -> bool:
+    """HTTP/2 support in httpx needs the optional h2 package."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _raise_for_status(url: str, status_code: int, headers: httpx.Headers) -> None:
+    if status_code >= 400:
+        raise httpx.HTTPStatusError(
+            f"HTTP {status_code} for {url}",
+            request=httpx.Request("GET", url),
+            response=httpx.Response(status_code, headers=headers)
+        )
+
+class HttpResponse:
+    """A fetched response whose body was read up to a byte budget."""
+
+    def __init__(self, url: str, status_code: int, headers: httpx.Headers, content: bytes,
+                 truncated: bool, encoding: Optional[str]):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.truncated = truncated
+        self.encoding = encoding or "utf-8"
+
+    @property
+    def text(self) -> str:
+        """Body decoded with the response charset."""
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self) -> Any:
+        """Body parsed as JSON."""
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        """Raise an error for 4xx and 5xx responses."""
+        _raise_for_status(self.url, self.status_code, self.headers)
+
+class HttpStream:
+    """A response whose body is read incrementally, up to a byte budget."""
+
+    def __init__(self, response: httpx.Response, max_bytes: int):
+        self._response = response
+        self.max_bytes = max_bytes
+        self.url = str(response.url)
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.encoding = response.charset_encoding or "utf-8"
+        self.truncated = False
+
+    async def iter_bytes(self) -> AsyncIterator[bytes]:
+        """Yield body chunks until the body ends or the byte budget is spent."""
+        size = 0
+        async for chunk in self._response.aiter_bytes():
+            if size + len(chunk) > self.max_bytes:
+                self.truncated = True
+                chunk = chunk[:self.max_bytes - size]
+                if chunk:
+                    yield chunk
+                return
+            size += len(chunk)
+            yield chunk
+
+    async def iter_text(self) -> AsyncIterator[str]:
+        """Yield the body decoded incrementally with the response charset."""
+        try:
+            decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        except LookupError:
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        async for chunk in self.iter_bytes():
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def raise_for_status(self) -> None:
+        """Raise an error for 4xx and 5xx responses."""
+        _raise_for_status(self.url, self.status_code, self.headers)
+
+class HttpClient:
+    """
+    Async HTTP client with keep-alive pooling and per-host connection limits.
+
+    One underlying ``httpx.AsyncClient`` is shared by all callers, so
+    TCP/TLS connections are reused across tool calls. HTTP/2 is negotiated
+    when the ``h2`` package is installed and the server supports it.
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20, per_host_limit: int = 6,
+                 timeout: float = 10.0, http2: Optional[bool] = None, user_agent: str = DEFAULT_USER_AGENT):
+        """
+        Initialize the client.
+
+        Args:
+            max_connections: Total connection limit across all hosts
+            max_keepalive: Idle connections kept open for reuse
+            per_host_limit: Maximum concurrent requests to a single host
+            timeout: Connect/read timeout in seconds
+            http2: Enable HTTP/2; defaults to on when h2 is installed
+            user_agent: Default User-Agent header
+        """
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.http2 = _http2_available() if http2 is None else http2
+        self.user_agent = user_agent
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+                follow_redirects=True,
+                headers={"User-Agent": self.user_agent}
+            )
+        return self._client
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+
+    @asynccontextmanager
+    async def stream(self, url: str, params: Optional[Dict[str, Any]] = None,
+                     headers: Optional[Dict[str, str]] = None,
+                     max_bytes: int = 2 * 1024 * 1024) -> AsyncIterator[HttpStream]:
+        """
+        GET a URL and hand back the response before its body is read.
+
+        Leaving the block early closes the connection's stream, so whatever
+        the caller did not consume is never downloaded.
+
+        Args:
+            url: URL to fetch
+            params: Query string parameters
+            headers: Extra request headers
+            max_bytes: Byte budget for the body
+
+        Yields:
+            The response, whose body is read with ``iter_bytes``/``iter_text``
+        """
+        async with self._host_limit(url):
+            async with self._get_client().stream("GET", url, params=params, headers=headers) as response:
+                yield HttpStream(response, max_bytes)
+
+    async def fetch(self, url: str, params: Optional[Dict[str, Any]] = None,
+                    headers: Optional[Dict[str, str]] = None, max_bytes: int = 2 * 1024 * 1024) -> HttpResponse:
+        """
+        GET a URL, streaming the body and stopping once ``max_bytes`` are read.
+
+        Args:
+            url: URL to fetch
+            params: Query string parameters
+            headers: Extra request headers
+            max_bytes: Byte budget for the body; the rest is not downloaded
+
+        Returns:
+            The response, with ``truncated`` set if the body was cut off
+        """
+        async with self.stream(url, params=params, headers=headers, max_bytes=max_bytes) as response:
+            content = b"".join([chunk async for chunk in response.iter_bytes()])
+            return HttpResponse(
+                url=response.url,
+                status_code=response.status_code,
+                headers=response.headers,
+                content=content,
+                truncated=response.truncated,
+                encoding=response.encoding
+            )
+
+    async def close(self) -> None:
+        """Close pooled connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
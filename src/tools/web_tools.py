@@ -1,14 +1,33 @@
 """
 Web search and scraping tools.
 """
-import requests
-from bs4 import BeautifulSoup
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit, urlunsplit
 from src.tools.base import Tool
+from src.tools.html_extract import HTMLTextExtractor
+from src.tools.cache import CacheEntry, ToolResultCache, freshness_lifetime, make_key
+from src.tools.http_client import HttpClient
+
+def _normalize_url(url: str) -> str:
+    """Normalize a URL for use in a cache key (case-insensitive parts, no fragment)."""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
 
 class WebSearchTool(Tool):
     """Tool for searching the web using DuckDuckGo."""
     
+    read_only = True
+    max_concurrency = 4
+    
+    def __init__(self, http_client: Optional[HttpClient] = None,
+                 search_url: str = "https://api.duckduckgo.com/",
+                 cache: Optional[ToolResultCache] = None):
+        """Initialize with a shared HTTP client, the search API endpoint and an optional result cache."""
+        self.http = http_client or HttpClient()
+        self.search_url = search_url
+        self.cache = cache
+    
     @property
     def name(self) -> str:
         return "web_search"
@@ -38,43 +57,81 @@ class WebSearchTool(Tool):
     async def execute(self, query: str, max_results: int = 5) -> str:
         """Search the web for information."""
         try:
-            # Using DuckDuckGo instant answer API (simplified)
-            url = "https://api.duckduckgo.com/"
-            params = {
-                "q": query,
-                "format": "json",
-                "no_html": "1",
-                "skip_disambig": "1"
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
-            
-            results = []
-            
-            # Add abstract if available
-            if data.get("Abstract"):
-                results.append(f"Summary: {data['Abstract']}")
+            if self.cache is None:
+                return await self._search(query, max_results)
             
-            # Add related topics
-            if data.get("RelatedTopics"):
-                results.append("Related information:")
-                for topic in data["RelatedTopics"][:max_results]:
-                    if isinstance(topic, dict) and topic.get("Text"):
-                        results.append(f"- {topic['Text']}")
+            # Identical queries share one cache entry regardless of case and spacing
+            key = make_key(self.name, {"query": " ".join(query.lower().split()), "max_results": max_results})
             
-            # Add answer if available
-            if data.get("Answer"):
-                results.append(f"Direct answer: {data['Answer']}")
+            async def fetch(stale: Optional[CacheEntry]) -> CacheEntry:
+                result = await self._search(query, max_results)
+                return CacheEntry(result, time.time() + self.cache.ttl_for(self.name))
             
-            return "\n".join(results) if results else f"No specific results found for '{query}'. Consider refining your search."
+            return await self.cache.get_or_fetch(key, fetch)
             
         except Exception as e:
             return f"Error searching web: {str(e)}"
+    
+    async def _search(self, query: str, max_results: int) -> str:
+        """Query the search API and format the results."""
+        # Using DuckDuckGo instant answer API (simplified)
+        params = {
+            "q": query,
+            "format": "json",
+            "no_html": "1",
+            "skip_disambig": "1"
+        }
+        
+        response = await self.http.fetch(self.search_url, params=params, max_bytes=512 * 1024)
+        data = response.json()
+        
+        results = []
+        
+        # Add abstract if available
+        if data.get("Abstract"):
+            results.append(f"Summary: {data['Abstract']}")
+        
+        # Add related topics
+        if data.get("RelatedTopics"):
+            results.append("Related information:")
+            for topic in data["RelatedTopics"][:max_results]:
+                if isinstance(topic, dict) and topic.get("Text"):
+                    results.append(f"- {topic['Text']}")
+        
+        # Add answer if available
+        if data.get("Answer"):
+            results.append(f"Direct answer: {data['Answer']}")
+        
+        return "\n".join(results) if results else f"No specific results found for '{query}'. Consider refining your search."
+    
+    async def close(self) -> None:
+        """Close the HTTP client's pooled connections and the result cache."""
+        await self.http.close()
+        if self.cache is not None:
+            self.cache.close()
 
 class WebScrapeTool(Tool):
     """Tool for scraping content from a webpage."""
     
+    read_only = True
+    max_concurrency = 4
+    
+    def __init__(self, http_client: Optional[HttpClient] = None, max_bytes: int = 2 * 1024 * 1024,
+                 cache: Optional[ToolResultCache] = None, parser: str = "auto"):
+        """
+        Initialize the scraper.
+        
+        Args:
+            http_client: Shared HTTP client
+            max_bytes: Download budget per page
+            cache: Optional result cache
+            parser: HTML backend for ``HTMLTextExtractor`` ("auto", "html.parser" or "lxml")
+        """
+        self.http = http_client or HttpClient()
+        self.max_bytes = max_bytes
+        self.cache = cache
+        self.parser = parser
+    
     @property
     def name(self) -> str:
         return "scrape_webpage"
@@ -104,32 +161,59 @@ class WebScrapeTool(Tool):
     async def execute(self, url: str, max_length: int = 2000) -> str:
         """Scrape content from a webpage."""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+            if self.cache is None:
+                return (await self._scrape(url, max_length, None)).value
             
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            # Get text content
-            text = soup.get_text()
-            
-            # Clean up text
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
-            
-            # Limit length
-            if len(text) > max_length:
-                text = text[:max_length] + "..."
-            
-            return f"Content from {url}:\n\n{text}"
+            key = make_key(self.name, {"url": _normalize_url(url), "max_length": max_length})
+            return await self.cache.get_or_fetch(key, lambda stale: self._scrape(url, max_length, stale))
             
         except Exception as e:
             return f"Error scraping webpage: {str(e)}"
+    
+    async def _scrape(self, url: str, max_length: int, stale: Optional[CacheEntry]) -> CacheEntry:
+        """
+        Fetch and extract a page, revalidating a stale cache entry if possible.
+        
+        The returned entry's lifetime follows the page's Cache-Control
+        header, capped at the tool's configured TTL.
+        """
+        headers = {}
+        if stale is not None:
+            if stale.etag:
+                headers["If-None-Match"] = stale.etag
+            if stale.last_modified:
+                headers["If-Modified-Since"] = stale.last_modified
+        
+        async with self.http.stream(url, headers=headers or None, max_bytes=self.max_bytes) as response:
+            default_ttl = self.cache.ttl_for(self.name) if self.cache is not None else 0
+            ttl = freshness_lifetime(response.headers, default_ttl)
+            
+            if response.status_code == 304 and stale is not None:
+                stale.expires_at = time.time() + (ttl or 0)
+                return stale
+            response.raise_for_status()
+            
+            # Parse as the body arrives and stop downloading once there is enough text
+            extractor = HTMLTextExtractor(max_length, self.parser)
+            async for chunk in response.iter_text():
+                extractor.feed(chunk)
+                if extractor.done:
+                    break
+            extractor.close()
+        
+        text = extractor.text()
+        if len(text) > max_length:
+            text = text[:max_length] + "..."
+        
+        value = f"Content from {url}:\n\n{text}"
+        if ttl is None:
+            # no-store: hand the result back without keeping it
+            return CacheEntry(value, 0)
+        return CacheEntry(value, time.time() + ttl, response.headers.get("etag"),
+                          response.headers.get("last-modified"))
+    
+    async def close(self) -> None:
+        """Close the HTTP client's pooled connections and the result cache."""
+        await self.http.close()
+        if self.cache is not None:
+            self.cache.close()
@@ -2,9 +2,12 @@
 Test configuration and fixtures.
 """
 import pytest
+import pytest_asyncio
 import asyncio
 import os
 import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from src.tools import create_tool_manager
 from src.memory import ConversationMemory
 
@@ -13,8 +16,8 @@ def tool_manager():
     """Create a tool manager for testing."""
     return create_tool_manager()
 
-@pytest.fixture
-def temp_db():
+@pytest_asyncio.fixture
+async def temp_db():
     """Create a temporary database for testing."""
     with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as f:
         db_path = f.name
@@ -23,7 +26,10 @@ def temp_db():
     yield memory
     
     # Cleanup
-    os.unlink(db_path)
+    await memory.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
 
 @pytest.fixture
 def event_loop():
@@ -31,3 +37,40 @@ def event_loop():
     loop = asyncio.new_event_loop()
     yield loop
     loop.close()
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves canned responses registered on the server's ``routes``."""
+    
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+    
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        self.server.connections.add(self.client_address)
+        path = self.path.split("?")[0]
+        status, headers, body = self.server.routes.get(path, (404, {}, b"not found"))
+        if callable(body):
+            status, headers, body = body(self)
+        
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    """Run a local HTTP server; register responses in ``server.routes[path] = (status, headers, body)``."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.routes = {}
+    server.requests = []
+    server.connections = set()
+    server.base_url = f"http://127.0.0.1:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,379 @@
+"""
+Test the agent with the fake LLM backend.
+"""
+import asyncio
+import random
+import pytest
+from src.agent import (
+    Agent, ContextBuilder, ConversationSummarizer, FakeLLMClient, LLMDeadlineExceeded, LLMResult, PlanCache,
+    RateLimitedLLMClient, RateLimitError, RequestRouter, ResponseCache, SessionBusyError, SessionLocks, TokenBucket,
+    ToolCall
+)
+from src.api import AdmissionController
+from src.tools import create_tool_manager
+from src.tools.calculator import CalculatorTool
+
+@pytest.mark.asyncio
+async def test_agent_uses_llm_client(temp_db):
+    """Test that the agent routes completions through the LLM client."""
+    llm = FakeLLMClient(responses=["1. Greet the user", "Hello there!"])
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm)
+    
+    result = await agent.process_message("Hi", "test_session")
+    
+    assert result["content"] == "Hello there!"
+    assert result["thought_process"] == ["1. Greet the user"]
+    assert llm.call_count == 2
+
+@pytest.mark.asyncio
+async def test_llm_timeout():
+    """Test that slow completions are cancelled after the timeout."""
+    llm = FakeLLMClient(latency=1.0, timeout=0.01)
+    
+    with pytest.raises(asyncio.TimeoutError):
+        await llm.generate("slow prompt")
+
+@pytest.mark.asyncio
+async def test_agent_does_not_block_event_loop(temp_db):
+    """Test that concurrent requests overlap their LLM latency."""
+    llm = FakeLLMClient(responses=["1. Answer", "Done"], latency=0.2)
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm)
+    
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await asyncio.gather(*(agent.process_message("Hi", f"session_{i}") for i in range(5)))
+    
+    # Five sequential turns would take at least 2 seconds
+    assert loop.time() - start < 1.5
+
+@pytest.mark.asyncio
+async def test_process_message_stream(temp_db):
+    """Test that streaming yields plan and token events before the final result."""
+    llm = FakeLLMClient(responses=["1. Greet the user", "Hello there, friend!"])
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm)
+    
+    events = [event async for event in agent.process_message_stream("Hi", "stream_session")]
+    types = [event["type"] for event in events]
+    
+    assert types[0] == "plan"
+    assert types[-1] == "done"
+    assert "".join(e["content"] for e in events if e["type"] == "token") == "Hello there, friend!"
+    assert events[-1]["content"] == "Hello there, friend!"
+    
+    # The streamed answer is persisted like a normal turn
+    history = await temp_db.get_conversation_history("stream_session")
+    assert [m["content"] for m in history] == ["Hi", "Hello there, friend!"]
+
+@pytest.mark.asyncio
+async def test_structured_tool_calling(temp_db):
+    """Test that tools run only when the model requests them."""
+    llm = FakeLLMClient(responses=[
+        "1. Calculate the product",
+        LLMResult(tool_calls=[ToolCall(name="calculate", arguments={"expression": "6 * 7"})]),
+        "The answer is 42. Let me know if you want to find more.",
+    ])
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm)
+    
+    result = await agent.process_message("What is 6 times 7?", "tool_session")
+    
+    assert [tool["name"] for tool in result["tools_used"]] == ["calculate"]
+    assert "6 * 7 = 42" in result["tools_used"][0]["result"]
+    assert result["content"].startswith("The answer is 42")
+    assert llm.call_count == 3
+    # The tool result was fed back to the model
+    assert "6 * 7 = 42" in llm.prompts[-1]
+
+@pytest.mark.asyncio
+async def test_tool_iteration_budget(temp_db):
+    """Test that a model that keeps calling tools is cut off."""
+    llm = FakeLLMClient(responses=lambda prompt: (
+        LLMResult(tool_calls=[ToolCall(name="calculate", arguments={"expression": "1 + 1"})])
+        if "Available tools" in prompt and "User: Loop" in prompt else "1. Loop forever"
+    ))
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm, max_tool_iterations=2)
+    
+    result = await agent.process_message("Loop", "budget_session")
+    
+    assert len(result["tools_used"]) == 2
+    # One planning call plus max_tool_iterations + 1 execution calls
+    assert llm.call_count == 4
+
+@pytest.mark.asyncio
+async def test_invalid_tool_arguments_are_reported(temp_db):
+    """Test that schema violations are returned to the model instead of raising."""
+    llm = FakeLLMClient(responses=[
+        "1. Search",
+        LLMResult(tool_calls=[ToolCall(name="web_search", arguments={"q": "python"})]),
+        "Sorry, the search failed.",
+    ])
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm)
+    
+    result = await agent.process_message("Search python", "invalid_session")
+    
+    assert "Missing required parameters" in result["tools_used"][0]["result"]
+    assert result["content"] == "Sorry, the search failed."
+
+def test_context_builder_budget_and_catalog_cache():
+    """Test that history is packed into the token budget and the tool catalog is cached."""
+    manager = create_tool_manager()
+    context = ContextBuilder(manager, history_tokens=60)
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "x" * 80}
+               for i in range(20)]
+    history.append({"role": "user", "content": "latest question"})
+    
+    prompt = context.execution_prompt("latest question", history, "1. Answer")
+    # Only the newest messages that fit are kept, oldest first; the current message appears once
+    assert "message 19" in prompt and "message 18" in prompt and "message 17" not in prompt
+    assert prompt.index("message 18") < prompt.index("message 19")
+    assert prompt.count("latest question") == 2  # original request and the final user line
+    
+    # Growing the history does not grow the prompt
+    longer = [{"role": "user", "content": "y" * 400}] * 50 + history
+    assert len(context.execution_prompt("latest question", longer, "1. Answer")) == len(prompt)
+    assert context.estimate_hits > 0
+    
+    context.planning_prompt("latest question", history)
+    assert context.catalog_builds == 1
+    manager.register_tool(CalculatorTool())
+    context.tool_schemas()
+    assert context.catalog_builds == 2
+
+@pytest.mark.asyncio
+async def test_rolling_summary(temp_db):
+    """Test that older turns are folded into the session summary and replaced by it in prompts."""
+    def respond(prompt):
+        if prompt.startswith("You maintain a running summary"):
+            return "The user's favourite colour is teal."
+        return "1. Answer" if "create a clear plan" in prompt else "Noted."
+    
+    llm = FakeLLMClient(responses=respond)
+    summarizer = ConversationSummarizer(llm, temp_db, trigger_messages=4, keep_recent=2)
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm,
+                  summarizer=summarizer)
+    
+    await agent.process_message("My favourite colour is teal", "summary_session")
+    await summarizer.close()
+    assert (await temp_db.get_session_summary("summary_session"))["summary"] is None
+    
+    for i in range(2):
+        await agent.process_message(f"Filler message {i}", "summary_session")
+        await summarizer.close()
+    
+    state = await temp_db.get_session_summary("summary_session")
+    assert state["summary"] == "The user's favourite colour is teal."
+    assert state["pending"] == 2
+    assert summarizer.stats()["summaries"] == 1
+    
+    llm.prompts.clear()
+    await agent.process_message("What is my favourite colour?", "summary_session")
+    assert all("The user's favourite colour is teal." in prompt for prompt in llm.prompts[:2])
+    # Folded messages are no longer sent verbatim
+    assert not any("My favourite colour is teal" in prompt for prompt in llm.prompts[:2])
+    assert "Filler message 1" in llm.prompts[1]
+
+@pytest.mark.asyncio
+async def test_router_fast_paths(temp_db):
+    """Test that arithmetic skips the model and small talk skips planning."""
+    llm = FakeLLMClient(responses=["Hello! How can I help?"])
+    router = RequestRouter()
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm, router=router)
+    
+    result = await agent.process_message("What is 6 times 7?", "route_session")
+    assert result["route"] == "calculator"
+    assert result["content"] == "6 * 7 = 42"
+    assert llm.call_count == 0
+    
+    result = await agent.process_message("hi there!", "route_session")
+    assert result["route"] == "direct"
+    assert result["content"] == "Hello! How can I help?"
+    assert llm.call_count == 1
+    
+    # Calculator errors and anything else take the full plan-and-tools path
+    result = await agent.process_message("what is 1 / 0", "route_session")
+    assert result["route"] == "full"
+    assert router.route("Search the web for Python 3.13 release notes").route == "full"
+    assert router.stats() == {"calculator": 1, "direct": 1, "full": 2}
+    
+    # Confirmations may accept an offer to use a tool
+    for reply in ["yes", "Sure!", "ok", "no", "yep", "sounds good"]:
+        assert router.route(reply).route == "full", reply
+    
+    history = await temp_db.get_conversation_history("route_session")
+    assert [m["metadata"] for m in history if m["role"] == "assistant"] == [
+        {"route": "calculator"}, {"route": "direct"}, {"route": "full"}]
+
+@pytest.mark.asyncio
+async def test_response_cache(temp_db):
+    """Test that near-identical questions from other sessions are answered from the cache."""
+    llm = FakeLLMClient(responses=["1. Answer", "Paris is the capital of France."])
+    cache = ResponseCache()
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm,
+                  response_cache=cache)
+    
+    await agent.process_message("What is the capital of France?", "cache_a")
+    assert llm.call_count == 2
+    
+    result = await agent.process_message("what's the capital of France", "cache_b")
+    assert result["cache_hit"] and result["content"] == "Paris is the capital of France."
+    result = await agent.process_message("Please tell me, what is the capital of France?", "cache_c")
+    assert result["cache_hit"]
+    assert llm.call_count == 2
+    
+    # The replayed answer is stored in the new session and marked
+    history = await temp_db.get_conversation_history("cache_c")
+    assert history[-1]["content"] == "Paris is the capital of France."
+    assert history[-1]["metadata"] == {"cache_hit": True}
+    
+    # Different numbers, different subjects and follow-ups are not served from the cache
+    cache.store("What was the population of France in 2020?", {"content": "About 67 million."})
+    assert cache.lookup("What was the population of France in 2021?") is None
+    assert cache.lookup("What is the capital of Spain?") is None
+    assert cache.lookup("And what is its capital?") is None
+    assert cache.stats()["exact_hits"] == 1 and cache.stats()["near_hits"] == 1
+    
+    # Messages about the user, the conversation or the previous answer stay private
+    for message in ["What is my name?", "What did I ask you before?", "Summarize our conversation so far",
+                    "Why?", "Tell me more", "Continue", "Can you give an example?", "yes"]:
+        assert not cache.cacheable(message), message
+    assert cache.cacheable("What is Python?")
+    
+    # Answers built on earlier turns are not shared, however general the question
+    stores = cache.stats()["stores"]
+    await agent.process_message("What is the boiling point of water?", "cache_a")
+    assert cache.stats()["stores"] == stores
+
+@pytest.mark.asyncio
+async def test_plan_cache(temp_db, tmp_path):
+    """Test that identical planning prompts reuse the cached plan, including across restarts."""
+    llm = FakeLLMClient(responses=["1. Answer from knowledge", "Paris.", "Paris, France."])
+    db_path = str(tmp_path / "plans.db")
+    cache = PlanCache(db_path=db_path)
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm,
+                  plan_cache=cache)
+    
+    await agent.process_message("What is the capital of France?", "plan_a")
+    result = await agent.process_message("What is the capital of France?", "plan_b")
+    
+    # The second session skips the planner and executes the cached plan
+    assert llm.call_count == 3
+    assert result["thought_process"] == ["1. Answer from knowledge"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    cache.close()
+    
+    # The persistent tier survives a restart; different prompts or models miss
+    reopened = PlanCache(db_path=db_path)
+    prompt = agent.context.planning_prompt("What is the capital of France?", [], None)
+    
+    async def fail():
+        raise AssertionError("planner should not be called")
+    
+    plan, hit = await reopened.get_or_plan(prompt, fail, model="FakeLLMClient")
+    assert hit and plan == "1. Answer from knowledge"
+    assert PlanCache.key(prompt, "other-model") != PlanCache.key(prompt, "FakeLLMClient")
+    reopened.close()
+
+@pytest.mark.asyncio
+async def test_session_turns_are_serialized(temp_db):
+    """Test that same-session turns run one at a time while other sessions run in parallel."""
+    llm = FakeLLMClient(responses=["1. Answer", "Done"], latency=0.1)
+    locks = SessionLocks(max_pending=1)
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm,
+                  session_locks=locks)
+    
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    results = await asyncio.gather(
+        *(agent.process_message(f"Question {i}", "shared") for i in range(3)),
+        *(agent.process_message("Hi", f"other_{i}") for i in range(3)),
+        return_exceptions=True
+    )
+    
+    # The third turn on the shared session exceeds the queue and is rejected
+    assert isinstance(results[2], SessionBusyError) and results[2].retry_after >= 1
+    assert not any(isinstance(result, Exception) for result in results[:2] + results[3:])
+    # Two serialized turns of two calls each, with the other sessions overlapping them
+    assert loop.time() - start < 0.8
+    
+    history = await temp_db.get_conversation_history("shared")
+    assert [message["role"] for message in history] == ["user", "assistant", "user", "assistant"]
+    assert [message["content"] for message in history[::2]] == ["Question 0", "Question 1"]
+    
+    stats = locks.stats()
+    assert stats["turns"] == 5 and stats["contended"] == 1 and stats["rejected"] == 1
+    assert stats["max_depth"] == 1 and stats["active_sessions"] == 0 and stats["avg_wait_ms"] > 0
+
+@pytest.mark.asyncio
+async def test_admission_slot_is_held_by_the_turn(temp_db):
+    """Test that a turn takes its slot only once its session is free and keeps it after a disconnect."""
+    llm = FakeLLMClient(responses=["1. Answer", "Done"], latency=0.1)
+    locks = SessionLocks(max_pending=2)
+    admission = AdmissionController(max_concurrent=4)
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm,
+                  session_locks=locks)
+    admit = lambda: admission.admit()
+    
+    stream = agent.process_message_stream("Question", "shared", admission=admit)
+    await stream.__anext__()
+    queued = asyncio.create_task(agent.process_message("Follow-up", "shared", admission=admit))
+    await asyncio.sleep(0.01)
+    # The follow-up waits on its session without taking a slot
+    assert locks.pending("shared") == 1 and admission.active == 1
+    
+    # The client goes away; the turn runs on and keeps its slot
+    await stream.aclose()
+    assert admission.active == 1
+    
+    await queued
+    assert admission.active == 0 and admission.stats()["admitted"]["normal"] == 2
+    history = await temp_db.get_conversation_history("shared")
+    assert [message["content"] for message in history[::2]] == ["Question", "Follow-up"]
+
+@pytest.mark.asyncio
+async def test_rate_limited_client_retries_with_backoff():
+    """Test that injected 429s are retried with backoff that honours the retry hint."""
+    fake = FakeLLMClient(responses=["ok"], rate_limit_failures=2, retry_after=0.1, latency=0.01)
+    llm = RateLimitedLLMClient(fake, base_delay=0.01, rng=random.Random(0))
+    
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    assert await llm.generate("prompt") == "ok"
+    assert loop.time() - start >= 0.2
+    assert fake.rejected == 2 and fake.call_count == 1
+    assert llm.stats()["retries"] == 2 and llm.stats()["calls"] == 3
+    
+    # Retries run out
+    llm = RateLimitedLLMClient(FakeLLMClient(rate_limit_failures=5), max_retries=1, base_delay=0.01)
+    with pytest.raises(RateLimitError):
+        await llm.generate("prompt")
+    assert llm.stats()["failures"] == 1
+    
+    # The deadline covers backoff, so a retry that cannot finish in time is not attempted
+    llm = RateLimitedLLMClient(FakeLLMClient(rate_limit_failures=1, retry_after=5), timeout=1)
+    with pytest.raises(LLMDeadlineExceeded):
+        await llm.generate("prompt")
+
+@pytest.mark.asyncio
+async def test_rate_limited_client_budgets_and_shedding(temp_db):
+    """Test token-bucket pacing, early shedding past the deadline, and the agent's overload answer."""
+    bucket = TokenBucket(60, burst=1)
+    now = 100.0
+    bucket._updated = now
+    assert bucket.delay(1, now) == 0
+    bucket.take(1, now)
+    assert bucket.delay(1, now) == pytest.approx(1.0)
+    bucket.take(1, now)
+    assert bucket.delay(1, now + 0.5) == pytest.approx(1.5)
+    
+    # Each call reserves its prompt plus 256 completion tokens out of 600 per minute
+    fake = FakeLLMClient(responses=["ok"])
+    llm = RateLimitedLLMClient(fake, tokens_per_minute=600, timeout=1)
+    await llm.generate("first")
+    await llm.generate("second")
+    with pytest.raises(LLMDeadlineExceeded):
+        await llm.generate("third")
+    assert fake.call_count == 2 and llm.stats()["shed"] == 1
+    
+    llm = RateLimitedLLMClient(FakeLLMClient(rate_limit_probability=1.0), max_retries=0)
+    agent = Agent(api_key=None, tool_manager=create_tool_manager(), memory=temp_db, llm=llm)
+    result = await agent.process_message("Summarize the news", "overloaded")
+    assert "over capacity" in result["content"]
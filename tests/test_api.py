@@ -0,0 +1,91 @@
+"""
+Test admission control for the chat endpoints.
+"""
+import asyncio
+import pytest
+from src.api import AdmissionController, AdmissionRejected
+from src.api.app import _priority
+
+@pytest.mark.asyncio
+async def test_admission_limits_concurrency_and_orders_by_priority():
+    """Test that requests beyond the limit queue and are admitted most urgent first."""
+    admission = AdmissionController(max_concurrent=2, max_queue=4, max_queue_wait=5)
+    order = []
+    running = 0
+    peak = 0
+    
+    async def request(name, priority):
+        nonlocal running, peak
+        async with admission.admit(priority):
+            running += 1
+            peak = max(peak, running)
+            order.append(name)
+            await asyncio.sleep(0.05)
+            running -= 1
+    
+    tasks = [asyncio.create_task(request(f"first_{i}", "normal")) for i in range(2)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(request("low", "low")),
+              asyncio.create_task(request("normal", "normal")),
+              asyncio.create_task(request("high", "high"))]
+    await asyncio.gather(*tasks)
+    
+    assert peak == 2
+    assert order[2:] == ["high", "normal", "low"]
+    stats = admission.stats()
+    assert stats["active"] == 0 and stats["queued"] == 0
+    assert stats["admitted"] == {"high": 1, "normal": 3, "low": 1}
+    assert stats["service_time_ms"] > 0
+
+@pytest.mark.asyncio
+async def test_admission_rejects_and_sheds():
+    """Test 429 on a full queue, shedding of lower priorities, and 503 past the queue-time objective."""
+    admission = AdmissionController(max_concurrent=1, max_queue=1, max_queue_wait=0.2)
+    release = asyncio.Event()
+    
+    async def request(priority):
+        async with admission.admit(priority):
+            await release.wait()
+    
+    running = asyncio.create_task(request("normal"))
+    await asyncio.sleep(0)
+    low = asyncio.create_task(request("low"))
+    await asyncio.sleep(0)
+    
+    # The queue is full of equal or higher priority work: rejected immediately
+    with pytest.raises(AdmissionRejected) as rejected:
+        await admission.acquire("low")
+    assert rejected.value.status_code == 429 and rejected.value.retry_after >= 1
+    
+    # A more urgent request takes the queued low-priority request's place
+    high = asyncio.create_task(request("high"))
+    with pytest.raises(AdmissionRejected) as shed:
+        await low
+    assert shed.value.status_code == 503
+    
+    # Waiting past the objective fails with 503 and frees its queue place
+    with pytest.raises(AdmissionRejected) as timed_out:
+        await high
+    assert timed_out.value.status_code == 503
+    assert admission.stats()["queued"] == 0
+    
+    release.set()
+    await running
+    stats = admission.stats()
+    assert stats["active"] == 0
+    assert stats["rejected_full"] == 1 and stats["shed"] == 1 and stats["timed_out"] == 1
+    
+    # Once the mean service time is known, requests that would miss the objective fail fast
+    admission.active = 1
+    admission.max_queue_wait = 0.05
+    with pytest.raises(AdmissionRejected) as overloaded:
+        admission.check("normal")
+    assert overloaded.value.status_code == 503 and overloaded.value.retry_after >= 1
+
+def test_high_priority_needs_the_priority_key():
+    """Test that callers cannot raise their own priority without the configured key."""
+    assert _priority("high", None, None) == "normal"
+    assert _priority("high", "guess", "secret") == "normal"
+    assert _priority("high", "secret", "secret") == "high"
+    assert _priority("low", None, "secret") == "low"
+    assert _priority("normal", None, None) == "normal"
@@ -58,3 +58,206 @@ async def test_session_stats(temp_db):
     assert stats["message_count"] == 3
     assert stats["first_message"] is not None
     assert stats["last_message"] is not None
+
+@pytest.mark.asyncio
+async def test_connection_pool_reuse(temp_db):
+    """Test that memory operations reuse pooled connections."""
+    memory = temp_db
+    
+    for i in range(10):
+        await memory.add_message("pool_session", "user", f"Message {i}")
+        await memory.get_conversation_history("pool_session")
+    
+    assert len(memory._pool._connections) == 1
+    
+    async with memory._pool.acquire() as db:
+        rows = await db.execute_fetchall("PRAGMA journal_mode")
+    assert rows[0][0] == "wal"
+
+@pytest.mark.asyncio
+async def test_schema_migrations(temp_db):
+    """Test that migrations are applied and the indexes are used."""
+    import sqlite3
+    from src.memory.migrations import MIGRATIONS, apply_migrations, get_schema_version
+    
+    conn = sqlite3.connect(temp_db.db_path)
+    try:
+        assert get_schema_version(conn) == MIGRATIONS[-1].version
+        
+        # Re-running is a no-op
+        assert apply_migrations(conn) == MIGRATIONS[-1].version
+        
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT role FROM conversations WHERE session_id = ? ORDER BY id DESC LIMIT 50",
+            ("s",)
+        ))
+        assert "idx_conversations_session_id" in plan
+        assert "TEMP B-TREE" not in plan
+        
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT session_id FROM session_metadata ORDER BY last_activity DESC LIMIT 10"
+        ))
+        assert "idx_session_metadata_last_activity" in plan
+    finally:
+        conn.close()
+
+@pytest.mark.asyncio
+async def test_same_second_ordering_and_title(temp_db):
+    """Test that messages keep insertion order and titles survive new messages."""
+    memory = temp_db
+    session_id = "ordering_session"
+    
+    for i in range(20):
+        await memory.add_message(session_id, "user", f"Message {i}")
+    await memory.update_session_title(session_id, "Kept")
+    await memory.add_message(session_id, "assistant", "Last")
+    
+    history = await memory.get_conversation_history(session_id)
+    assert [m["content"] for m in history] == [f"Message {i}" for i in range(20)] + ["Last"]
+    
+    sessions = await memory.get_recent_sessions()
+    assert sessions[0]["title"] == "Kept"
+
+@pytest.mark.asyncio
+async def test_write_behind_batches_and_reads_own_writes(tmp_path):
+    """Test that write-behind mode batches inserts and stays read-consistent."""
+    import asyncio
+    
+    memory = ConversationMemory(str(tmp_path / "wb.db"), write_behind=True, batch_size=16, flush_interval_ms=1000)
+    batches = []
+    write_messages = memory._write_messages
+    
+    async def counting_writer(rows):
+        batches.append(len(rows))
+        await write_messages(rows)
+    
+    memory._write_behind.writer = counting_writer
+    try:
+        await asyncio.gather(*(memory.add_message(f"s{i % 4}", "user", f"Message {i}") for i in range(64)))
+        
+        # Reading a session with buffered writes flushes them first
+        history = await memory.get_conversation_history("s1")
+        assert [m["content"] for m in history] == [f"Message {i}" for i in range(1, 64, 4)]
+        
+        await memory.flush()
+        assert sum(batches) == 64
+        assert max(batches) == 16
+        assert len(batches) == 4
+    finally:
+        await memory.close()
+
+@pytest.mark.asyncio
+async def test_write_behind_failures_stay_with_their_batch(tmp_path):
+    """Test that failed batches are retried, then reported only to their own rows, and uncached."""
+    import asyncio
+    
+    memory = ConversationMemory(str(tmp_path / "wb.db"), write_behind=True, batch_size=1, flush_interval_ms=1)
+    memory._write_behind.retry_delay = 0.001
+    write_messages = memory._write_messages
+    attempts = []
+    
+    async def flaky_writer(rows):
+        attempts.append(rows[0][2])
+        if rows[0][2] == "Lost" or attempts.count(rows[0][2]) == 1:
+            raise RuntimeError("disk I/O error")
+        await write_messages(rows)
+    
+    memory._write_behind.writer = flaky_writer
+    try:
+        await memory.add_message("good", "user", "Kept")
+        await memory.get_conversation_history("bad")
+        written = await memory._write_behind.submit("bad", ("bad", "user", "Lost", None, None))
+        written.add_done_callback(lambda done: memory._write_failed("bad", done))
+        await memory.add_message("bad", "user", "Lost")
+        
+        # The failure reaches neither this unrelated flush nor later writes
+        await memory.flush()
+        with pytest.raises(RuntimeError):
+            await written
+        assert attempts.count("Kept") == 2 and attempts.count("Lost") == 6
+        assert [m["content"] for m in await memory.get_conversation_history("good")] == ["Kept"]
+        
+        # The cached history no longer shows the unwritten messages
+        assert await memory.get_conversation_history("bad") == []
+    finally:
+        await memory.close()
+
+@pytest.mark.asyncio
+async def test_history_cache(temp_db):
+    """Test that hot session histories are served from the cache."""
+    memory = temp_db
+    session_id = "cached_session"
+    
+    await memory.add_message(session_id, "user", "Hello")
+    history = await memory.get_conversation_history(session_id)
+    assert memory.cache_stats()["misses"] == 1
+    
+    # New messages are appended to the cached window
+    await memory.add_message(session_id, "assistant", "Hi there!", {"tool": "none"})
+    history = await memory.get_conversation_history(session_id)
+    assert [m["content"] for m in history] == ["Hello", "Hi there!"]
+    assert history[1]["metadata"] == {"tool": "none"}
+    assert memory.cache_stats()["hits"] == 1
+    
+    # Cached and database reads agree, including empty and non-JSON-native metadata
+    await memory.add_message(session_id, "user", "Again", {})
+    await memory.add_message(session_id, "assistant", "Tuple", {"steps": (1, 2)})
+    history = await memory.get_conversation_history(session_id)
+    assert history[2]["metadata"] is None and history[3]["metadata"] == {"steps": [1, 2]}
+    assert history == await memory._load_history(session_id, 50)
+    
+    await memory.clear_session(session_id)
+    assert await memory.get_conversation_history(session_id) == []
+    assert memory.cache_stats()["misses"] == 2
+
+@pytest.mark.asyncio
+async def test_summary_state_is_cached(temp_db):
+    """Test that warm reads of the summary state skip the database and stay current."""
+    from unittest.mock import patch
+    
+    memory = temp_db
+    session_id = "summarized"
+    for i in range(4):
+        await memory.add_message(session_id, "user", f"Message {i}")
+    await memory.get_conversation_history(session_id)
+    assert await memory.get_session_summary(session_id) == {"summary": None, "through_id": 0, "pending": 4}
+    
+    ids = [message["id"] for message in await memory.get_messages_after(session_id, 0)]
+    assert await memory.advance_session_summary(session_id, "Four messages", 0, ids[2])
+    await memory.add_message(session_id, "assistant", "Reply")
+    
+    with patch.object(memory._pool, "acquire", side_effect=AssertionError("database used")):
+        state = await memory.get_session_summary(session_id)
+    assert state == {"summary": "Four messages", "through_id": ids[2], "pending": 2}
+    assert state == await memory._load_summary(session_id)
+    
+    # A lost race forgets the cached state rather than trusting it
+    assert not await memory.advance_session_summary(session_id, "Stale", 0, ids[3])
+    assert memory._cache.get_summary(session_id) is None
+    assert (await memory.get_session_summary(session_id))["summary"] == "Four messages"
+
+def test_history_cache_eviction():
+    """Test LRU eviction by session count and byte budget."""
+    from src.memory.cache import SessionHistoryCache
+    
+    cache = SessionHistoryCache(max_sessions=2, max_bytes=2000, window=3)
+    message = {"role": "user", "content": "x" * 100, "timestamp": None, "metadata": None}
+    
+    for session_id in ("a", "b", "c"):
+        token = cache.begin_load(session_id)
+        cache.finish_load(session_id, token, [dict(message)], complete=True)
+    assert cache.get("a", 10) is None
+    assert cache.get("c", 10) is not None
+    
+    # A write during a load makes the loaded result stale
+    token = cache.begin_load("d")
+    cache.begin_write("d")
+    cache.end_write("d", dict(message))
+    cache.finish_load("d", token, [], complete=True)
+    assert cache.get("d", 10) is None
+    
+    # Oversized sessions are not cached at all
+    token = cache.begin_load("e")
+    cache.finish_load("e", token, [{**message, "content": "y" * 5000}], complete=True)
+    assert cache.get("e", 1) is None
+    assert cache.stats()["bytes"] <= 2000
@@ -1,9 +1,19 @@
 """
 Test the tool system.
 """
+import asyncio
+import math
+import threading
+import time
 import pytest
-from src.tools import create_tool_manager
+from fractions import Fraction
+from typing import Any, Dict
+from unittest.mock import patch
+from src.tools import array_math, create_tool_manager, Tool, ToolManager, ToolInvocation
 from src.tools.calculator import CalculatorTool
+from src.tools.expression import BudgetExceeded, compile_expression, evaluate, format_result, prepare, template
+from src.tools.file_index import FileIndex, SearchFilesTool
+from src.tools.file_ops import FileListTool, FileReadTool, MMAP_THRESHOLD
 
 @pytest.mark.asyncio
 async def test_tool_manager_creation():
@@ -33,6 +43,150 @@ async def test_calculator_tool():
     result = await calc.execute(expression="1 / 0")
     assert "Error: Division by zero" in result
 
+@pytest.mark.asyncio
+async def test_calculator_resource_guards():
+    """Test that oversized results are refused up front and slow ones are killed."""
+    calc = CalculatorTool(timeout=5.0)
+    try:
+        start = time.perf_counter()
+        assert "Result too large" in await calc.execute(expression="9**9**9")
+        assert "Result too large" in await calc.execute(expression="(2**100000) * (2**100000)")
+        assert "too large" in await calc.execute(expression="factorial(100000)")
+        assert "too complex" in await calc.execute(expression="+".join(["1"] * 300))
+        assert time.perf_counter() - start < 0.5
+        
+        # Big but allowed results are computed in the worker pool and abbreviated
+        assert await calc.execute(expression="10**20000") == "10**20000 = 1.000000000000000e+20000 (20,001 digits)"
+        
+        calc.timeout = 0
+        assert "time limit" in await calc.execute(expression="7**40000")
+        calc.timeout = 5.0
+        assert "(33,804 digits)" in await calc.execute(expression="7**40000")
+        
+        assert await calc.execute(expression="0.1 + 0.2", mode="decimal") == "0.1 + 0.2 = 0.3"
+        assert await calc.execute(expression="1/3 + 1/6", mode="fraction") == "1/3 + 1/6 = 1/2"
+        assert "not available in fraction mode" in await calc.execute(expression="sqrt(2)", mode="fraction")
+        
+        # Exact sums, quotients and roundings are size-checked too, so they never run long inline
+        start = time.perf_counter()
+        assert "too large" in await calc.execute(expression="round(1/3, 3000000)", mode="fraction")
+        with patch.object(CalculatorTool, "_evaluate_in_pool", return_value=0) as pool:
+            await calc.execute(expression="sum(1/x for x in 1..50000)", mode="fraction")
+        pool.assert_called_once()
+        assert time.perf_counter() - start < 1.0
+        assert await calc.execute(expression="2**-100000") == "2**-100000 = 0.0"
+        
+        # Large fractions are abbreviated part by part
+        result = await calc.execute(expression="1 / 3**10000", mode="fraction")
+        assert result == "1 / 3**10000 = 1/1.631350185342625e+4771 (4,772 digits)"
+    finally:
+        await calc.close()
+
+def test_compiled_expressions_are_cached():
+    """Test that expressions differing only in numbers share one compiled evaluator."""
+    assert template("log10(100) + 2.5 * x") == ("log10(__0) + __1 * x", {"__0": 100, "__1": 2.5})
+    
+    compile_expression.cache_clear()
+    assert evaluate("2 + 3 * 4") == 14
+    assert evaluate("7 + 1 * 2") == 9
+    assert evaluate("round(2.567, 2)") == 2.57
+    assert evaluate("max(1, 5, 3) ** 2 + pi * 0") == 25
+    assert evaluate("x * 2", {"x": 21}) == 42
+    info = compile_expression.cache_info()
+    assert info.misses == 4 and info.hits == 1
+    
+    for unsafe in ("__import__('os')", "(1).real", "x", "'a' * 3", "[1, 2] * 3", "f(1)"):
+        with pytest.raises(ValueError):
+            evaluate(unsafe)
+
+def test_sequence_expressions():
+    """Test ranges, generators, reductions and the pure-Python fallback."""
+    assert evaluate("sum(x**2 for x in 1..1e4)") == pytest.approx(333383335000)
+    assert list(evaluate("[x * 2 for x in 1..10 if x % 3 == 0]")) == [6, 12, 18]
+    assert evaluate("mean(xs)", {"xs": [1, 2, 3, 4]}) == 2.5
+    assert evaluate("median([5, 1, 3])") == 3
+    assert evaluate("count(x for x in xs if x > 2)", {"xs": [1, 2, 3, 4]}) == 2
+    assert evaluate("stdev([2, 4, 4, 4, 5, 5, 7, 9])") == pytest.approx(2.138, abs=1e-3)
+    assert evaluate("prod(1..10)") == 3628800
+    assert evaluate("mean([1, 2])", mode="fraction") == Fraction(3, 2)
+    
+    # With NumPy unavailable the same results come from the per-value loop
+    with patch.object(array_math, "np", None):
+        compile_expression.cache_clear()
+        prepare.cache_clear()
+        assert evaluate("sum(sqrt(x) for x in 1..100 if x > 50)") == pytest.approx(
+            sum(math.sqrt(x) for x in range(51, 101)))
+    compile_expression.cache_clear()
+    prepare.cache_clear()
+    
+    with pytest.raises(BudgetExceeded):
+        evaluate("sum(1..1000)", max_elements=100)
+    with pytest.raises(ValueError, match="Sequence too long"):
+        evaluate("sum(1..1e12)")
+    with pytest.raises(ValueError, match="math domain error"):
+        evaluate("sum(sqrt(x) for x in -1..1)")
+    assert format_result(evaluate("1..25")).endswith("...] (25 values)")
+
+@pytest.mark.asyncio
+async def test_nested_generators_share_the_element_budget():
+    """Test that inner generators count towards one total, so nested loops leave the event loop."""
+    nested = "sum(sum(y for y in 1..300) for x in 1..300)"
+    assert evaluate(nested) == 300 * 45150
+    with pytest.raises(BudgetExceeded):
+        evaluate(nested, max_elements=50_000)
+    with patch("src.tools.expression.MAX_ELEMENTS", 10_000):
+        with pytest.raises(ValueError, match="in total"):
+            evaluate(nested)
+    
+    calc = CalculatorTool()
+    try:
+        with patch.object(CalculatorTool, "_evaluate_in_pool", return_value=0) as pool:
+            await calc.execute(expression="sum(sum(y for y in 1..6000) for x in 1..6000)")
+        pool.assert_called_once()
+    finally:
+        await calc.close()
+
+@pytest.mark.asyncio
+async def test_heavy_loops_leave_the_event_loop():
+    """Test that loops with costly elements go to the pool and the event loop keeps running meanwhile."""
+    heavy = "sum(" + " + ".join(f"x**{500 + i} % 7" for i in range(40)) + " for x in 1..50000)"
+    with pytest.raises(BudgetExceeded, match="operations"):
+        evaluate(heavy, max_operations=1_000_000)
+    light = "sum(x**60 % 7 for x in 1..1000)"
+    assert evaluate(light, max_operations=1_000_000) == evaluate(light)
+    
+    calc = CalculatorTool(timeout=0.5)
+    ticks = []
+    
+    async def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+    
+    running = asyncio.create_task(ticker())
+    try:
+        await asyncio.sleep(0)
+        assert "time limit" in await calc.execute(expression=heavy)
+    finally:
+        running.cancel()
+        await calc.close()
+    assert max(later - earlier for earlier, later in zip(ticks, ticks[1:])) < 0.25
+
+@pytest.mark.asyncio
+async def test_calculator_batch():
+    """Test that a batch call reports one line per expression."""
+    calc = CalculatorTool()
+    try:
+        result = await calc.execute(
+            expressions=["2 + 2", "1 / 0", "max(xs) - min(xs)"],
+            variables=[{"name": "xs", "values": [3, 9, 4]}],
+        )
+        assert result.split("\n") == ["2 + 2 = 4", "1 / 0: Error: Division by zero", "max(xs) - min(xs) = 6"]
+        assert "Provide 'expression'" in await calc.execute()
+        assert "list of numbers" in await calc.execute(expression="sum(xs)", variables=[{"name": "xs", "values": ["a"]}])
+    finally:
+        await calc.close()
+
 @pytest.mark.asyncio
 async def test_tool_execution():
     """Test tool execution through manager."""
@@ -45,3 +199,256 @@ async def test_tool_execution():
     # Test invalid tool
     with pytest.raises(ValueError):
         await manager.execute_tool("invalid_tool", {})
+
+@pytest.mark.asyncio
+async def test_tool_parameter_validation():
+    """Test that tool parameters are checked against the declared schema."""
+    manager = create_tool_manager()
+    
+    with pytest.raises(ValueError, match="Missing required parameters"):
+        await manager.execute_tool("read_file", {})
+    
+    with pytest.raises(ValueError, match="Unknown parameters"):
+        await manager.execute_tool("calculate", {"expression": "1 + 1", "precision": 2})
+    
+    schemas = {schema["name"]: schema for schema in manager.get_tool_schemas()}
+    assert schemas["read_file"]["parameters"]["required"] == ["file_path"]
+
+class SlowTool(Tool):
+    """Test tool that sleeps and records execution order."""
+    
+    def __init__(self, name: str, read_only: bool, log: list, max_concurrency=None):
+        self._name = name
+        self.read_only = read_only
+        self.max_concurrency = max_concurrency
+        self.log = log
+    
+    @property
+    def name(self) -> str:
+        return self._name
+    
+    @property
+    def description(self) -> str:
+        return "Sleep for a while"
+    
+    @property
+    def parameters(self) -> Dict[str, Any]:
+        return {"type": "object", "properties": {"delay": {"type": "number"}}, "required": ["delay"]}
+    
+    async def execute(self, delay: float) -> str:
+        self.log.append(f"start {self._name}")
+        await asyncio.sleep(delay)
+        self.log.append(f"end {self._name}")
+        return f"{self._name} slept {delay}"
+
+@pytest.mark.asyncio
+async def test_execute_batch_parallel_and_ordered():
+    """Test that independent calls overlap, results keep order and writes act as barriers."""
+    log = []
+    manager = ToolManager()
+    manager.register_tool(SlowTool("read", True, log))
+    manager.register_tool(SlowTool("write", False, log))
+    
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    results = await manager.execute_batch([
+        ToolInvocation(name="read", parameters={"delay": 0.2}),
+        ToolInvocation(name="read", parameters={"delay": 0.1}),
+        ToolInvocation(name="read", parameters={"delay": 0.2}),
+        ToolInvocation(name="write", parameters={"delay": 0.05}),
+        ToolInvocation(name="read", parameters={"delay": 0.0}),
+    ])
+    elapsed = loop.time() - start
+    
+    assert [r.result for r in results] == [
+        "read slept 0.2", "read slept 0.1", "read slept 0.2", "write slept 0.05", "read slept 0.0"
+    ]
+    assert all(r.error is None and r.duration_ms > 0 for r in results)
+    assert elapsed < 0.45
+    # The write starts only after all earlier reads have finished
+    assert log[:6].count("end read") == 3
+    assert log[6] == "start write"
+
+@pytest.mark.asyncio
+async def test_execute_batch_limits_and_timeouts():
+    """Test per-tool concurrency limits and per-call timeouts."""
+    log = []
+    manager = ToolManager()
+    manager.register_tool(SlowTool("limited", True, log, max_concurrency=1))
+    
+    results = await manager.execute_batch([
+        ToolInvocation(name="limited", parameters={"delay": 0.05}),
+        ToolInvocation(name="limited", parameters={"delay": 0.05}),
+    ])
+    assert log == ["start limited", "end limited", "start limited", "end limited"]
+    
+    results = await manager.execute_batch([
+        ToolInvocation(name="limited", parameters={"delay": 1.0}),
+        ToolInvocation(name="missing", parameters={}),
+    ], timeout=0.05)
+    assert "timed out" in results[0].error
+    assert "not found" in results[1].error
+
+@pytest.mark.asyncio
+async def test_read_file_ranges(tmp_path):
+    """Test byte/line ranges, head/tail and the byte budget on an mmap-sized file."""
+    path = tmp_path / "big.log"
+    path.write_text("".join(f"line {i}\n" for i in range(1, 200001)))
+    size = path.stat().st_size
+    assert size >= MMAP_THRESHOLD
+    tool = FileReadTool(max_bytes=1000)
+    
+    result = await tool.execute(file_path=str(path), head=2)
+    assert result.startswith("line 1\nline 2\n\n")
+    assert f"{size - 14} bytes omitted" in result
+    
+    result = await tool.execute(file_path=str(path), tail=1)
+    assert result.startswith("line 200000\n\n")
+    
+    result = await tool.execute(file_path=str(path), start_line=1000, end_line=1001)
+    assert result.startswith("line 1000\nline 1001\n\n")
+    
+    result = await tool.execute(file_path=str(path), offset=7, length=7)
+    assert result.startswith("line 2\n\n\n[Showing bytes 7-14 of")
+    
+    result = await tool.execute(file_path=str(path))
+    content, note = result.rsplit("\n\n", 1)
+    assert len(content) == 1000
+    assert "continue with offset=1000" in note
+    
+    result = await tool.execute(file_path=str(path), head=10000, max_bytes=50)
+    assert "continue with offset=50" in result
+    
+    assert (await tool.execute(file_path=str(path), head=1, tail=1)).startswith("Error reading file")
+    
+    small = tmp_path / "small.txt"
+    small.write_text("hello\nworld\n")
+    assert await tool.execute(file_path=str(small)) == "hello\nworld\n"
+    assert await tool.execute(file_path=str(tmp_path / "missing.txt")) == f"File not found: {tmp_path / 'missing.txt'}"
+
+def test_file_index_incremental_refresh(tmp_path):
+    """Test that the index finds files by glob and content and refreshes only what changed."""
+    (tmp_path / "src" / "tools").mkdir(parents=True)
+    (tmp_path / "node_modules").mkdir()
+    (tmp_path / "src" / "main.py").write_text("def main():\n    run_server()\n")
+    (tmp_path / "src" / "tools" / "calc.py").write_text("import math\nRESULT = math.sqrt(16)\n")
+    (tmp_path / "README.md").write_text("Run the server with python -m src.main\n")
+    (tmp_path / "node_modules" / "lib.js").write_text("run_server()")
+    
+    index = FileIndex(str(tmp_path))
+    index.refresh()
+    assert [path for path, _ in index.glob("*.py")] == ["src/main.py", "src/tools/calc.py"]
+    assert [path for path, _ in index.glob("src/**/*.py")] == ["src/main.py", "src/tools/calc.py"]
+    assert [path for path, _ in index.glob("tools/calc")] == ["src/tools/calc.py"]
+    assert index.search_content("RUN_SERVER") == [("src/main.py", 2, "    run_server()")]
+    assert index.search_content("math", pattern="*.md") == []
+    
+    scanned = index.dirs_scanned
+    index.refresh()
+    assert index.dirs_scanned == scanned
+    
+    (tmp_path / "src" / "tools" / "calc.py").write_text("RESULT = 4\n")
+    (tmp_path / "src" / "server.py").write_text("def run_server():\n    pass\n")
+    index.refresh()
+    assert index.dirs_scanned == scanned + 1
+    assert index.search_content("sqrt") == []
+    assert [path for path, _, _ in index.search_content("run_server")] == ["src/main.py", "src/server.py"]
+    
+    (tmp_path / "src" / "main.py").unlink()
+    index.refresh()
+    assert [path for path, _ in index.glob("*.py")] == ["src/server.py", "src/tools/calc.py"]
+
+@pytest.mark.asyncio
+async def test_search_files_tool(tmp_path):
+    """Test the search_files tool output."""
+    for i in range(5):
+        (tmp_path / f"notes{i}.txt").write_text(f"note number {i}\n")
+    tool = SearchFilesTool(root=str(tmp_path))
+    
+    result = await tool.execute(directory=str(tmp_path), pattern="*.txt", max_results=2)
+    assert result.splitlines() == ["notes0.txt (14 bytes)", "notes1.txt (14 bytes)", "... 3 more matches not shown"]
+    assert await tool.execute(directory=str(tmp_path), query="number 3") == "notes3.txt:1: note number 3"
+    assert "No files" in await tool.execute(directory=str(tmp_path), query="missing")
+    assert (await tool.execute(directory=str(tmp_path))).startswith("Error searching files")
+    assert "is outside" in await tool.execute(directory=str(tmp_path / ".."), pattern="*.txt")
+    
+    # Glob matching runs in a worker thread, not on the event loop
+    threads = []
+    original = FileIndex.glob
+    
+    def recording_glob(self, pattern):
+        threads.append(threading.get_ident())
+        return original(self, pattern)
+    
+    with patch.object(FileIndex, "glob", recording_glob):
+        await tool.execute(directory=str(tmp_path), pattern="*.txt")
+    assert threads and threading.get_ident() not in threads
+
+@pytest.mark.asyncio
+async def test_file_index_limits_and_snapshots(tmp_path):
+    """Test file and byte caps, snapshot isolation and sharing of an in-flight refresh."""
+    for i in range(6):
+        (tmp_path / f"f{i}.txt").write_text(f"needle {i}\n" * 10)
+    
+    index = FileIndex(str(tmp_path), max_files=4, max_index_bytes=200)
+    index.refresh()
+    stats = index.stats()
+    assert stats["files"] == 4 and stats["truncated"]
+    assert stats["content_bytes"] <= 200
+    # Files beyond the byte budget are still found, just without the trigram index
+    assert [path for path, _, _ in index.search_content("needle 3")] == ["f3.txt"] * 10
+    
+    before = list(index.glob("*.txt"))
+    files = index.glob("*.txt")
+    (tmp_path / "f0.txt").unlink()
+    index.refresh()
+    assert list(files) == before
+    assert [path for path, _ in index.glob("*.txt")] == ["f1.txt", "f2.txt", "f3.txt", "f4.txt"]
+    
+    tool = SearchFilesTool(root=str(tmp_path), refresh_interval=0)
+    refreshes = 0
+    original = FileIndex.refresh
+    
+    def counting_refresh(self):
+        nonlocal refreshes
+        refreshes += 1
+        time.sleep(0.05)
+        original(self)
+    
+    with patch.object(FileIndex, "refresh", counting_refresh):
+        await asyncio.gather(*(tool.execute(directory=str(tmp_path), pattern="*.txt") for _ in range(4)))
+    assert refreshes == 1
+
+@pytest.mark.asyncio
+async def test_list_files_recursive_pagination(tmp_path):
+    """Test depth limits, filters and cursor pagination over a directory tree."""
+    for d in ("a", "b", "b/c"):
+        (tmp_path / d).mkdir()
+    for f in ("a/1.txt", "a/2.py", "b/3.txt", "b/c/4.txt", "z.txt"):
+        (tmp_path / f).write_text("x" * 10)
+    tool = FileListTool()
+    
+    result = await tool.execute(directory_path=str(tmp_path))
+    assert [line.split(" (")[0] for line in result.splitlines()] == ["📁 a/", "📁 b/", "📄 z.txt"]
+    assert "(10 B, modified " in result
+    
+    seen = []
+    cursor = None
+    while True:
+        result = await tool.execute(directory_path=str(tmp_path), depth=5, limit=3, cursor=cursor)
+        lines = result.splitlines()
+        if lines[-1].startswith("More entries available"):
+            cursor = lines.pop().split("cursor=")[1]
+            seen.extend(line.split(" (")[0] for line in lines)
+        else:
+            seen.extend(line.split(" (")[0] for line in lines)
+            break
+    assert seen == [
+        "📁 a/", "📄 a/1.txt", "📄 a/2.py", "📁 b/", "📄 b/3.txt",
+        "📁 b/c/", "📄 b/c/4.txt", "📄 z.txt"
+    ]
+    
+    result = await tool.execute(directory_path=str(tmp_path), depth=2, pattern="*.txt", file_type="file")
+    assert [line.split(" (")[0] for line in result.splitlines()] == ["📄 a/1.txt", "📄 b/3.txt", "📄 z.txt"]
+    assert (await tool.execute(directory_path=str(tmp_path), cursor="bogus")).startswith("Error listing directory")
+    assert (await tool.execute(directory_path=str(tmp_path / "missing"))).startswith("Error listing directory")
@@ -0,0 +1,206 @@
+"""
+Test the web tools against a local stub HTTP server.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+import pytest
+from src.tools import HttpClient, ToolResultCache, WebSearchTool, WebScrapeTool
+from src.tools.html_extract import HTMLTextExtractor, extract_text
+
+PAGE = b"""<html><head><title>Stub</title><style>body { color: red; }</style></head>
+<body><h1>Hello</h1><script>var x = 1;</script><p>Some   useful text.</p></body></html>"""
+
+@pytest.mark.asyncio
+async def test_web_search(stub_server):
+    """Test that search results are parsed from the JSON API."""
+    stub_server.routes["/search"] = (200, {"Content-Type": "application/json"}, json.dumps({
+        "Abstract": "Python is a programming language.",
+        "RelatedTopics": [{"Text": "Python (language)"}, {"Text": "Monty Python"}],
+        "Answer": ""
+    }).encode())
+    client = HttpClient()
+    tool = WebSearchTool(client, search_url=f"{stub_server.base_url}/search")
+    try:
+        result = await tool.execute(query="python", max_results=1)
+    finally:
+        await client.close()
+    
+    assert "Summary: Python is a programming language." in result
+    assert "- Python (language)" in result
+    assert "Monty Python" not in result
+    assert "q=python" in stub_server.requests[0][0]
+
+@pytest.mark.asyncio
+async def test_web_scrape_reuses_connections(stub_server):
+    """Test that scraping strips scripts and styles and reuses pooled connections."""
+    stub_server.routes["/page"] = (200, {"Content-Type": "text/html; charset=utf-8"}, PAGE)
+    client = HttpClient()
+    tool = WebScrapeTool(client)
+    try:
+        for _ in range(5):
+            result = await tool.execute(url=f"{stub_server.base_url}/page")
+    finally:
+        await client.close()
+    
+    assert "Hello" in result and "Some useful text." in result
+    assert "var x" not in result and "color: red" not in result
+    assert len(stub_server.requests) == 5
+    assert len(stub_server.connections) == 1
+
+@pytest.mark.asyncio
+async def test_fetch_byte_budget_and_errors(stub_server):
+    """Test that bodies are cut off at the byte budget and HTTP errors are reported."""
+    stub_server.routes["/big"] = (200, {"Content-Type": "text/plain"}, b"x" * 1_000_000)
+    client = HttpClient(per_host_limit=2)
+    try:
+        response = await client.fetch(f"{stub_server.base_url}/big", max_bytes=10_000)
+        assert response.truncated
+        assert len(response.content) == 10_000
+        
+        responses = await asyncio.gather(*(
+            client.fetch(f"{stub_server.base_url}/big", max_bytes=2_000_000) for _ in range(4)
+        ))
+        assert all(not r.truncated and len(r.content) == 1_000_000 for r in responses)
+        
+        result = await WebScrapeTool(client).execute(url=f"{stub_server.base_url}/missing")
+        assert result.startswith("Error scraping webpage") and "404" in result
+    finally:
+        await client.close()
+
+@pytest.mark.asyncio
+async def test_result_cache_coalesces_and_expires(stub_server):
+    """Test that concurrent identical searches share one request and results expire."""
+    def slow_search(handler):
+        time.sleep(0.1)
+        return 200, {"Content-Type": "application/json"}, json.dumps({"Answer": "42"}).encode()
+    
+    stub_server.routes["/search"] = (200, {}, slow_search)
+    client = HttpClient()
+    cache = ToolResultCache(ttls={"web_search": 0.3})
+    tool = WebSearchTool(client, search_url=f"{stub_server.base_url}/search", cache=cache)
+    try:
+        results = await asyncio.gather(*(tool.execute(query=q) for q in ["meaning", "Meaning ", "meaning"] * 3))
+        assert all(r == "Direct answer: 42" for r in results)
+        assert len(stub_server.requests) == 1
+        
+        await tool.execute(query="meaning")
+        assert len(stub_server.requests) == 1
+        
+        await asyncio.sleep(0.35)
+        await tool.execute(query="meaning")
+        assert len(stub_server.requests) == 2
+    finally:
+        await client.close()
+    
+    stats = cache.stats()
+    assert stats["coalesced"] == 8 and stats["misses"] == 2 and stats["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_cache_ttl_configuration_and_leader_cancellation(stub_server):
+    """Test that a configured TTL applies to every tool and that a cancelled caller leaves the shared fetch running."""
+    assert ToolResultCache().ttl_for("web_search") == 600
+    assert ToolResultCache(default_ttl=0.2).ttl_for("web_search") == 0.2
+    assert ToolResultCache(ttls={"web_search": 5}, default_ttl=0.2).ttl_for("scrape_webpage") == 0.2
+    
+    def slow_search(handler):
+        time.sleep(0.1)
+        return 200, {"Content-Type": "application/json"}, json.dumps({"Answer": "42"}).encode()
+    
+    stub_server.routes["/search"] = (200, {}, slow_search)
+    client = HttpClient()
+    tool = WebSearchTool(client, search_url=f"{stub_server.base_url}/search",
+                         cache=ToolResultCache(default_ttl=0.2))
+    try:
+        leader = asyncio.create_task(tool.execute(query="meaning"))
+        await asyncio.sleep(0.02)
+        waiter = asyncio.create_task(tool.execute(query="meaning"))
+        await asyncio.sleep(0.02)
+        leader.cancel()
+        assert await waiter == "Direct answer: 42"
+        assert leader.cancelled() and len(stub_server.requests) == 1
+        
+        # The configured TTL, not the 600 s web_search default, governs expiry
+        await asyncio.sleep(0.25)
+        await tool.execute(query="meaning")
+        assert len(stub_server.requests) == 2
+    finally:
+        await client.close()
+
+@pytest.mark.asyncio
+async def test_scrape_cache_revalidation_and_persistence(stub_server):
+    """Test ETag revalidation, no-store handling and the SQLite tier."""
+    def etag_page(handler):
+        if handler.headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"', "Cache-Control": "max-age=0"}, b""
+        return 200, {"Content-Type": "text/html", "ETag": '"v1"', "Cache-Control": "max-age=0"}, PAGE
+    
+    stub_server.routes["/etag"] = (200, {}, etag_page)
+    stub_server.routes["/private"] = (200, {"Content-Type": "text/html", "Cache-Control": "no-store"}, PAGE)
+    with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as f:
+        db_path = f.name
+    
+    client = HttpClient()
+    try:
+        tool = WebScrapeTool(client, cache=ToolResultCache(db_path=db_path))
+        first = await tool.execute(url=f"{stub_server.base_url}/etag")
+        second = await tool.execute(url=f"{stub_server.base_url}/etag#section")
+        assert first == second and "Some useful text." in second
+        assert [r[1].get("If-None-Match") for r in stub_server.requests] == [None, '"v1"']
+        assert tool.cache.stats()["revalidated"] == 1
+        
+        await tool.execute(url=f"{stub_server.base_url}/private")
+        await tool.execute(url=f"{stub_server.base_url}/private")
+        assert len(stub_server.requests) == 4
+        tool.cache.close()
+        
+        # A new process reuses the stored validators from disk
+        tool = WebScrapeTool(client, cache=ToolResultCache(db_path=db_path))
+        assert await tool.execute(url=f"{stub_server.base_url}/etag") == first
+        assert stub_server.requests[-1][1].get("If-None-Match") == '"v1"'
+        tool.cache.close()
+    finally:
+        await client.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+def test_html_extractor_skips_subtrees_and_stops_early():
+    """Test that boilerplate subtrees are skipped and parsing stops at the text budget."""
+    html = ("<html><head><title>Doc</title><script>if (a < b) { x = '</div>'; }</script></head><body>"
+            "<nav><ul><li>Home</li><li>About</li></ul></nav><svg><text>icon</text></svg><svg/>"
+            "<h1>Title</h1><p>First <b>bold</b>word &amp; more</p><div>Next</div>")
+    assert extract_text(html + "</body></html>", 1000, backend="html.parser") == (
+        "Doc Title First boldword & more Next"
+    )
+    
+    extractor = HTMLTextExtractor(50, backend="html.parser")
+    chunks = [html] + ["<p>" + "filler text " * 100 + "</p>"] * 1000
+    fed = 0
+    for chunk in chunks:
+        extractor.feed(chunk)
+        fed += 1
+        if extractor.done:
+            break
+    assert extractor.done and fed == 2
+    assert 50 < len(extractor.text()) < 50 + 16 * 1024
+    
+    with pytest.raises(ValueError):
+        HTMLTextExtractor(10, backend="regex")
+
+@pytest.mark.asyncio
+async def test_web_scrape_large_page_is_bounded(stub_server):
+    """Test that scraping a multi-megabyte page returns only the requested text."""
+    body = b"<html><body><nav>Menu</nav>" + b"<p>word</p>" * 500_000 + b"</body></html>"
+    stub_server.routes["/huge"] = (200, {"Content-Type": "text/html; charset=utf-8"}, body)
+    client = HttpClient()
+    try:
+        result = await WebScrapeTool(client).execute(url=f"{stub_server.base_url}/huge", max_length=100)
+    finally:
+        await client.close()
+    
+    text = result.split("\n\n", 1)[1]
+    assert text == " ".join(["word"] * 30)[:100] + "..."
+    assert "Menu" not in result